@@ -3,97 +3,224 @@ import os
 import sys
 import threading
 import musicbrainzngs
-import requests
 from io import BytesIO
 from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from mutagen.flac import FLAC, Picture
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from mutagen.flac import FLAC
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun.flacmeta import leer_flac, tiene_portada_valida
+from comun.sesion import SesionTags
+from comun import musicbrainz
+from comun import coverart
+from comun.imagenes import picture_en_pool, variante_caa
+from comun.planificador import PRIORIDAD_ALTA, PRIORIDAD_BAJA, Cancelado
+from comun.escaneo import escaner
+from comun.recorrido import recorrer_carpetas
 
 def has_valid_cover(path):
     """
     Devuelve True si el FLAC en 'path' tiene al menos una imagen con mime image/…
+    (solo lee las cabeceras, sin cargar las imágenes)
     """
-    try:
-        audio = FLAC(path)
-        for pic in audio.pictures:
-            if pic.mime and pic.mime.startswith("image/"):
-                return True
-    except Exception:
-        pass
-    return False
+    return tiene_portada_valida(path)
 
 # Configuración MusicBrainz
 musicbrainzngs.set_useragent("CoverSelector", "1.0", "you@example.com")
 
 # Funciones de búsqueda y descarga
-def descargar_portada(release_id):
+def descargar_portada(release_id, prioridad=PRIORIDAD_ALTA, cancelado=None):
+    # La variante justa para el tamaño final: al incrustar se optimiza igualmente
     try:
-        url = f"https://coverartarchive.org/release/{release_id}/front"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            data = resp.content
-            img = Image.open(BytesIO(data))
-            if img.format != "JPEG":
-                buf = BytesIO()
-                img.convert("RGB").save(buf, format="JPEG")
-                return buf.getvalue()
-            return data
+        return coverart.descargar_portada(release_id, variante_caa(), prioridad=prioridad, cancelado=cancelado)
+    except Cancelado:
+        raise
     except Exception as e:
         print(f"DEBUG: fallo descargar_portada({release_id}): {e}")
     return None
 
-def buscar_por_tags(artist, album, limit=10):
-    try:
-        print(f"DEBUG: buscar_por_tags {artist} - {album}")
-        res = musicbrainzngs.search_releases(artist=artist, release=album, limit=limit)
-        for rel in res["release-list"]:
-            img = descargar_portada(rel["id"])
-            if img:
-                yield img
-    except Exception as e:
-        print(f"DEBUG: error buscar_por_tags: {e}")
+def buscar_por_tags(artist, album, limit=10, **kw):
+    print(f"DEBUG: buscar_por_tags {artist} - {album}")
+    res = musicbrainz.search_releases(artist=artist, release=album, limit=limit, **kw)
+    return [rel["id"] for rel in res["release-list"]]
 
-def buscar_por_nombre(nombre, limit=10):
-    try:
-        print(f"DEBUG: buscar_por_nombre {nombre}")
-        res = musicbrainzngs.search_releases(query=nombre, limit=limit)
-        for rel in res["release-list"]:
-            img = descargar_portada(rel["id"])
-            if img:
-                yield img
-    except Exception as e:
-        print(f"DEBUG: error buscar_por_nombre: {e}")
+def buscar_por_nombre(nombre, limit=10, **kw):
+    print(f"DEBUG: buscar_por_nombre {nombre}")
+    res = musicbrainz.search_releases(query=nombre, limit=limit, **kw)
+    return [rel["id"] for rel in res["release-list"]]
 
-def buscar_por_grupo(artist, limit=10):
-    try:
-        print(f"DEBUG: buscar_por_grupo {artist}")
-        res = musicbrainzngs.search_releases(artist=artist, limit=limit)
-        for rel in res["release-list"]:
-            img = descargar_portada(rel["id"])
-            if img:
-                yield img
-    except Exception as e:
-        print(f"DEBUG: error buscar_por_grupo: {e}")
+def buscar_por_grupo(artist, limit=10, **kw):
+    print(f"DEBUG: buscar_por_grupo {artist}")
+    res = musicbrainz.search_releases(artist=artist, limit=limit, **kw)
+    return [rel["id"] for rel in res["release-list"]]
+
+class _Trabajo:
+    """Candidatas de un archivo (o de una búsqueda libre) en curso."""
+    def __init__(self, path, busquedas, prioridad):
+        self.path = path
+        self.busquedas = busquedas  # [(fila, funcion, args)]
+        self.prioridad = prioridad
+        self.cancelado = threading.Event()
+        self.resultados = []  # [(fila, release_id, imgdata)] en orden de llegada
+        self.visible = False
+
+class BuscadorPortadas:
+    """
+    Motor de descarga de candidatas para la GUI. Cada búsqueda y cada descarga
+    es una tarea del pool, así que las portadas de un archivo se bajan en
+    paralelo y llegan en el orden en que terminan. Al cambiar de archivo se
+    cancela lo de los archivos que ya no interesan (lo que aún no ha salido a la
+    red no llega a salir) y se precargan, con prioridad baja, los siguientes.
+
+    Las precargas tienen su propio pool: sus hilos pasan mucho rato esperando
+    turno en la red y no deben dejar en cola el trabajo del archivo visible.
+    """
+    def __init__(self, al_llegar, max_workers=10, precarga=3):
+        self.al_llegar = al_llegar  # (path, fila, imgdata), llamado desde hilos del pool
+        self.precarga = precarga
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="portadas")
+        self.pool_precarga = ThreadPoolExecutor(max_workers=max(1, precarga), thread_name_prefix="precarga")
+        self.trabajos = {}
+        self.libre = None
+        self.lock = threading.Lock()
+
+    def _busquedas(self, path):
+        info = leer_flac(path)
+        artist = info.first("artist")
+        album = info.first("album")
+        base = os.path.splitext(os.path.basename(path))[0]
+        return [
+            ("tags", buscar_por_tags, (artist, album)),
+            ("nombre", buscar_por_nombre, (base,)),
+            ("grupo", buscar_por_grupo, (artist,)),
+        ]
+
+    def seleccionar(self, path, siguientes=()):
+        """Pasa a mostrar `path`: reenvía lo que ya hubiera llegado y precarga los siguientes."""
+        queridos = [path] + list(siguientes)[:self.precarga]
+        ya = []
+        with self.lock:
+            for p in list(self.trabajos):
+                if p not in queridos:
+                    self.trabajos.pop(p).cancelado.set()
+            if self.libre is not None:
+                self.libre.cancelado.set()
+                self.libre = None
+            for p in queridos:
+                visible = p == path
+                trabajo = self.trabajos.get(p)
+                if trabajo is not None and visible and trabajo.prioridad != PRIORIDAD_ALTA:
+                    # Una precarga que pasa a verse: lo suyo ya espera en la red con
+                    # prioridad baja y cambiar el atributo no lo reordena. Se cancela y
+                    # se vuelve a pedir con prioridad alta: lo terminado sale de la
+                    # caché, lo que sigue en cola sube de prioridad en el planificador
+                    # y lo ya recibido se conserva.
+                    trabajo.cancelado.set()
+                    nuevo = _Trabajo(p, None, PRIORIDAD_ALTA)
+                    nuevo.resultados = trabajo.resultados
+                    trabajo = self.trabajos[p] = nuevo
+                    self._enviar(trabajo, self._arrancar)
+                elif trabajo is None:
+                    trabajo = self.trabajos[p] = _Trabajo(p, None, PRIORIDAD_ALTA if visible else PRIORIDAD_BAJA)
+                    self._enviar(trabajo, self._arrancar)
+                trabajo.visible = visible
+                if visible:
+                    ya = [(fila, imgdata) for fila, _id, imgdata in trabajo.resultados]
+        for fila, imgdata in ya:
+            self.al_llegar(path, fila, imgdata)
+
+    def _enviar(self, trabajo, fn, *args):
+        pool = self.pool if trabajo.prioridad == PRIORIDAD_ALTA else self.pool_precarga
+        pool.submit(fn, trabajo, *args)
+
+    def buscar_libre(self, path, texto):
+        with self.lock:
+            if self.libre is not None:
+                self.libre.cancelado.set()
+            self.libre = _Trabajo(path, [("busqueda", buscar_por_nombre, (texto,))], PRIORIDAD_ALTA)
+            self.libre.visible = True
+            self._enviar(self.libre, self._arrancar)
+
+    def _arrancar(self, trabajo):
+        if trabajo.cancelado.is_set():
+            return
+        try:
+            busquedas = trabajo.busquedas or self._busquedas(trabajo.path)
+        except Exception as e:
+            print(f"DEBUG: no se puede leer {trabajo.path}: {e}")
+            return
+        for fila, fn, args in busquedas:
+            self._enviar(trabajo, self._buscar, fila, fn, args)
+
+    def _buscar(self, trabajo, fila, fn, args):
+        if trabajo.cancelado.is_set():
+            return
+        try:
+            ids = fn(*args, prioridad=trabajo.prioridad, cancelado=trabajo.cancelado)
+        except Cancelado:
+            return
+        except Exception as e:
+            print(f"DEBUG: error {fn.__name__}: {e}")
+            return
+        for release_id in ids:
+            self._enviar(trabajo, self._descargar, fila, release_id)
+
+    def _descargar(self, trabajo, fila, release_id):
+        if trabajo.cancelado.is_set():
+            return
+        with self.lock:
+            # Al promocionar una precarga, lo ya recibido no se vuelve a mostrar
+            if any(f == fila and r == release_id for f, r, _img in trabajo.resultados):
+                return
+        try:
+            imgdata = descargar_portada(release_id, trabajo.prioridad, trabajo.cancelado)
+        except Cancelado:
+            return
+        if not imgdata:
+            return
+        with self.lock:
+            if trabajo.cancelado.is_set():
+                return
+            trabajo.resultados.append((fila, release_id, imgdata))
+            visible = trabajo.visible
+        if visible:
+            self.al_llegar(trabajo.path, fila, imgdata)
+
+    def cerrar(self):
+        with self.lock:
+            for trabajo in list(self.trabajos.values()) + [self.libre]:
+                if trabajo is not None:
+                    trabajo.cancelado.set()
+        self.pool.shutdown(wait=False)
+        self.pool_precarga.shutdown(wait=False)
 
 # Embebido
 def tiene_portada(audio: FLAC):
     return bool(audio.pictures)
 
 def incrustar(imagen_bytes, flac_path):
-    audio = FLAC(flac_path)
-    pic = Picture()
-    pic.data = imagen_bytes
-    pic.type = 3
-    pic.mime = "image/jpeg"
-    img = Image.open(BytesIO(imagen_bytes))
-    pic.width, pic.height = img.size
-    pic.depth = 24
-    audio.clear_pictures()
-    audio.add_picture(pic)
-    audio.save()
+    sesion = SesionTags(flac_path)
+    # Reducida, JPEG baseline y con sus dimensiones reales
+    sesion.poner_portada(picture_en_pool(imagen_bytes), reemplazar=True)
+    sesion.commit()
+
+def archivos_sin_portada(target, debug=True):
+    """
+    Pre-scan: FLACs de la carpeta (con subcarpetas) sin portada válida, ordenados.
+    Recorrido en streaming y comprobación en paralelo, con hilos o procesos
+    según ECHOMINI_ESCANEO.
+    """
+    flacs = []
+    for _carpeta, lote in recorrer_carpetas(target):
+        for p, valid in zip(lote, escaner().map(tiene_portada_valida, lote)):
+            if debug:
+                print(f"DEBUG: {os.path.basename(p)} tiene portada válida? {valid}")
+            if not valid:
+                flacs.append(p)
+    flacs.sort()
+    return flacs
 
 class CoverSelector(tk.Tk):
     def __init__(self, target, max_workers=5):
@@ -108,15 +235,7 @@ class CoverSelector(tk.Tk):
             self.allow_replace = True
         else:
             print(f"DEBUG: escaneando carpeta {target} con {self.max_workers} hilos")
-            paths = [os.path.join(target, f) for f in os.listdir(target) if f.lower().endswith(".flac")]
-            self.flacs = []
-            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-                future_map = {ex.submit(self._check_cover, p): p for p in paths}
-                for fut in as_completed(future_map):
-                    p = future_map[fut]
-                    has = fut.result()
-                    if not has:
-                        self.flacs.append(p)
+            self.flacs = archivos_sin_portada(target)
             self.allow_replace = False
             print(f"DEBUG: encontrados {len(self.flacs)} archivos sin portada")
 
@@ -128,8 +247,9 @@ class CoverSelector(tk.Tk):
         frame_list = ttk.Frame(self)
         frame_list.grid(row=0, column=0, sticky="ns")
         self.listbox = tk.Listbox(frame_list, width=30)
+        base = os.path.dirname(self.flacs[0]) if self.allow_replace else target
         for f in self.flacs:
-            self.listbox.insert("end", os.path.basename(f))
+            self.listbox.insert("end", os.path.relpath(f, base))
         self.listbox.pack(fill="y", expand=True)
         self.listbox.bind("<<ListboxSelect>>", self.on_select)
 
@@ -158,18 +278,14 @@ class CoverSelector(tk.Tk):
 
         self.thumb_size = (100,100)
         self.canvases = []
+        self.current = None
+        self.buscador = BuscadorPortadas(self._on_cover, max_workers=self.max_workers)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         if self.flacs:
             self.listbox.selection_set(0)
             self.on_select()
 
-    def _check_cover(self, path):
-        valid = has_valid_cover(path)
-        print(f"DEBUG: {os.path.basename(path)} tiene portada válida? {valid}")
-        return valid
-
-
-
     def clear_frame(self, frame):
         for w in frame.winfo_children():
             w.destroy()
@@ -179,35 +295,40 @@ class CoverSelector(tk.Tk):
         sel = self.listbox.curselection()
         if not sel: return
         self.current = self.flacs[sel[0]]
-        audio = FLAC(self.current)
-        artist = audio.get("artist", [""])[0]
-        album  = audio.get("album", [""])[0]
-        title  = audio.get("title", [""])[0]
+        info = leer_flac(self.current)
+        artist = info.first("artist")
+        album  = info.first("album")
+        title  = info.first("title")
         self.lbl_info.config(text=f"{title} — {artist} ({album})")
         for f in [self.frame_tags, self.frame_name, self.frame_group, self.frame_search]:
             self.clear_frame(f)
-        threading.Thread(target=self.load_covers, daemon=True).start()
+        # Cancela lo del archivo anterior y precarga los siguientes de la lista
+        self.buscador.seleccionar(self.current, self.flacs[sel[0] + 1:])
 
-    def load_covers(self):
-        audio = FLAC(self.current)
-        artist = audio.get("artist", [""])[0]
-        album  = audio.get("album", [""])[0]
-        base   = os.path.splitext(os.path.basename(self.current))[0]
+    def _on_cover(self, path, fila, imgdata):
+        # Llamado desde los hilos del buscador: se pasa al hilo de Tk
+        self.after(0, self._add_cover, path, fila, imgdata)
 
-        # lanzamos 3 hilos de búsqueda
-        threading.Thread(target=self._fetch_and_add, args=(buscar_por_tags, (artist, album), self.frame_tags), daemon=True).start()
-        threading.Thread(target=self._fetch_and_add, args=(buscar_por_nombre, (base,), self.frame_name), daemon=True).start()
-        threading.Thread(target=self._fetch_and_add, args=(buscar_por_grupo, (artist,), self.frame_group), daemon=True).start()
-
-    def _fetch_and_add(self, func, args, frame):
-        for imgdata in func(*args):
-            self.after(0, self.add_thumbnail, frame, imgdata)
+    def _add_cover(self, path, fila, imgdata):
+        if path != self.current:
+            return
+        frame = {
+            "tags": self.frame_tags,
+            "nombre": self.frame_name,
+            "grupo": self.frame_group,
+            "busqueda": self.frame_search,
+        }[fila]
+        self.add_thumbnail(frame, imgdata)
 
     def on_search(self):
         txt = self.search_var.get().strip()
         if not txt: return
         self.clear_frame(self.frame_search)
-        threading.Thread(target=self._fetch_and_add, args=(buscar_por_nombre, (txt,), self.frame_search), daemon=True).start()
+        self.buscador.buscar_libre(self.current, txt)
+
+    def on_close(self):
+        self.buscador.cerrar()
+        self.destroy()
 
     def add_thumbnail(self, frame, imgdata):
         img = Image.open(BytesIO(imgdata))
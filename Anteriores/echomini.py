@@ -1,168 +1,363 @@
+import argparse
 import os
-import subprocess
-import requests
+import sys
+import threading
 import musicbrainzngs
-from mutagen.flac import FLAC, Picture
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, TCON, TRCK
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, OrderedDict
 
-musicbrainzngs.set_useragent("FLACAutoTagger", "1.0", "tucorreo@ejemplo.com")
-
-def extraer_id3_y_convertir(path):
-    try:
-        tags = ID3(path)
-        audio = FLAC(path)
-
-        # Mapeo de campos ID3 a Vorbis
-        if TIT2 in tags:
-            audio["title"] = tags[TIT2].text[0]
-        if TPE1 in tags:
-            audio["artist"] = tags[TPE1].text[0]
-        if TALB in tags:
-            audio["album"] = tags[TALB].text[0]
-        if TRCK in tags:
-            audio["tracknumber"] = tags[TRCK].text[0]
-        if TCON in tags:
-            audio["genre"] = tags[TCON].text[0]
-
-        audio.save()
-        print(f"🔁 ID3 → Vorbis transferido: {os.path.basename(path)}")
-        return True
-    except Exception:
-        return False
-
-def eliminar_id3(path):
-    try:
-        subprocess.run(["metaflac", "--remove", "--block-type=ID3", path], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print(f"🧼 ID3 eliminado: {os.path.basename(path)}")
-    except Exception as e:
-        print(f"⚠️ No se pudo eliminar ID3: {e}")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun.guardado import contadores
+from comun import musicbrainz
+from comun.coverart import descargar_portada
+from comun.imagenes import picture_en_pool
+from comun import diario, metricas, nombres
+from comun.diario import Diario
+from comun.escaneo import escaner
+from comun.recorrido import recorrer_carpetas
+from comun.tuberia import Etapa, tuberia
+from comun.flacmeta import leer_flac
+from comun.inferencia import IndiceBiblioteca, huella, leer_donante, portada_principal
+from comun.id3 import detectar_id3, leer_id3
+from comun.sesion import SesionTags
+from comun.musicbrainz import obtener_genero_por_artista, obtener_genero_por_recording
 
-def tiene_portada(audio):
-    return len(audio.pictures) > 0
+musicbrainzngs.set_useragent("FLACAutoTagger", "1.0", "tucorreo@ejemplo.com")
 
-def descargar_portada(release_id):
-    try:
-        url = f"https://coverartarchive.org/release/{release_id}/front-500"
-        resp = requests.get(url)
-        if resp.status_code == 200:
-            return resp.content
-    except Exception:
-        pass
-    return None
+HILOS_LECTURA = int(os.environ.get("ECHOMINI_HILOS_LECTURA", 4))
+HILOS_ESCRITURA = int(os.environ.get("ECHOMINI_HILOS_ESCRITURA", 4))
+# Grupos cuyo resultado de red se recuerda durante la ejecución (los más recientes)
+GRUPOS_RECORDADOS = int(os.environ.get("ECHOMINI_GRUPOS_RECORDADOS", 1024))
 
 def buscar_portada_por_tags(artist, album):
     try:
-        result = musicbrainzngs.search_releases(artist=artist, release=album, limit=2)
-        for release in result["release-list"]:
-            portada = descargar_portada(release["id"])
+        for release_id in musicbrainz.buscar_releases(artist, album, limit=2):
+            portada = descargar_portada(release_id)
             if portada:
                 return portada
-    except Exception:
-        pass
+    except Exception as e:
+        print(f"⚠️ MusicBrainz (release {artist} - {album}): {e}")
     return None
 
 def buscar_portada_por_nombre(nombre_archivo):
     try:
-        result = musicbrainzngs.search_releases(query=nombre_archivo, limit=2)
+        result = musicbrainz.search_releases(query=nombre_archivo, limit=2)
         for release in result["release-list"]:
             portada = descargar_portada(release["id"])
             if portada:
                 return portada
-    except Exception:
-        pass
+    except Exception as e:
+        print(f"⚠️ MusicBrainz (release {nombre_archivo}): {e}")
     return None
 
-def incrustar_portada(audio, image_data):
-    pic = Picture()
-    pic.data = image_data
-    pic.type = 3
-    pic.mime = "image/jpeg"
-    pic.desc = "Cover"
-    pic.width = 500
-    pic.height = 500
-    pic.depth = 24
-    audio.add_picture(pic)
-
-def obtener_genero_por_recording(artist, title):
+def incrustar_portada(audio, picture):
+    audio.add_picture(picture)
+
+def _norm(texto):
+    return " ".join(texto.casefold().split())
+
+def _leer_pista(path):
+    info = leer_flac(path)
+    tiene_id3 = os.path.getsize(path) > 0 and any(detectar_id3(path))
+    campos = {k: v[0] for k, v in info.tags.items()}
+    if tiene_id3:
+        campos.update(leer_id3(path))
+    portada = portada_principal(info)
+    return {
+        "path": path,
+        "artist": campos.get("artist"),
+        "albumartist": campos.get("albumartist"),
+        "title": campos.get("title"),
+        "album": campos.get("album"),
+        "genre": campos.get("genre"),
+        "portada": huella(portada) if portada else None,
+        "tiene_genero": "genre" in campos,
+        "tiene_portada": bool(info.pictures),
+        "tiene_id3": tiene_id3,
+    }
+
+def leer_pista(path):
+    """
+    Devuelve lo que necesita el plan, sin escribir nada ni cargar imágenes.
+    Si hay ID3, sus campos cuentan como si ya estuvieran en Vorbis.
+    """
     try:
-        result = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=5)
-        for recording in result["recording-list"]:
-            tags = recording.get("tag-list", [])
-            if tags:
-                sorted_tags = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
-                return sorted_tags[0]["name"].capitalize()
-    except Exception:
-        pass
-    return None
+        return _leer_pista(path)
+    except Exception as e:
+        print(f"❌ Error en {os.path.basename(path)}: {e}")
+        return None
 
-def obtener_genero_por_artista(artist):
+def leer_vecina(path):
+    """Como leer_pista() pero sin avisar: los errores ya saldrán en la pasada principal."""
     try:
-        result = musicbrainzngs.search_artists(artist=artist, limit=1)
-        if not result["artist-list"]:
-            return None
-        artist_id = result["artist-list"][0]["id"]
-        data = musicbrainzngs.get_artist_by_id(artist_id, includes=["tags"])
-        tags = data["artist"].get("tag-list", [])
-        if tags:
-            sorted_tags = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
-            return sorted_tags[0]["name"].capitalize()
+        return _leer_pista(path)
     except Exception:
-        pass
-    return None
+        return None
+
+def completar_con_nombres(pistas, raiz):
+    """Artista y título (y álbum, si sale de las carpetas) del nombre de archivo, para las pistas sin tags."""
+    sin_tags = [p for p in pistas if not (p["artist"] and p["title"])]
+    if not sin_tags:
+        return
+    deducidos = nombres.analizar_carpeta([p["path"] for p in sin_tags], raiz)
+    for pista in sin_tags:
+        datos = deducidos[pista["path"]]
+        if datos:
+            for campo in ("artist", "title", "album"):
+                pista[campo] = pista[campo] or datos[campo]
 
-def procesar_archivo(path):
+def indexar_biblioteca(ruta, recursivo=True, seguir_enlaces=False):
+    """
+    Pasada previa: solo cabeceras de todos los FLAC (también los que el diario
+    saltará, que son los que suelen tener género y portada para copiar).
+    """
+    local = IndiceBiblioteca()
+    for _carpeta, archivos in recorrer_carpetas(ruta, recursivo, seguir_enlaces):
+        for pista in escaner().map(leer_vecina, archivos):
+            if pista:
+                local.agregar(pista)
+    print(f"🧭 Biblioteca indexada: {local.resumen()}")
+    return local
+
+def clave_grupo(pista, raiz):
+    """
+    Las pistas se agrupan por (artista del álbum, álbum); las que no tienen
+    álbum, por carpeta si están en una subcarpeta (carpeta = disco), y si no,
+    cada una va sola.
+    """
+    artista = pista["albumartist"] or pista["artist"]
+    if artista and pista["album"]:
+        return ("album", _norm(artista), _norm(pista["album"]))
+    carpeta = os.path.dirname(os.path.abspath(pista["path"]))
+    if carpeta != os.path.abspath(raiz):
+        return ("carpeta", carpeta)
+    return ("pista", pista["path"])
+
+def planificar(pistas, raiz):
+    grupos = {}
+    for pista in pistas:
+        grupos.setdefault(clave_grupo(pista, raiz), []).append(pista)
+    return grupos
+
+def inferir_grupo(clave, pistas, local):
+    """Género y portada copiados de otras pistas de la biblioteca, si hay acuerdo suficiente."""
+    resultado = {"genre": None, "portada": None}
+    if local is None:
+        return resultado
+    primera = pistas[0]
+    if any(not p["tiene_genero"] for p in pistas):
+        genero, nivel = local.genero(primera)
+        if genero:
+            resultado["genre"] = genero
+            print(f"🧭 Género deducido ({nivel}): {genero}")
+    if any(not p["tiene_portada"] for p in pistas):
+        donante, nivel = local.portada(primera)
+        if donante:
+            try:
+                imagen = leer_donante(donante)
+                if imagen:
+                    resultado["portada"] = picture_en_pool(imagen)
+                    print(f"🧭 Portada copiada ({nivel}) de {os.path.basename(donante[0])}")
+            except Exception as e:
+                print(f"⚠️ No se pudo copiar la portada de {os.path.basename(donante[0])}: {e}")
+    return resultado
+
+def resolver_grupo(clave, pistas, resultado=None):
+    """Busca en red, una sola vez para todo el grupo, lo que no se haya deducido ya."""
+    resultado = resultado or {"genre": None, "portada": None}
+
+    # 2. Género: por la primera grabación del grupo y, si no, por su artista
+    if not resultado["genre"] and any(not p["tiene_genero"] for p in pistas):
+        con_tags = [p for p in pistas if p["artist"] and p["title"]]
+        if con_tags:
+            primera = con_tags[0]
+            resultado["genre"] = (
+                obtener_genero_por_recording(primera["artist"], primera["title"])
+                or obtener_genero_por_artista(primera["albumartist"] or primera["artist"])
+            )
+
+    # 3. Portada: por álbum (o nombre de carpeta) y si no, por nombre de archivo
+    if not resultado["portada"] and any(not p["tiene_portada"] for p in pistas):
+        portada = None
+        primera = pistas[0]
+        if clave[0] == "album":
+            portada = buscar_portada_por_tags(primera["albumartist"] or primera["artist"], primera["album"])
+        elif clave[0] == "carpeta":
+            portada = buscar_portada_por_nombre(os.path.basename(clave[1]))
+        if not portada:
+            base = os.path.splitext(os.path.basename(primera["path"]))[0]
+            portada = buscar_portada_por_nombre(base)
+        if portada:
+            # Se optimiza una vez por grupo (en el pool de procesos) y se reparte
+            resultado["portada"] = picture_en_pool(portada)
+
+    return resultado
+
+def faltan_datos(pistas, resultado):
+    """True si alguna pista del grupo necesita algo que no se ha deducido."""
+    falta_genero = not resultado["genre"] and any(not p["tiene_genero"] and p["artist"] and p["title"] for p in pistas)
+    falta_portada = not resultado["portada"] and any(not p["tiene_portada"] for p in pistas)
+    return falta_genero or falta_portada
+
+def aplicar_resultado(pista, resultado):
+    """Aplica el resultado del grupo a la pista. Devuelve el resultado para el diario."""
+    path = pista["path"]
+    if pista["tiene_genero"] and pista["tiene_portada"] and not pista["tiene_id3"]:
+        return diario.OK  # Ya normalizada: ni se abre para escribir
     try:
-        audio = FLAC(path)
-
-        # 1. Transferir ID3 → Vorbis si hay
-        if os.path.getsize(path) > 0 and "ID3" in subprocess.getoutput(f"metaflac --list \"{path}\""):
-            if extraer_id3_y_convertir(path):
-                eliminar_id3(path)
-                audio = FLAC(path)  # Recargar tras guardado
-
-        # 2. Añadir género si falta
-        if "genre" not in audio:
-            artist = audio.get("artist", [None])[0]
-            title = audio.get("title", [None])[0]
-            genre = None
-            if artist and title:
-                genre = obtener_genero_por_recording(artist, title)
-                if not genre:
-                    genre = obtener_genero_por_artista(artist)
-                if genre:
-                    audio["genre"] = genre
-                    print(f"🎼 Género añadido: {genre}")
-                else:
-                    print(f"🚫 Sin género: {os.path.basename(path)}")
-
-        # 3. Añadir portada si falta
-        if not tiene_portada(audio):
-            artist = audio.get("artist", [None])[0]
-            album = audio.get("album", [None])[0]
-            base = os.path.splitext(os.path.basename(path))[0]
-            portada = None
-            if artist and album:
-                portada = buscar_portada_por_tags(artist, album)
-            if not portada:
-                portada = buscar_portada_por_nombre(base)
-            if portada:
-                incrustar_portada(audio, portada)
+        # Todos los cambios del archivo se acumulan y se escriben una sola vez
+        sesion = SesionTags(path)
+
+        # 1. Transferir ID3 → Vorbis si hay (se elimina al guardar)
+        if sesion.convertir_id3():
+            print(f"🔁 ID3 → Vorbis transferido: {os.path.basename(path)}")
+
+        # El género puede venir de las pistas vecinas: no hace falta artista ni título
+        if "genre" not in sesion:
+            if resultado["genre"]:
+                sesion.set("genre", resultado["genre"])
+                print(f"🎼 Género añadido: {resultado['genre']}")
+            else:
+                print(f"🚫 Sin género: {os.path.basename(path)}")
+
+        if not sesion.tiene_portada:
+            if resultado["portada"]:
+                incrustar_portada(sesion.audio, resultado["portada"])
                 print(f"🖼️ Portada añadida: {os.path.basename(path)}")
             else:
                 print(f"🚫 Sin portada: {os.path.basename(path)}")
 
-        audio.save()
+        sesion.commit()
+
+        completa = "genre" in sesion and sesion.tiene_portada
+        return diario.OK if completa else diario.INCOMPLETO
 
     except Exception as e:
         print(f"❌ Error en {os.path.basename(path)}: {e}")
+        return diario.ERROR
+
+def procesar_carpeta(ruta, max_hilos=20, modo=diario.MODO_INCREMENTAL, recursivo=True, seguir_enlaces=False,
+                     inferir=True):
+    """
+    Recorre la biblioteca en streaming y pasa cada lote de archivos por cuatro
+    etapas con colas acotadas: lectura y plan por álbum/carpeta, deducción a
+    partir de la propia biblioteca, búsqueda en red de lo que falte (una vez
+    por grupo) y escritura. La memoria no depende del número de pistas, solo
+    del tamaño de las colas, de los recuentos por álbum de la pasada previa y
+    de los GRUPOS_RECORDADOS últimos resultados de red.
+    La pasada previa solo se hace si alguna pista pendiente no tiene género o
+    portada: en una biblioteca ya completa, o con casi todo saltado por el
+    diario, no se lee nada de más.
+    """
+    local = None
+    registro = Diario("echomini")
+    cuenta = Counter()
+    lock = threading.Lock()
+    lock_indice = threading.Lock()
+    # clave de grupo -> {"lock", "resultado"}: lo encontrado en red por
+    # cualquier trozo del grupo, acotado a GRUPOS_RECORDADOS grupos
+    resueltos = OrderedDict()
+
+    def biblioteca():
+        nonlocal local
+        # La primera pista que lo necesita construye el índice; las demás esperan
+        with lock_indice:
+            if local is None:
+                local = indexar_biblioteca(ruta, recursivo, seguir_enlaces)
+            return local
+
+    def leer_lote(lote):
+        _carpeta, archivos = lote
+        pendientes, saltados = registro.pendientes(archivos, modo)
+        pistas = []
+        # En paralelo con hilos o procesos según ECHOMINI_ESCANEO
+        for path, pista in zip(pendientes, escaner().map(leer_pista, pendientes)):
+            if pista:
+                pistas.append(pista)
+            else:
+                registro.apuntar(path, diario.ERROR)
+        completar_con_nombres(pistas, ruta)
+        grupos = planificar(pistas, ruta)
+        with lock:
+            cuenta["saltadas"] += saltados
+            cuenta["pistas"] += len(pistas)
+            cuenta["grupos"] += len(grupos)
+        return grupos.items()
+
+    def deducir_grupo(grupo):
+        clave, pistas = grupo
+        falta = any(not p["tiene_genero"] or not p["tiene_portada"] for p in pistas)
+        return [(clave, pistas, inferir_grupo(clave, pistas, biblioteca() if inferir and falta else None))]
+
+    def resuelto(clave):
+        """Entrada de la memoria de grupos para la clave, creándola si no está."""
+        with lock:
+            entrada = resueltos.get(clave)
+            if entrada is None:
+                entrada = resueltos[clave] = {"lock": threading.Lock(), "resultado": {}}
+                while len(resueltos) > GRUPOS_RECORDADOS:
+                    resueltos.popitem(last=False)
+            else:
+                resueltos.move_to_end(clave)
+            return entrada
+
+    def buscar_grupo(trabajo):
+        # Cada grupo se resuelve una vez y el resultado se reparte a sus pistas
+        clave, pistas, resultado = trabajo
+        if not faltan_datos(pistas, resultado):
+            return [(pista, resultado) for pista in pistas]
+        if clave[0] == "pista":
+            with lock:
+                cuenta["grupos_red"] += 1
+            resultado = resolver_grupo(clave, pistas, resultado)
+            return [(pista, resultado) for pista in pistas]
+        # Un álbum puede llegar en varios trozos (lotes de la misma carpeta o
+        # carpetas hermanas): se usa lo que ya encontró otro trozo y solo se
+        # busca lo que falte, con un trozo a la vez por grupo
+        entrada = resuelto(clave)
+        with entrada["lock"]:
+            previo = entrada["resultado"]
+            resultado = {campo: valor or previo.get(campo) for campo, valor in resultado.items()}
+            if faltan_datos(pistas, resultado):
+                with lock:
+                    cuenta["grupos_red"] += 1
+                resultado = resolver_grupo(clave, pistas, resultado)
+            entrada["resultado"] = resultado
+        return [(pista, resultado) for pista in pistas]
+
+    def escribir_pista(trabajo):
+        pista, resultado = trabajo
+        r = aplicar_resultado(pista, resultado)
+        # Se apunta en cuanto se termina cada pista: si se corta, se retoma aquí
+        registro.apuntar(pista["path"], r)
+        return [r]
+
+    etapas = [
+        Etapa("leer", leer_lote, HILOS_LECTURA),
+        Etapa("deducir", deducir_grupo, HILOS_LECTURA),
+        Etapa("red", buscar_grupo, max_hilos),
+        Etapa("escribir", escribir_pista, HILOS_ESCRITURA),
+    ]
+    for r in tuberia(recorrer_carpetas(ruta, recursivo, seguir_enlaces), etapas):
+        cuenta[r] += 1
 
-def procesar_carpeta(ruta, max_hilos=20):
-    archivos = [os.path.join(ruta, f) for f in os.listdir(ruta) if f.lower().endswith(".flac")]
-    with ThreadPoolExecutor(max_workers=max_hilos) as executor:
-        futures = [executor.submit(procesar_archivo, f) for f in archivos]
-        for _ in as_completed(futures):
-            pass
+    if cuenta["saltadas"]:
+        print(f"⏭️ {cuenta['saltadas']} pistas saltadas según el diario")
+    print(f"📀 {cuenta['pistas']} pistas en {cuenta['grupos']} grupos, {cuenta['grupos_red']} buscados en red")
+    c = contadores()
+    print(f"💾 Guardados en el sitio: {c['en_sitio']}, reescrituras completas: {c['reescrituras']}")
+    print(f"📒 Completas: {cuenta[diario.OK]}, incompletas: {cuenta[diario.INCOMPLETO]}, errores: {cuenta[diario.ERROR]}")
 
-# Ejecutar
-procesar_carpeta(".", max_hilos=20)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Añade género y portada a los FLAC de una carpeta")
+    parser.add_argument("ruta", nargs="?", default=".")
+    parser.add_argument("--hilos", type=int, default=20, help="grupos buscando en red a la vez")
+    parser.add_argument("--no-recursivo", action="store_true", help="no entrar en subcarpetas")
+    parser.add_argument("--seguir-enlaces", action="store_true", help="seguir enlaces simbólicos")
+    parser.add_argument("--sin-inferencia", action="store_true",
+                        help="no copiar género ni portada de otras pistas de la biblioteca antes de ir a la red")
+    diario.agregar_argumentos(parser)
+    metricas.agregar_argumentos(parser)
+    args = parser.parse_args()
+    with metricas.informe(args):
+        procesar_carpeta(args.ruta, args.hilos, diario.modo_de(args), not args.no_recursivo, args.seguir_enlaces,
+                         not args.sin_inferencia)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Construye (o amplía) el índice local de MusicBrainz a partir de volcados JSON,
+para que echomini y rezagados resuelvan géneros y releases sin ir a la red.
+
+Acepta los .tar.xz de https://data.metabrainz.org/pub/musicbrainz/data/json-dumps/
+(artist, recording, release) o archivos de una entidad JSON por línea, también
+comprimidos (.gz, .bz2, .xz), por ejemplo un subconjunto extraído con jq.
+
+Uso: python importar_mb.py artist.tar.xz release.tar.xz [--tipo artist] [--indice RUTA]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun import indice_mb
+
+
+def importar(rutas, ruta_indice=indice_mb.RUTA, tipo=None, vaciar=False):
+    if vaciar and os.path.exists(ruta_indice):
+        os.unlink(ruta_indice)
+    indice = indice_mb.IndiceMB(ruta_indice, escritura=True)
+    inicio = time.perf_counter()
+    siguiente = [0]
+
+    def progreso(cuenta):
+        total = sum(cuenta[t] for t in indice_mb.TIPOS)
+        if total >= siguiente[0]:
+            print(f"⏳ {total} entidades ({total / (time.perf_counter() - inicio):.0f}/s)")
+            siguiente[0] = total + 100_000
+
+    for ruta in rutas:
+        print(f"📥 Importando {ruta}")
+    cuenta = indice.importar(rutas, tipo, progreso)
+    for t in indice_mb.TIPOS:
+        if cuenta[t]:
+            print(f"✅ {t}: {cuenta[t]}")
+    if cuenta["erroneas"] or cuenta["desconocidas"]:
+        print(f"⚠️ Líneas erróneas: {cuenta['erroneas']}, de tipo desconocido: {cuenta['desconocidas']}")
+    totales = indice.totales()
+    indice.cerrar()
+    print(
+        f"📚 Índice {ruta_indice}: {totales['artistas']} nombres de artista, "
+        f"{totales['grabaciones']} grabaciones, {totales['releases']} releases "
+        f"({os.path.getsize(ruta_indice) / 1e6:.1f} MB, {time.perf_counter() - inicio:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un volcado JSON de MusicBrainz al índice local")
+    parser.add_argument("volcados", nargs="+", help="archivos .tar.xz del volcado o JSON por líneas")
+    parser.add_argument("--tipo", choices=indice_mb.TIPOS, help="entidad de los archivos (por defecto, según el nombre)")
+    parser.add_argument("--indice", default=indice_mb.RUTA, help="ruta del índice (ECHOMINI_MB_INDICE)")
+    parser.add_argument("--vaciar", action="store_true", help="borrar el índice antes de importar")
+    args = parser.parse_args()
+    importar(args.volcados, args.indice, args.tipo, args.vaciar)
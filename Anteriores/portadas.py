@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Re-optimiza las portadas ya incrustadas en una biblioteca: las reduce al lado
+máximo, las pasa a JPEG baseline y corrige las dimensiones del bloque PICTURE
+(muchas se incrustaron con 500x500 fijo). Las que ya están bien no se tocan.
+
+La lectura y la escritura van en hilos y la recodificación en el pool de
+procesos de comun.imagenes, para usar todos los núcleos.
+
+Uso: python portadas.py [carpeta] [--max-lado PX] [--calidad Q] [--retry-failed | --full]
+"""
+import argparse
+import os
+import sys
+import threading
+from collections import Counter
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun import diario, metricas
+from comun.diario import Diario
+from comun.flacmeta import leer_flac, leer_portada
+from comun.guardado import contadores
+from comun.imagenes import CALIDAD, MAX_LADO, PROCESOS, necesita_optimizar, picture_en_pool
+from comun.recorrido import recorrer_carpetas
+from comun.sesion import SesionTags
+from comun.tuberia import Etapa, tuberia
+
+
+def revisar(path, max_lado):
+    """Devuelve (posición, portada, bytes) si la portada necesita optimizarse, o None."""
+    info = leer_flac(path)
+    for i, portada in enumerate(info.pictures):
+        if portada.type != 3 and len(info.pictures) > 1:
+            continue
+        data = leer_portada(path, portada)
+        img = Image.open(BytesIO(data))  # solo lee la cabecera
+        if (
+            necesita_optimizar(img, max_lado)
+            or portada.mime != "image/jpeg"
+            or (portada.width, portada.height) != img.size
+        ):
+            return i, portada, data
+        return None
+    return None
+
+
+def reemplazar(path, posicion, portada, pic):
+    """Cambia la portada en su misma posición, sin tocar el resto de imágenes."""
+    sesion = SesionTags(path)
+    pic.type = portada.type
+    pic.desc = portada.desc
+    imagenes = list(sesion.audio.pictures)
+    imagenes[posicion] = pic
+    sesion.audio.clear_pictures()
+    for imagen in imagenes:
+        sesion.audio.add_picture(imagen)
+    return sesion.commit()
+
+
+def optimizar_carpeta(ruta, max_lado=MAX_LADO, calidad=CALIDAD, max_hilos=4, modo=diario.MODO_INCREMENTAL,
+                      recursivo=True, seguir_enlaces=False):
+    registro = Diario("portadas")
+    cuenta = Counter()
+    lock = threading.Lock()
+
+    def filtrar(lote):
+        _carpeta, archivos = lote
+        pendientes, saltados = registro.pendientes(archivos, modo)
+        with lock:
+            cuenta["saltados"] += saltados
+        return pendientes
+
+    def leer(path):
+        try:
+            trabajo = revisar(path, max_lado)
+        except Exception as e:
+            print(f"❌ Error en {os.path.basename(path)}: {e}")
+            registro.apuntar(path, diario.ERROR)
+            return [diario.ERROR]
+        if trabajo is None:
+            registro.apuntar(path, diario.OK)
+            return [diario.OK]
+        return [(path, trabajo)]
+
+    def optimizar(elemento):
+        if not isinstance(elemento, tuple):
+            return [elemento]
+        path, (posicion, portada, data) = elemento
+        try:
+            pic = picture_en_pool(data, max_lado, calidad)
+        except Exception as e:
+            print(f"❌ No se puede optimizar la portada de {os.path.basename(path)}: {e}")
+            registro.apuntar(path, diario.ERROR)
+            return [diario.ERROR]
+        return [(path, posicion, portada, pic, len(data))]
+
+    def escribir(elemento):
+        if not isinstance(elemento, tuple):
+            return [elemento]
+        path, posicion, portada, pic, antes = elemento
+        try:
+            reemplazar(path, posicion, portada, pic)
+        except Exception as e:
+            print(f"❌ Error guardando {os.path.basename(path)}: {e}")
+            registro.apuntar(path, diario.ERROR)
+            return [diario.ERROR]
+        print(f"🖼️ {os.path.basename(path)}: {antes // 1024} KiB → {len(pic.data) // 1024} KiB ({pic.width}x{pic.height})")
+        registro.apuntar(path, diario.OK)
+        with lock:
+            cuenta["optimizadas"] += 1
+            cuenta["ahorro"] += antes - len(pic.data)
+        return [diario.OK]
+
+    etapas = [
+        Etapa("diario", filtrar, 1),
+        Etapa("leer", leer, max_hilos),
+        Etapa("optimizar", optimizar, PROCESOS),
+        Etapa("escribir", escribir, max_hilos),
+    ]
+    for r in tuberia(recorrer_carpetas(ruta, recursivo, seguir_enlaces), etapas):
+        cuenta[r] += 1
+
+    if cuenta["saltados"]:
+        print(f"⏭️ {cuenta['saltados']} archivos saltados según el diario")
+    c = contadores()
+    print(f"💾 Guardados en el sitio: {c['en_sitio']}, reescrituras completas: {c['reescrituras']}")
+    print(
+        f"✅ {cuenta['optimizadas']} portadas optimizadas, {cuenta['ahorro'] // 1024} KiB menos, "
+        f"{cuenta[diario.ERROR]} errores"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-optimiza las portadas incrustadas para el Echo Mini")
+    parser.add_argument("ruta", nargs="?", default=".")
+    parser.add_argument("--max-lado", type=int, default=MAX_LADO, help="lado máximo en píxeles")
+    parser.add_argument("--calidad", type=int, default=CALIDAD, help="calidad JPEG (1-95)")
+    parser.add_argument("--hilos", type=int, default=4, help="hilos de lectura y escritura")
+    parser.add_argument("--no-recursivo", action="store_true", help="no entrar en subcarpetas")
+    parser.add_argument("--seguir-enlaces", action="store_true", help="seguir enlaces simbólicos")
+    diario.agregar_argumentos(parser)
+    metricas.agregar_argumentos(parser)
+    args = parser.parse_args()
+    with metricas.informe(args):
+        optimizar_carpeta(args.ruta, args.max_lado, args.calidad, args.hilos, diario.modo_de(args),
+                          not args.no_recursivo, args.seguir_enlaces)
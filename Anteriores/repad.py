@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Deja margen de PADDING en todos los FLAC de una carpeta, de una pasada, para que
+las siguientes ediciones de tags y portadas se puedan guardar en el sitio sin
+reescribir el archivo entero.
+
+Uso: python repad.py [carpeta] [--padding BYTES] [--hilos N]
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun.guardado import PADDING_MINIMO, contadores, repad
+
+
+def repad_archivo(path, padding):
+    try:
+        if repad(path, padding):
+            print(f"📦 Padding ampliado: {os.path.basename(path)}")
+            return True
+    except Exception as e:
+        print(f"❌ Error en {os.path.basename(path)}: {e}")
+    return False
+
+
+def repad_carpeta(ruta, padding, max_hilos=4):
+    archivos = [os.path.join(ruta, f) for f in os.listdir(ruta) if f.lower().endswith(".flac")]
+    with ThreadPoolExecutor(max_workers=max_hilos) as executor:
+        futures = [executor.submit(repad_archivo, f, padding) for f in archivos]
+        cambiados = sum(1 for fut in as_completed(futures) if fut.result())
+    print(f"✅ {cambiados} de {len(archivos)} archivos ampliados ({contadores()['reescrituras']} reescrituras)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Añade padding a los FLAC de una carpeta")
+    parser.add_argument("ruta", nargs="?", default=".")
+    parser.add_argument("--padding", type=int, default=PADDING_MINIMO, help="bytes mínimos de padding")
+    parser.add_argument("--hilos", type=int, default=4)
+    args = parser.parse_args()
+    repad_carpeta(args.ruta, args.padding, args.hilos)
@@ -1,159 +1,216 @@
+import argparse
 import os
-import requests
+import sys
+import threading
 import musicbrainzngs
-from mutagen.flac import FLAC, Picture
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun.guardado import contadores
+from comun.flacmeta import leer_flac
+from comun.sesion import SesionTags
+from comun.coverart import descargar_portada
+from comun.imagenes import picture_en_pool
+from comun import diario, metricas, nombres
+from comun.diario import Diario
+from comun.escaneo import escaner
+from comun.recorrido import recorrer_carpetas
+from comun.tuberia import Etapa, tuberia
+from comun.musicbrainz import buscar_info_por_recording, obtener_genero_por_artista, obtener_genero_por_recording
 
 musicbrainzngs.set_useragent("FLACMetadataCompleter", "1.0", "tucorreo@ejemplo.com")
 
-def extraer_grupo_y_titulo(nombre_archivo):
-    base = os.path.splitext(nombre_archivo)[0]
-    if " - " in base:
-        partes = base.split(" - ", 1)
-        return partes[0].strip(), partes[1].strip()
-    return None, None
-
-def tiene_portada(audio):
-    return len(audio.pictures) > 0
+HILOS_LECTURA = int(os.environ.get("ECHOMINI_HILOS_LECTURA", 4))
+HILOS_ESCRITURA = int(os.environ.get("ECHOMINI_HILOS_ESCRITURA", 4))
 
-def descargar_portada(release_id):
-    try:
-        url = f"https://coverartarchive.org/release/{release_id}/front-500"
-        resp = requests.get(url)
-        if resp.status_code == 200:
-            return resp.content
-    except Exception:
-        pass
-    return None
-
-def buscar_info_por_recording(artist, title):
-    try:
-        result = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=5)
-        for rec in result["recording-list"]:
-            release_list = rec.get("release-list", [])
-            if release_list:
-                release = release_list[0]
-                release_id = release.get("id")
-                return {
-                    "artist": rec.get("artist-credit", [{}])[0].get("name"),
-                    "title": rec.get("title"),
-                    "album": release.get("title"),
-                    "release_id": release_id
-                }
-    except Exception:
-        pass
-    return None
-
-def obtener_genero_por_recording(artist, title):
-    try:
-        result = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=5)
-        for recording in result["recording-list"]:
-            tags = recording.get("tag-list", [])
-            if tags:
-                sorted_tags = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
-                return sorted_tags[0]["name"].capitalize()
-    except Exception:
-        pass
-    return None
-
-def obtener_genero_por_artista(artist):
-    try:
-        result = musicbrainzngs.search_artists(artist=artist, limit=1)
-        if not result["artist-list"]:
-            return None
-        artist_id = result["artist-list"][0]["id"]
-        data = musicbrainzngs.get_artist_by_id(artist_id, includes=["tags"])
-        tags = data["artist"].get("tag-list", [])
-        if tags:
-            sorted_tags = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
-            return sorted_tags[0]["name"].capitalize()
-    except Exception:
-        pass
-    return None
+def extraer_grupo_y_titulo(path):
+    # Números de pista, separadores y ruido de descargas: ver comun.nombres
+    datos = nombres.extraer(path)
+    if datos:
+        return datos["artist"], datos["title"]
+    return None, None
 
-def procesar_archivo(path):
+def leer_archivo(path):
+    """
+    Solo lectura de cabeceras: la mayoría de archivos no necesitan nada.
+    Devuelve el resultado para el diario si ya está resuelto, o un dict con lo
+    que hace falta buscar.
+    """
     try:
-        audio = FLAC(path)
+        info_flac = leer_flac(path)
         nombre_archivo = os.path.basename(path)
 
-        artist = audio.get("artist", [None])[0]
-        title = audio.get("title", [None])[0]
+        artist = info_flac.first("artist", None)
+        title = info_flac.first("title", None)
 
         # Si no hay tags, los intentamos extraer del nombre del archivo
         if not artist or not title:
-            artist, title = extraer_grupo_y_titulo(nombre_archivo)
+            artist, title = extraer_grupo_y_titulo(path)
 
         if not artist or not title:
             print(f"❌ No se puede procesar (falta artista o título): {nombre_archivo}")
-            return
+            return diario.INCOMPLETO
         
         # Si tiene album nos retiramos de buscarlo
-        if album := audio.get("album", [None])[0]:
-            return
-
-        print(f"\n🎵 Completando: {artist} - {title}")
-
-        # Buscar datos desde MusicBrainz
-        info = buscar_info_por_recording(artist, title)
-        if not info:
-            print("🚫 No se encontró info para esta canción.")
-            return
+        if album := info_flac.first("album", None):
+            return diario.OK
+
+        return {
+            "path": path,
+            "artist": artist,
+            "title": title,
+            "tiene_genero": "genre" in info_flac,
+            "tiene_portada": bool(info_flac.pictures),
+        }
+    except Exception as e:
+        print(f"❌ Error procesando {path}: {e}")
+        return diario.ERROR
+
+def buscar_datos(pendiente):
+    """Consultas de red. Devuelve None si MusicBrainz no conoce la canción."""
+    artist, title = pendiente["artist"], pendiente["title"]
+    print(f"\n🎵 Completando: {artist} - {title}")
+
+    # Buscar datos desde MusicBrainz
+    info = buscar_info_por_recording(artist, title)
+    if not info:
+        print("🚫 No se encontró info para esta canción.")
+        return None
+
+    datos = {"info": info, "genre": None, "portada": None}
+    if not pendiente["tiene_genero"]:
+        datos["genre"] = obtener_genero_por_recording(artist, title) or obtener_genero_por_artista(artist)
+    if not pendiente["tiene_portada"] and info.get("release_id"):
+        portada = descargar_portada(info["release_id"])
+        if portada:
+            datos["portada"] = picture_en_pool(portada)
+    return datos
+
+def escribir_datos(path, datos):
+    """Escribe lo encontrado en los campos vacíos. Devuelve el resultado para el diario."""
+    try:
+        nombre_archivo = os.path.basename(path)
+        info = datos["info"]
 
-        modified = False
+        # Los cambios se acumulan y se escriben una sola vez, solo si hay alguno
+        sesion = SesionTags(path)
+        audio = sesion.audio
 
         # Añadir campos si están vacíos
         if "artist" not in audio and info.get("artist"):
             audio["artist"] = info["artist"]
-            modified = True
             print(f"🧩 Añadido artista: {info['artist']}")
 
         if "title" not in audio and info.get("title"):
             audio["title"] = info["title"]
-            modified = True
             print(f"🧩 Añadido título: {info['title']}")
 
         if "album" not in audio and info.get("album"):
             audio["album"] = info["album"]
-            modified = True
             print(f"🧩 Añadido álbum: {info['album']}")
 
-        if "genre" not in audio:
-            genre = obtener_genero_por_recording(artist, title) or obtener_genero_por_artista(artist)
-            if genre:
-                audio["genre"] = genre
-                modified = True
-                print(f"🎼 Añadido género: {genre}")
-
-        if not tiene_portada(audio) and info.get("release_id"):
-            portada = descargar_portada(info["release_id"])
-            if portada:
-                pic = Picture()
-                pic.data = portada
-                pic.type = 3
-                pic.mime = "image/jpeg"
-                pic.desc = "Cover"
-                pic.width = 500
-                pic.height = 500
-                pic.depth = 24
-                audio.add_picture(pic)
-                modified = True
-                print("🖼️ Portada añadida.")
-
-        if modified:
-            audio.save()
+        if "genre" not in audio and datos["genre"]:
+            audio["genre"] = datos["genre"]
+            print(f"🎼 Añadido género: {datos['genre']}")
+
+        if not sesion.tiene_portada and datos["portada"]:
+            audio.add_picture(datos["portada"])
+            print("🖼️ Portada añadida.")
+
+        if sesion.commit():
             print(f"✅ Guardado: {nombre_archivo}")
         else:
             print(f"✅ Sin cambios necesarios: {nombre_archivo}")
+        return diario.OK if "album" in audio else diario.INCOMPLETO
 
     except Exception as e:
         print(f"❌ Error procesando {path}: {e}")
+        return diario.ERROR
 
-def procesar_carpeta(ruta, max_hilos=15):
-    archivos = [os.path.join(ruta, f) for f in os.listdir(ruta) if f.lower().endswith(".flac")]
-    with ThreadPoolExecutor(max_workers=max_hilos) as executor:
-        futures = [executor.submit(procesar_archivo, f) for f in archivos]
-        for _ in as_completed(futures):
-            pass
+def procesar_archivo(path):
+    """Las tres fases seguidas para un solo archivo. Devuelve el resultado para el diario."""
+    pendiente = leer_archivo(path)
+    if not isinstance(pendiente, dict):
+        return pendiente
+    try:
+        datos = buscar_datos(pendiente)
+    except Exception as e:
+        print(f"❌ Error procesando {path}: {e}")
+        return diario.ERROR
+    if not datos:
+        return diario.INCOMPLETO
+    return escribir_datos(path, datos)
+
+def procesar_carpeta(ruta, max_hilos=15, modo=diario.MODO_INCREMENTAL, recursivo=True, seguir_enlaces=False):
+    """
+    Recorre la biblioteca en streaming por tres etapas con colas acotadas:
+    lectura de cabeceras, búsqueda en red y escritura, cada una con sus hilos.
+    """
+    registro = Diario("rezagados")
+    cuenta = Counter()
+    lock = threading.Lock()
+
+    def leer(pendientes):
+        # El lote entero en paralelo, con hilos o procesos según ECHOMINI_ESCANEO
+        for path, pendiente in zip(pendientes, escaner().map(leer_archivo, pendientes)):
+            if not isinstance(pendiente, dict):
+                registro.apuntar(path, pendiente)
+            yield pendiente
+
+    def buscar(pendiente):
+        if not isinstance(pendiente, dict):
+            return [pendiente]  # Ya resuelto: pasa directo al final
+        try:
+            datos = buscar_datos(pendiente)
+        except Exception as e:
+            print(f"❌ Error procesando {pendiente['path']}: {e}")
+            registro.apuntar(pendiente["path"], diario.ERROR)
+            return [diario.ERROR]
+        if not datos:
+            registro.apuntar(pendiente["path"], diario.INCOMPLETO)
+            return [diario.INCOMPLETO]
+        return [(pendiente["path"], datos)]
+
+    def escribir(trabajo):
+        if not isinstance(trabajo, tuple):
+            return [trabajo]
+        path, datos = trabajo
+        r = escribir_datos(path, datos)
+        # Se apunta en cuanto termina cada archivo: si se corta, se retoma aquí
+        registro.apuntar(path, r)
+        return [r]
+
+    def filtrar(lote):
+        _carpeta, archivos = lote
+        pendientes, saltados = registro.pendientes(archivos, modo)
+        with lock:
+            cuenta["saltados"] += saltados
+        return [pendientes]
+
+    etapas = [
+        Etapa("diario", filtrar, 1),
+        Etapa("leer", leer, HILOS_LECTURA),
+        Etapa("red", buscar, max_hilos),
+        Etapa("escribir", escribir, HILOS_ESCRITURA),
+    ]
+    for r in tuberia(recorrer_carpetas(ruta, recursivo, seguir_enlaces), etapas):
+        cuenta[r] += 1
+
+    if cuenta["saltados"]:
+        print(f"⏭️ {cuenta['saltados']} archivos saltados según el diario")
+    c = contadores()
+    print(f"💾 Guardados en el sitio: {c['en_sitio']}, reescrituras completas: {c['reescrituras']}")
+    print(f"📒 Completos: {cuenta[diario.OK]}, incompletos: {cuenta[diario.INCOMPLETO]}, errores: {cuenta[diario.ERROR]}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Completa artista, título, álbum, género y portada desde MusicBrainz")
+    parser.add_argument("ruta", nargs="?", default=".")
+    parser.add_argument("--hilos", type=int, default=15, help="archivos buscando en red a la vez")
+    parser.add_argument("--no-recursivo", action="store_true", help="no entrar en subcarpetas")
+    parser.add_argument("--seguir-enlaces", action="store_true", help="seguir enlaces simbólicos")
+    diario.agregar_argumentos(parser)
+    metricas.agregar_argumentos(parser)
+    args = parser.parse_args()
+    with metricas.informe(args):
+        procesar_carpeta(args.ruta, args.hilos, diario.modo_de(args), not args.no_recursivo, args.seguir_enlaces)
 
-# Ejecutar
-procesar_carpeta(".", max_hilos=15)
@@ -0,0 +1,67 @@
+import anyio
+from starlette.responses import Response
+
+
+def read_at(f, offset, size):
+    """Lee size bytes de f a partir de offset."""
+    f.seek(offset)
+    return f.read(size)
+
+
+class FileSliceResponse(Response):
+    """
+    Respuesta con un trozo [offset, offset + length) de un archivo, sin cargarlo
+    en memoria: se usa para servir la portada directamente desde el FLAC.
+
+    Si el servidor ASGI soporta la extensión zero-copy
+    ("http.response.zerocopysend") se le pasa el descriptor y hace sendfile; si
+    no, se envía en bloques leídos con seek + read (os.pread no existe en
+    Windows), así que la memoria por petición queda acotada por CHUNK_SIZE y no
+    por el tamaño de la imagen.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, path, offset, length, media_type=None, headers=None, status_code=200):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+        except FileNotFoundError:
+            await Response(status_code=404)(scope, receive, send)
+            return
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": self.offset,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+            else:
+                sent = 0
+                while sent < self.length:
+                    size = min(self.CHUNK_SIZE, self.length - sent)
+                    chunk = await anyio.to_thread.run_sync(read_at, f, self.offset + sent, size)
+                    if not chunk:
+                        break
+                    sent += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": sent < self.length})
+                if sent < self.length:
+                    # El archivo ha encogido mientras se enviaba: cerrar el cuerpo igualmente
+                    await send({"type": "http.response.body", "body": b""})
+        finally:
+            f.close()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,386 @@
+import os
+import sqlite3
+import threading
+import time
+
+from comun import metricas
+from comun.flacmeta import ErrorFlac, leer_flac
+
+
+# Columnas de metadatos que se guardan por pista (mismo orden que devuelve la API)
+METADATA_COLUMNS = (
+    "title",
+    "artist",
+    "album",
+    "tracknumber",
+    "genre",
+    "date",
+    "length",
+    "bitrate",
+    "sample_rate",
+    "channels",
+    "size",
+    "discnumber",
+    "totaldiscs",
+    "year",
+    "lyrics",
+)
+
+# Claves de ordenación aceptadas por la API -> expresión SQL
+SORT_KEYS = {
+    "default": "filename COLLATE NOCASE",
+    "filename": "filename COLLATE NOCASE",
+    "title": "title COLLATE NOCASE",
+    "artist": "artist COLLATE NOCASE",
+    "album": "album COLLATE NOCASE",
+    "genre": "genre COLLATE NOCASE",
+    "date": "date COLLATE NOCASE",
+    "year": "year COLLATE NOCASE",
+    "tracknumber": "CAST(tracknumber AS INTEGER)",
+    "discnumber": "CAST(discnumber AS INTEGER)",
+    "length": "length",
+    "size": "size",
+}
+
+# Campos sobre los que se hace la búsqueda de texto
+SEARCH_COLUMNS = ("filename", "title", "artist", "album")
+
+# Entradas del registro de cambios que se conservan; un cliente que se quede
+# más atrás recibe "reset" y tiene que volver a pedir el listado
+CHANGES_KEEP = int(os.environ.get("ECHOMINI_CHANGES_KEEP", 10000))
+
+ADDED, MODIFIED, REMOVED = "added", "modified", "removed"
+
+_refreshes = metricas.histograma("echomini_index_refresh_seconds", "Duración de los refrescos del índice")
+_files_read = metricas.contador("echomini_index_files_read_total", "Archivos (re)leídos al refrescar el índice")
+_tracks = metricas.medidor("echomini_index_tracks", "Pistas en el índice")
+
+
+def read_metadata(path, filename):
+    """
+    Registro compacto de una pista (solo datos simples, se puede mandar entre
+    procesos). Solo se leen STREAMINFO y los tags: las imágenes se saltan.
+    """
+    try:
+        info = leer_flac(path)
+    except (OSError, ErrorFlac):
+        return {"filename": filename}
+    return {
+        "filename": filename,
+        "title": info.first("title"),
+        "artist": info.first("artist"),
+        "album": info.first("album"),
+        "tracknumber": info.first("tracknumber"),
+        "genre": info.first("genre"),
+        "date": info.first("date"),
+        "length": info.length,
+        "bitrate": info.bitrate,
+        "sample_rate": info.sample_rate,
+        "channels": info.channels,
+        "size": info.file_size,
+        "discnumber": info.first("discnumber"),
+        "totaldiscs": info.first("totaldiscs"),
+        "year": info.first("year"),
+        "lyrics": info.first("lyrics") if "lyrics" in info else None,
+    }
+
+
+class LibraryIndex:
+    """
+    Índice persistente (SQLite) de los FLAC de una carpeta.
+
+    Cada fila se identifica por nombre de archivo y guarda el mtime y el tamaño
+    con los que se leyó; al refrescar solo se vuelven a leer los archivos cuyo
+    mtime o tamaño han cambiado, y se borran los que ya no existen.
+
+    Cada alta, modificación o baja se apunta en un registro de cambios con un
+    número de secuencia creciente, para que los clientes pidan solo lo nuevo.
+    """
+
+    def __init__(self, db_path, flac_dir, reader, executor=None):
+        self.flac_dir = flac_dir
+        # reader(path, filename) -> dict de metadatos (o solo {"filename"} si falla)
+        self.reader = reader
+        # Si se da un executor, los archivos cambiados se leen en paralelo
+        self.executor = executor
+        self.last_refresh = 0.0
+        self._generation = 0
+        self._listeners = []
+        self._lock = threading.RLock()
+        # Un solo refresco a la vez; los que llegan mientras tanto lo esperan
+        self._refresh_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{c}" for c in METADATA_COLUMNS)
+        self._db.execute(
+            f"""CREATE TABLE IF NOT EXISTS tracks (
+                filename TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                ok INTEGER NOT NULL,
+                {columns}
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                ts REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def add_listener(self, fn):
+        """fn(seq) se llama (desde el hilo que escribe) cada vez que hay cambios nuevos."""
+        self._listeners.append(fn)
+
+    def _log_changes(self, changes):
+        """Apunta [(filename, kind)] en el registro. Llamar con el lock y antes del commit."""
+        now = time.time()
+        self._db.executemany(
+            "INSERT INTO changes (filename, kind, ts) VALUES (?, ?, ?)",
+            [(f, kind, now) for f, kind in changes],
+        )
+        seq = self.last_seq()
+        self._db.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGES_KEEP,))
+        return seq
+
+    def _notify(self, seq):
+        for fn in self._listeners:
+            try:
+                fn(seq)
+            except Exception as e:
+                print(f"⚠️ Error avisando de cambios: {e}")
+
+    def last_seq(self):
+        with self._lock:
+            row = self._db.execute("SELECT MAX(seq) FROM changes").fetchone()
+            if row[0] is not None:
+                return row[0]
+            # Registro vacío: seguir desde el último número usado (no reiniciar)
+            row = self._db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+            return row[0] if row else 0
+
+    def changes_since(self, since, limit=1000, fields=None):
+        """
+        Cambios con seq > since, uno por archivo (el último). Devuelve un dict
+        {"seq", "reset", "more", "changes"}: seq es hasta dónde se ha leído
+        (para la siguiente llamada), more que quedan más por leer y reset que
+        since es demasiado antiguo (o de otro índice) y el cliente debe volver a
+        pedir el listado completo.
+        """
+        if fields is not None:
+            unknown = [f for f in fields if f != "filename" and f not in METADATA_COLUMNS]
+            if unknown:
+                raise ValueError(f"Campos no válidos: {', '.join(unknown)}")
+            fields = tuple(f for f in METADATA_COLUMNS if f in fields)
+        else:
+            fields = METADATA_COLUMNS
+        with self._lock:
+            last = self.last_seq()
+            oldest = self._db.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if since > last or (oldest is not None and since < oldest - 1):
+                return {"seq": last, "reset": True, "more": False, "changes": []}
+            rows = self._db.execute(
+                "SELECT seq, filename, kind FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, limit),
+            ).fetchall()
+            latest = {}
+            for r in rows:
+                latest.pop(r["filename"], None)  # que quede en el orden del último cambio
+                latest[r["filename"]] = (r["seq"], r["kind"])
+            names = [f for f, (_, kind) in latest.items() if kind != REMOVED]
+            records = {}
+            columns = ", ".join(("filename", "ok") + fields)
+            for i in range(0, len(names), 500):
+                chunk = names[i:i + 500]
+                marks = ", ".join("?" for _ in chunk)
+                for row in self._db.execute(
+                    f"SELECT {columns} FROM tracks WHERE filename IN ({marks})", chunk
+                ):
+                    records[row["filename"]] = self._to_dict(row, fields)
+        changes = []
+        for filename, (seq, kind) in latest.items():
+            record = records.get(filename)
+            if kind != REMOVED and record is None:
+                kind = REMOVED  # borrado después, aún no apuntado
+            change = {"seq": seq, "type": kind, "filename": filename}
+            if kind != REMOVED:
+                change["record"] = record
+            changes.append(change)
+        return {
+            "seq": rows[-1]["seq"] if rows else since,
+            "reset": False,
+            "more": len(rows) == limit,
+            "changes": changes,
+        }
+
+    def _scan_dir(self):
+        """Devuelve {filename: (mtime_ns, size)} de los .flac de la carpeta."""
+        found = {}
+        with os.scandir(self.flac_dir) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(".flac") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                found[entry.name] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def _row_values(self, filename, mtime_ns, file_size, metadata):
+        ok = 1 if "title" in metadata else 0
+        return (filename, mtime_ns, file_size, ok) + tuple(
+            metadata.get(c) for c in METADATA_COLUMNS
+        )
+
+    def _upsert(self, rows):
+        placeholders = ", ".join("?" for _ in range(4 + len(METADATA_COLUMNS)))
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO tracks VALUES ({placeholders})", rows
+        )
+
+    def refresh(self):
+        """
+        Sincroniza el índice con la carpeta. Devuelve (añadidos/modificados, borrados).
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        # El recorrido y la lectura de los archivos cambiados van fuera del lock
+        # de datos: mientras tanto query, put y changes_since siguen atendiendo.
+        # Solo se toma para comparar con lo guardado y para escribir el resultado.
+        with _refreshes.medir():
+            on_disk = self._scan_dir()
+            with self._lock:
+                known = {
+                    r["filename"]: (r["mtime_ns"], r["file_size"])
+                    for r in self._db.execute("SELECT filename, mtime_ns, file_size FROM tracks")
+                }
+            changed = [f for f, ident in on_disk.items() if known.get(f) != ident]
+            removed = [f for f in known if f not in on_disk]
+            seq = None
+
+            # reader(path, filename) puede ir a otro proceso: se le pasan rutas, no closures
+            mapper = self.executor.map if self.executor else map
+            paths = [os.path.join(self.flac_dir, f) for f in changed]
+            metadata = list(mapper(self.reader, paths, changed))
+            _files_read.inc(len(changed))
+            _tracks.set(len(on_disk))
+
+            with self._lock:
+                # Un put() durante la lectura ya dejó una fila más nueva: esa se respeta
+                current = {
+                    r["filename"]: (r["mtime_ns"], r["file_size"])
+                    for r in self._db.execute("SELECT filename, mtime_ns, file_size FROM tracks")
+                }
+                changed_rows = [
+                    (f, m) for f, m in zip(changed, metadata) if current.get(f) == known.get(f)
+                ]
+                removed = [f for f in removed if current.get(f) == known[f]]
+                if changed_rows:
+                    self._upsert([self._row_values(f, *on_disk[f], m) for f, m in changed_rows])
+                if removed:
+                    self._db.executemany(
+                        "DELETE FROM tracks WHERE filename = ?", [(f,) for f in removed]
+                    )
+                if changed_rows or removed:
+                    seq = self._log_changes(
+                        [(f, MODIFIED if f in known else ADDED) for f, _ in changed_rows]
+                        + [(f, REMOVED) for f in removed]
+                    )
+                self._db.commit()
+            self.last_refresh = time.monotonic()
+            self._generation += 1
+        if seq is not None:
+            self._notify(seq)
+        return len(changed_rows), len(removed)
+
+    def _fresh(self, max_age):
+        return self.last_refresh and time.monotonic() - self.last_refresh <= max_age
+
+    def refresh_if_stale(self, max_age):
+        if self._fresh(max_age):
+            return
+        generation = self._generation
+        with self._refresh_lock:
+            # Si otra petición ha refrescado mientras se esperaba, vale ese refresco
+            if self._generation != generation or self._fresh(max_age):
+                return
+            self._refresh()
+
+    def put(self, filename, metadata):
+        """Guarda en el índice los metadatos recién leídos/escritos de un archivo."""
+        path = os.path.join(self.flac_dir, filename)
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mtime_ns, file_size FROM tracks WHERE filename = ?", (filename,)
+            ).fetchone()
+            self._upsert([self._row_values(filename, st.st_mtime_ns, st.st_size, metadata)])
+            # Una lectura sin cambios en disco no es un cambio
+            seq = None
+            if row is None or (row["mtime_ns"], row["file_size"]) != (st.st_mtime_ns, st.st_size):
+                seq = self._log_changes([(filename, MODIFIED if row else ADDED)])
+            self._db.commit()
+        if seq is not None:
+            self._notify(seq)
+
+    def touch(self, filename):
+        """Actualiza mtime/tamaño de una fila cuyos tags no han cambiado (p.ej. nueva portada)."""
+        path = os.path.join(self.flac_dir, filename)
+        st = os.stat(path)
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE tracks SET mtime_ns = ?, file_size = ?, size = ? WHERE filename = ?",
+                (st.st_mtime_ns, st.st_size, st.st_size, filename),
+            ).rowcount
+            seq = self._log_changes([(filename, MODIFIED)]) if updated else None
+            self._db.commit()
+        if seq is not None:
+            self._notify(seq)
+
+    def _to_dict(self, row, fields=METADATA_COLUMNS):
+        if not row["ok"]:
+            return {"filename": row["filename"]}
+        record = {"filename": row["filename"]}
+        for c in fields:
+            record[c] = row[c]
+        return record
+
+    def query(self, search=None, sort="default", descending=False, offset=0, limit=None, fields=None):
+        """
+        Búsqueda paginada sobre el índice. Devuelve (total, registros).
+
+        search filtra (sin distinguir mayúsculas) por nombre de archivo, título,
+        artista o álbum; fields limita las columnas devueltas (filename va siempre).
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Clave de ordenación no válida: {sort}")
+        if fields is None:
+            fields = METADATA_COLUMNS
+        else:
+            unknown = [f for f in fields if f != "filename" and f not in METADATA_COLUMNS]
+            if unknown:
+                raise ValueError(f"Campos no válidos: {', '.join(unknown)}")
+            fields = tuple(f for f in METADATA_COLUMNS if f in fields)
+
+        where, params = "", []
+        if search:
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where = "WHERE " + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in SEARCH_COLUMNS)
+            params = [pattern] * len(SEARCH_COLUMNS)
+
+        direction = "DESC" if descending else "ASC"
+        columns = ", ".join(("filename", "ok") + fields)
+        sql = (
+            f"SELECT {columns} FROM tracks {where} "
+            f"ORDER BY {SORT_KEYS[sort]} {direction}, filename {direction} "
+            "LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM tracks {where}", params).fetchone()[0]
+            rows = self._db.execute(sql, params + [-1 if limit is None else limit, offset]).fetchall()
+        return total, [self._to_dict(r, fields) for r in rows]
@@ -0,0 +1,127 @@
+import re
+
+import musicbrainzngs
+
+from comun import coverart, musicbrainz
+from comun.planificador import PRIORIDAD_ALTA
+
+
+# Búsquedas en MusicBrainz y portadas de Cover Art Archive para la web.
+#
+# Todo pasa por comun.musicbrainz / comun.coverart, igual que los scripts:
+# - caché en disco compartida (por consulta normalizada; las portadas en el
+#   almacén por contenido), así que tras la primera vez cualquier pestaña o
+#   usuario obtiene la respuesta en local;
+# - las peticiones idénticas en curso a la vez se unen en una sola al servicio
+#   (el planificador deduplica por clave);
+# - un único límite de peticiones por host para todo el proceso.
+#
+# Las respuestas se devuelven ya en el formato que usa la interfaz.
+
+musicbrainzngs.set_useragent("EchoMiniNormalizer", "1.0", "your-email@example.com")
+
+MBID_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+# size de la API → variante de Cover Art Archive
+CAA_VARIANTS = {"250": "front-250", "500": "front-500", "1200": "front-1200", "full": "front"}
+
+
+def is_mbid(value):
+    return bool(MBID_RE.match(value or ""))
+
+
+def _lucene(value):
+    # Comillas y barras escapadas: el texto del usuario va dentro de "..."
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _artist_name(entity):
+    phrase = entity.get("artist-credit-phrase")
+    if phrase:
+        return phrase
+    parts = []
+    for credit in entity.get("artist-credit", []):
+        if isinstance(credit, str):
+            parts.append(credit)  # frases de unión (" feat. ", " & "...)
+        else:
+            parts.append(credit.get("name") or credit.get("artist", {}).get("name", ""))
+    return "".join(parts)
+
+
+def _track_number(release):
+    for medium in release.get("medium-list", []):
+        for track in medium.get("track-list", []):
+            if track.get("number"):
+                return track["number"]
+    return ""
+
+
+def search_recordings(query, limit=10):
+    result = musicbrainz.search_recordings(query=query, limit=limit, prioridad=PRIORIDAD_ALTA)
+    records = []
+    for recording in result.get("recording-list", []):
+        release = (recording.get("release-list") or [{}])[0]
+        records.append(
+            {
+                "id": recording.get("id"),
+                "title": recording.get("title", ""),
+                "artist": _artist_name(recording),
+                "album": release.get("title", ""),
+                "date": (release.get("date") or "").split("-")[0],
+                "tracknumber": _track_number(release),
+                "genre": "",  # se pide aparte con recording_genre()
+            }
+        )
+    return records
+
+
+def search_releases(artist=None, album=None, query=None, limit=5):
+    if query:
+        result = musicbrainz.search_releases(query=query, limit=limit, prioridad=PRIORIDAD_ALTA)
+    else:
+        parts = []
+        if artist:
+            parts.append(f"artist:{_lucene(artist)}")
+        if album:
+            parts.append(f"release:{_lucene(album)}")
+        if not parts:
+            return []
+        result = musicbrainz.search_releases(query=" AND ".join(parts), limit=limit, prioridad=PRIORIDAD_ALTA)
+    return [
+        {
+            "id": release.get("id"),
+            "title": release.get("title", ""),
+            "artist": _artist_name(release),
+            "date": release.get("date", ""),
+        }
+        for release in result.get("release-list", [])
+    ]
+
+
+def search_artists(query, limit=5):
+    result = musicbrainz.search_artists(query=query, limit=limit, prioridad=PRIORIDAD_ALTA)
+    return [
+        {"id": artist.get("id"), "name": artist.get("name", ""), "score": artist.get("ext:score")}
+        for artist in result.get("artist-list", [])
+    ]
+
+
+def recording_genre(mbid):
+    return musicbrainz.obtener_genero_por_id(mbid, prioridad=PRIORIDAD_ALTA) or ""
+
+
+def cover_image(release_id, size="250"):
+    """Bytes de la portada de la release en ese tamaño, o None si no tiene."""
+    return coverart.descargar_portada(release_id, CAA_VARIANTS[size], prioridad=PRIORIDAD_ALTA)
+
+
+def is_not_found(exc):
+    """True si MusicBrainz respondió 404 (MBID que no existe)."""
+    return isinstance(exc, musicbrainzngs.ResponseError) and getattr(exc.cause, "code", None) == 404
+
+
+def image_type(data):
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
@@ -1,14 +1,37 @@
 
-from fastapi import FastAPI, Response, HTTPException
+from fastapi import FastAPI, File, Request, Response, HTTPException, Query, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from mutagen.flac import FLAC
+import asyncio
+import json
 import os
-from typing import Optional
+import sys
+import threading
+from email.utils import formatdate
+from typing import List, Optional
 from pydantic import BaseModel
 
+# Módulos compartidos con los scripts de Anteriores/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from comun.flacmeta import ErrorFlac, leer_flac, leer_portada
+from comun.guardado import contadores, guardar
+from comun.imagenes import picture_en_pool
+from comun.sesion import SesionTags
+from library_index import REMOVED, LibraryIndex, read_metadata
+from thumbnails import ThumbnailCache, THUMB_SIZES
+from workers import run_lookup, run_read, run_write, scan_pool
+import lookup
+from file_slice import FileSliceResponse
+from metrics import MetricsMiddleware, metrics_text
+from watcher import ChangeNotifier, LibraryWatcher
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FLAC_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "flacs"))
+FLAC_DIR = os.path.abspath(os.environ.get("ECHOMINI_FLAC_DIR", os.path.join(BASE_DIR, "..", "flacs")))
+CACHE_DIR = os.path.abspath(os.environ.get("ECHOMINI_CACHE_DIR", os.path.join(BASE_DIR, "..", "cache")))
+# Segundos entre comprobaciones de cambios en FLAC_DIR al listar
+INDEX_REFRESH_SECONDS = float(os.environ.get("ECHOMINI_INDEX_REFRESH", "30"))
 
 app = FastAPI()
 
@@ -18,7 +41,10 @@ app.add_middleware(
     allow_origins=["*"],  # En producción restringe a tu frontend
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Change-Seq"],
 )
+# Latencia por ruta para /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Modelo para los metadatos que se pueden actualizar
 class FlacMetadata(BaseModel):
@@ -34,169 +60,445 @@ class FlacMetadata(BaseModel):
     lyrics: Optional[str] = None
 
 
+# Un cambio de metadatos dentro de una petición por lotes
+class FlacPatch(BaseModel):
+    filename: str
+    metadata: FlacMetadata
+
+
+# Índice en disco de la biblioteca: solo se vuelven a leer los archivos modificados
+index = LibraryIndex(os.path.join(CACHE_DIR, "library.sqlite3"), FLAC_DIR, read_metadata, scan_pool)
+# Portadas y miniaturas por hash de imagen
+thumbs = ThumbnailCache(CACHE_DIR)
+# Vigilancia de FLAC_DIR: los cambios hechos fuera de la API también llegan
+# al índice y, por el registro de cambios, a los clientes
+notifier = ChangeNotifier()
+index.add_listener(notifier.notify)
+watcher = LibraryWatcher(index, FLAC_DIR)
+# Hasta dónde se ha leído el registro de cambios para limpiar la caché de portadas
+covers_pruned = {"seq": index.last_seq()}
+covers_prune_lock = threading.Lock()
+
+
+def forget_removed_covers(seq):
+    """Quita de la caché de portadas los archivos que han desaparecido del índice."""
+    with covers_prune_lock:
+        while True:
+            result = index.changes_since(covers_pruned["seq"], 1000, ())
+            removed = [c["filename"] for c in result["changes"] if c["type"] == REMOVED]
+            if removed:
+                thumbs.forget(removed)
+            covers_pruned["seq"] = result["seq"]
+            if not result["more"]:
+                break
+
+
+index.add_listener(forget_removed_covers)
+
+
+@app.on_event("startup")
+async def start_watching():
+    notifier.bind(asyncio.get_running_loop())
+    watcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_watching():
+    watcher.stop()
+
+# Imagen para las pistas sin portada (pon una en static/)
+PLACEHOLDER_PATH = os.path.join(BASE_DIR, "..", "static", "placeholder.png")
+with open(PLACEHOLDER_PATH, "rb") as _f:
+    PLACEHOLDER = _f.read()
+PLACEHOLDER_MTIME = os.path.getmtime(PLACEHOLDER_PATH)
+
+
 @app.get("/api/flacs")
-async def list_flacs():
-    files = [f for f in os.listdir(FLAC_DIR) if f.lower().endswith(".flac")]
-    result = []
-    for f in files:
-        path = os.path.join(FLAC_DIR, f)
-        try:
-            audio = FLAC(path)
-            metadata = {
-                "filename": f,
-                "title": audio.get("title", [""])[0],
-                "artist": audio.get("artist", [""])[0],
-                "album": audio.get("album", [""])[0],
-                "tracknumber": audio.get("tracknumber", [""])[0],
-                "genre": audio.get("genre", [""])[0],
-                "date": audio.get("date", [""])[0],
-                "length": audio.info.length,
-                "bitrate": audio.info.bitrate,
-                "sample_rate": audio.info.sample_rate,
-                "channels": audio.info.channels,
-                "size": os.path.getsize(path),
-                "discnumber": audio.get("discnumber", [""])[0],
-                "totaldiscs": audio.get("totaldiscs", [""])[0],
-                "year": audio.get("year", [""])[0],
-                "lyrics": audio.get("lyrics", [""])[0] if "lyrics" in audio else None,
-            }
-        except:
-            metadata = {"filename": f}
-        result.append(metadata)
-    return result
+async def list_flacs(
+    response: Response,
+    q: Optional[str] = None,
+    sort: str = "default",
+    order: str = "asc",
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    fields: Optional[str] = None,
+):
+    """
+    Lista las pistas del índice. Sin parámetros devuelve la biblioteca completa;
+    con limit/page pagina, con q filtra por nombre/título/artista/álbum, sort y
+    order ordenan y fields (separados por comas) limita las columnas devueltas.
+    El total de resultados (antes de paginar) va en la cabecera X-Total-Count y
+    el número de cambio en X-Change-Seq (para /api/flacs/changes?since=).
+    """
+    def refresh_and_query():
+        index.refresh_if_stale(INDEX_REFRESH_SECONDS)
+        # La secuencia se lee antes de la consulta: como mucho se recibe un
+        # cambio repetido, nunca se pierde uno
+        response.headers["X-Change-Seq"] = str(index.last_seq())
+        return index.query(
+            search=q,
+            sort=sort,
+            descending=order.lower() == "desc",
+            offset=(page - 1) * limit if limit else 0,
+            limit=limit,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        )
 
-@app.get("/api/flacs/{filename}")
-async def get_flac(filename: str):
-    path = os.path.join(FLAC_DIR, filename)
     try:
-        audio = FLAC(path)
-        metadata = {
-            "filename": filename,
-            "title": audio.get("TITLE", [""])[0] or audio.get("title", [""])[0],
-            "artist": audio.get("ARTIST", [""])[0] or audio.get("artist", [""])[0],
-            "album": audio.get("ALBUM", [""])[0] or audio.get("album", [""])[0],
-            "tracknumber": audio.get("TRACKNUMBER", [""])[0] or audio.get("tracknumber", [""])[0],
-            "genre": audio.get("GENRE", [""])[0] or audio.get("genre", [""])[0],
-            "date": audio.get("DATE", [""])[0] or audio.get("date", [""])[0],
-            "length": audio.info.length,
-            "bitrate": audio.info.bitrate,
-            "sample_rate": audio.info.sample_rate,
-            "channels": audio.info.channels,
-            "size": os.path.getsize(path),
-            "discnumber": audio.get("DISCNUMBER", [""])[0] or audio.get("discnumber", [""])[0],
-            "totaldiscs": audio.get("TOTALDISCS", [""])[0] or audio.get("totaldiscs", [""])[0],
-            "year": audio.get("YEAR", [""])[0] or audio.get("year", [""])[0],
-        }
-    except:
-        metadata = {"filename": filename}
+        total, records = await run_read(refresh_and_query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return records
+
+@app.get("/api/flacs/changes")
+async def list_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None,
+):
+    """
+    Cambios de la biblioteca desde el número de secuencia `since` (el de
+    X-Change-Seq o el "seq" de la respuesta anterior): altas y modificaciones
+    con su registro y bajas solo con el nombre. Si "reset" es true el cliente se
+    ha quedado muy atrás y tiene que volver a pedir /api/flacs.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        return await run_read(index.changes_since, since, limit, field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/flacs/events")
+async def change_events(request: Request, since: Optional[int] = Query(None, ge=0), fields: Optional[str] = None):
+    """
+    Los mismos cambios como Server-Sent Events (evento "change" por archivo,
+    "reset" si hay que recargar). Sin `since` empieza desde ahora; al
+    reconectar, EventSource manda Last-Event-ID y se sigue desde ahí.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    last_id = request.headers.get("last-event-id")
+    if last_id and last_id.isdigit():
+        since = int(last_id)
+    if since is None:
+        since = await run_read(index.last_seq)
+
+    async def stream():
+        seq = since
+        while not await request.is_disconnected():
+            pending = notifier.current()
+            result = await run_read(index.changes_since, seq, 1000, field_list)
+            if result["reset"]:
+                yield f"id: {result['seq']}\nevent: reset\ndata: {{}}\n\n"
+            for change in result["changes"]:
+                yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+            seq = result["seq"]
+            if result["more"]:
+                continue
+            if not await notifier.wait(pending, 15):
+                yield ": ping\n\n"  # mantiene viva la conexión
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+def read_and_index(filename):
+    path = os.path.join(FLAC_DIR, filename)
+    metadata = read_metadata(path, filename)
+    if os.path.isfile(path):
+        index.put(filename, metadata)
     return metadata
 
-@app.get("/api/cover/{filename}")
-async def get_cover(filename: str):
+@app.get("/api/flacs/{filename}")
+async def get_flac(filename: str):
+    return await run_read(read_and_index, filename)
+
+def _cover_headers(etag, mtime):
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        # El navegador puede guardarla pero debe revalidar (barato: 304)
+        "Cache-Control": "no-cache",
+    }
+
+
+def resolve_cover(filename):
+    """
+    Devuelve (sha, mime, mtime, offset, length) de la portada del archivo, o
+    Nones si no tiene. offset/length son la posición de la imagen en el FLAC.
+    """
     path = os.path.join(FLAC_DIR, filename)
     try:
-        audio = FLAC(path)
-        if audio.pictures:
-            pic = audio.pictures[0]
-            return Response(content=pic.data, media_type=pic.mime)
-    except:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None, None, None, None, None
+    cached = thumbs.lookup(filename, st)
+    if cached is not None:
+        sha, mime, offset, length = cached
+        return sha, mime, st.st_mtime, offset, length
+    # Solo se lee el FLAC si ha cambiado desde la última vez
+    data = mime = offset = length = None
+    try:
+        info = leer_flac(path)
+        if info.pictures:
+            pic = info.pictures[0]
+            data, mime, offset, length = leer_portada(path, pic), pic.mime, pic.offset, pic.length
+    except (OSError, ErrorFlac):
         pass
-    # Si no hay imagen, devuelve un placeholder (pon uno en static/)
-    with open(os.path.join(BASE_DIR, "../static/placeholder.png"), "rb") as f:
-        data = f.read()
-    return Response(content=data, media_type="image/png")
+    sha = thumbs.store(filename, st, data, mime, offset, length)
+    return sha, mime, st.st_mtime, offset, length
 
 
+@app.get("/api/cover/{filename}")
+async def get_cover(filename: str, request: Request, size: str = "full"):
+    if size != "full" and (not size.isdigit() or int(size) not in THUMB_SIZES):
+        allowed = "|".join(str(s) for s in THUMB_SIZES)
+        raise HTTPException(status_code=400, detail=f"size debe ser {allowed}|full")
+    variant = size if size == "full" else int(size)
 
-@app.put("/api/flacs/{filename}")
-async def update_flac(filename: str, metadata: FlacMetadata):
+    sha, mime, mtime, offset, length = await run_read(resolve_cover, filename)
+    if sha:
+        etag = f'"{sha[:20]}-{variant}"'
+        headers = _cover_headers(etag, mtime)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        path = os.path.join(FLAC_DIR, filename)
+        if variant == "full":
+            # Directamente desde el FLAC: ni se parsea ni se copia la imagen
+            return FileSliceResponse(path, offset, length, media_type=mime, headers=headers)
+        image_path = await run_read(thumbs.variant, sha, variant, (path, offset, length))
+        return FileResponse(image_path, media_type="image/jpeg", headers=headers)
+
+    # Si no hay imagen, devuelve el placeholder (cargado una vez al arrancar)
+    headers = _cover_headers('"placeholder"', PLACEHOLDER_MTIME)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(PLACEHOLDER, media_type="image/png", headers=headers)
+
+
+
+def write_metadata(filename, metadata):
     path = os.path.join(FLAC_DIR, filename)
-    try:
-        audio = FLAC(path)
-        
-        # Primero, borrar los campos existentes para evitar duplicados
-        for key in metadata.dict(exclude_none=True).keys():
-            if key.upper() in audio:
-                del audio[key.upper()]
-            if key.lower() in audio:
-                del audio[key.lower()]
-        
-        # Mapeo de nombres de campo para compatibilidad con Windows
-        field_mapping = {
-            "title": "TITLE",
-            "artist": "ARTIST",
-            "album": "ALBUM",
-            "tracknumber": "TRACKNUMBER",
-            "genre": "GENRE",
-            "date": "DATE",
-            "discnumber": "DISCNUMBER",
-            "totaldiscs": "TOTALDISCS",
-            "year": "DATE",  # Windows usa DATE para mostrar el año
-            "lyrics": "LYRICS"
-        }
+    sesion = SesionTags(path)
+    audio = sesion.audio
+    
+    # Primero, borrar los campos existentes para evitar duplicados
+    for key in metadata.dict(exclude_none=True).keys():
+        if key.upper() in audio:
+            del audio[key.upper()]
+        if key.lower() in audio:
+            del audio[key.lower()]
+    
+    # Mapeo de nombres de campo para compatibilidad con Windows
+    field_mapping = {
+        "title": "TITLE",
+        "artist": "ARTIST",
+        "album": "ALBUM",
+        "tracknumber": "TRACKNUMBER",
+        "genre": "GENRE",
+        "date": "DATE",
+        "discnumber": "DISCNUMBER",
+        "totaldiscs": "TOTALDISCS",
+        "year": "DATE",  # Windows usa DATE para mostrar el año
+        "lyrics": "LYRICS"
+    }
+    
+    # Actualizar los metadatos usando nombres estándar Vorbis
+    for key, value in metadata.dict(exclude_none=True).items():
+        vorbis_key = field_mapping.get(key, key.upper())
+        audio[vorbis_key] = [value]  # En FLAC, los metadatos son listas de strings
         
-        # Actualizar los metadatos usando nombres estándar Vorbis
-        for key, value in metadata.dict(exclude_none=True).items():
-            vorbis_key = field_mapping.get(key, key.upper())
-            audio[vorbis_key] = [value]  # En FLAC, los metadatos son listas de strings
+        # Para compatibilidad adicional, también escribir con el nombre original
+        if key != vorbis_key.lower():
+            audio[key] = [value]
             
-            # Para compatibilidad adicional, también escribir con el nombre original
-            if key != vorbis_key.lower():
-                audio[key] = [value]
-                
-            # Caso especial para el año: establecerlo tanto en YEAR como en DATE
-            if key == "year":
-                audio["YEAR"] = [value]
-                audio["DATE"] = [value]
-        
-        # Guardar cambios
-        audio.save()
-        
-        # Devolver los metadatos actualizados
-        return await get_flac(filename)
+        # Caso especial para el año: establecerlo tanto en YEAR como en DATE
+        if key == "year":
+            audio["YEAR"] = [value]
+            audio["DATE"] = [value]
+    
+    # Guardar cambios, solo si hay alguno (en el sitio si cabe en el padding,
+    # si no copia + rename)
+    sesion.commit()
+    
+    # Devolver los metadatos actualizados (y actualizar su fila del índice)
+    return read_and_index(filename)
+
+
+@app.put("/api/flacs/{filename}")
+async def update_flac(filename: str, metadata: FlacMetadata):
+    try:
+        return await run_write(write_metadata, filename, metadata)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
 
-from fastapi import FastAPI, Response, HTTPException, File, UploadFile, Form
 
-# ... código existente ...
+@app.post("/api/flacs/batch")
+async def update_flacs_batch(patches: List[FlacPatch]):
+    """
+    Aplica muchos cambios de metadatos en una sola petición (p.ej. todo un álbum).
+    Se validan todos antes de tocar nada; luego se escriben en paralelo y se
+    devuelve el resultado de cada archivo junto con los registros actualizados.
+    """
+    errors = []
+    seen = set()
+    for i, patch in enumerate(patches):
+        name = patch.filename
+        if os.path.basename(name) != name or not name.lower().endswith(".flac"):
+            errors.append({"index": i, "filename": name, "error": "Nombre de archivo no válido"})
+        elif name in seen:
+            errors.append({"index": i, "filename": name, "error": "Archivo repetido en el lote"})
+        elif not os.path.isfile(os.path.join(FLAC_DIR, name)):
+            errors.append({"index": i, "filename": name, "error": "Archivo no encontrado"})
+        seen.add(name)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    outcomes = await asyncio.gather(
+        *(run_write(write_metadata, p.filename, p.metadata) for p in patches),
+        return_exceptions=True,
+    )
+    results, records = [], []
+    for patch, outcome in zip(patches, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"filename": patch.filename, "ok": False, "error": str(outcome)})
+        else:
+            results.append({"filename": patch.filename, "ok": True})
+            records.append(outcome)
+    return {"results": results, "records": records}
+
+
+def write_cover(filename, image_data):
+    path = os.path.join(FLAC_DIR, filename)
+    # Leer el archivo FLAC
+    audio = FLAC(path)
+    
+    # Borrar imágenes existentes
+    audio.clear_pictures()
+    
+    # Añadir la nueva imagen, reducida a JPEG baseline con sus dimensiones reales
+    pic = picture_en_pool(image_data)
+    audio.add_picture(pic)
+    
+    # Guardar el archivo
+    guardar(audio, path)
+    index.touch(filename)
+    # La portada cambia de posición: se vuelve a localizar en la siguiente petición
+
 
 @app.put("/api/cover/{filename}")
 async def update_cover(filename: str, cover: UploadFile = File(...)):
-    path = os.path.join(FLAC_DIR, filename)
+    # Se vuelve a codificar como JPEG, pero solo se aceptan imágenes
+    if not (cover.content_type or "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="El archivo subido no es una imagen")
     try:
-        # Leer el archivo FLAC
-        audio = FLAC(path)
-        
         # Leer la imagen subida
         image_data = await cover.read()
-        
-        # Determinar el tipo MIME
-        mime_type = cover.content_type
-        
-        # Borrar imágenes existentes
-        audio.clear_pictures()
-        
-        # Añadir la nueva imagen
-        from mutagen.flac import Picture
-        pic = Picture()
-        pic.data = image_data
-        pic.mime = mime_type
-        pic.type = 3  # 3 para la portada frontal
-        pic.width = 500  # estos valores son aproximados
-        pic.height = 500
-        pic.depth = 24  # profundidad de color típica
-        
-        audio.add_picture(pic)
-        
-        # Guardar el archivo
-        audio.save()
+
+        await run_write(write_cover, filename, image_data)
         
         return {"success": True}
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/stats")
+async def get_stats():
+    # Guardados hechos en el sitio vs. reescrituras completas del archivo
+    return {"saves": contadores()}
+
+
+# Proxy de MusicBrainz / Cover Art Archive para la interfaz: caché compartida,
+# peticiones idénticas unidas y un solo límite de peticiones (ver lookup.py)
+
+async def _lookup(fn, *args, **kwargs):
+    try:
+        return await run_lookup(fn, *args, **kwargs)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if lookup.is_not_found(e):
+            raise HTTPException(status_code=404, detail="No existe en MusicBrainz")
+        raise HTTPException(status_code=502, detail=f"MusicBrainz: {e}")
+
+
+def _check_mbid(mbid):
+    if not lookup.is_mbid(mbid):
+        raise HTTPException(status_code=400, detail="MBID no válido")
+
+
+@app.get("/api/lookup/recordings")
+async def lookup_recordings(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100)):
+    return await _lookup(lookup.search_recordings, q, limit)
+
+
+@app.get("/api/lookup/recordings/{mbid}/genre")
+async def lookup_recording_genre(mbid: str):
+    _check_mbid(mbid)
+    return {"genre": await _lookup(lookup.recording_genre, mbid)}
+
+
+@app.get("/api/lookup/releases")
+async def lookup_releases(
+    artist: Optional[str] = None,
+    album: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(5, ge=1, le=100),
+):
+    return await _lookup(lookup.search_releases, artist, album, q, limit)
+
+
+@app.get("/api/lookup/artists")
+async def lookup_artists(q: str = Query(..., min_length=1), limit: int = Query(5, ge=1, le=100)):
+    return await _lookup(lookup.search_artists, q, limit)
+
+
+@app.get("/api/lookup/covers")
+async def lookup_covers(
+    artist: Optional[str] = None,
+    album: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(5, ge=1, le=25),
+):
+    """
+    Portadas candidatas: busca las releases y comprueba a la vez cuáles tienen
+    portada (bajando la miniatura, que queda en caché para mostrarla).
+    """
+    releases = await _lookup(lookup.search_releases, artist, album, q, limit)
+    thumbnails = await asyncio.gather(
+        *(run_lookup(lookup.cover_image, r["id"], "250") for r in releases), return_exceptions=True
+    )
+    return [
+        {
+            **release,
+            "source": "MusicBrainz",
+            "thumbnailUrl": f"/api/lookup/cover/{release['id']}?size=250",
+            "url": f"/api/lookup/cover/{release['id']}?size=1200",
+        }
+        for release, thumbnail in zip(releases, thumbnails)
+        if isinstance(thumbnail, bytes)
+    ]
+
+
+@app.get("/api/lookup/cover/{release_id}")
+async def lookup_cover(release_id: str, size: str = "500"):
+    _check_mbid(release_id)
+    if size not in lookup.CAA_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"size debe ser {'|'.join(lookup.CAA_VARIANTS)}")
+    data = await _lookup(lookup.cover_image, release_id, size)
+    if not data:
+        raise HTTPException(status_code=404, detail="La release no tiene portada")
+    # La portada de una release casi nunca cambia: el navegador la puede reutilizar
+    return Response(data, media_type=lookup.image_type(data), headers={"Cache-Control": "public, max-age=86400"})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Formato de texto de Prometheus: contadores, histogramas por etapa y ruta, colas
+    return Response(metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
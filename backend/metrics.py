@@ -0,0 +1,51 @@
+import time
+
+from comun import metricas
+
+
+# Duración de cada petición por ruta (la plantilla, no la URL: así no hay una
+# serie por archivo). Las conexiones SSE no se cuentan, durarían lo que el cliente
+http_requests = metricas.histograma("echomini_http_request_seconds", "Duración de las peticiones HTTP por ruta")
+http_in_flight = metricas.medidor("echomini_http_requests_in_flight", "Peticiones HTTP en curso")
+_in_flight = {"n": 0}
+http_in_flight.funcion(lambda: _in_flight["n"])
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición hasta el último byte del cuerpo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        state = {"status": 500, "stream": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                content_type = dict(message.get("headers") or []).get(b"content-type", b"")
+                state["stream"] = content_type.startswith(b"text/event-stream")
+            await send(message)
+
+        _in_flight["n"] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _in_flight["n"] -= 1
+            if not state["stream"]:
+                route = getattr(scope.get("route"), "path", "unmatched")
+                http_requests.observar(
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    route=route,
+                    status=state["status"],
+                )
+
+
+def metrics_text():
+    """Métricas del proceso en el formato de texto de Prometheus."""
+    return metricas.exponer()
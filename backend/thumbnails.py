@@ -0,0 +1,151 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+from comun import metricas
+
+
+# Tamaños (lado mayor en px) que se pueden pedir además de "full"
+THUMB_SIZES = (100, 300)
+THUMB_QUALITY = 85
+
+_cache_requests = metricas.contador("echomini_cache_requests_total", "Consultas a las cachés locales")
+
+
+class ThumbnailCache:
+    """
+    Caché en disco de portadas y sus miniaturas.
+
+    Para cada archivo se recuerda, según su mtime y tamaño, el hash SHA-256 de
+    su portada (o que no tiene) y dónde está el bloque de imagen dentro del FLAC
+    (offset y longitud), así la imagen completa se sirve directamente desde el
+    archivo sin volver a parsearlo. Las miniaturas se guardan por hash, así que
+    las pistas de un mismo álbum las comparten y un FLAC solo se vuelve a leer
+    cuando cambia en disco. Cuando un hash deja de ser la portada de algún
+    archivo (se borra o se le cambia la portada) se borran sus miniaturas.
+    """
+
+    def __init__(self, cache_dir):
+        self.dir = os.path.join(cache_dir, "thumbs")
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "covers.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS covers (
+                filename TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                sha TEXT,
+                mime TEXT,
+                offset INTEGER,
+                length INTEGER
+            )"""
+        )
+        # Cachés creadas antes de guardar la posición de la imagen
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(covers)")}
+        for column in ("offset", "length"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE covers ADD COLUMN {column} INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS covers_sha ON covers (sha)")
+        self._db.commit()
+
+    def lookup(self, filename, st):
+        """
+        Devuelve (sha, mime, offset, length) de la portada si el archivo no ha
+        cambiado, (None, None, None, None) si se sabe que no tiene portada, o
+        None si hay que leerlo.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mtime_ns, file_size, sha, mime, offset, length FROM covers WHERE filename = ?",
+                (filename,),
+            ).fetchone()
+        if (
+            row is None
+            or (row[0], row[1]) != (st.st_mtime_ns, st.st_size)
+            or (row[2] is not None and row[4] is None)
+        ):
+            _cache_requests.inc(cache="covers", result="miss")
+            return None
+        _cache_requests.inc(cache="covers", result="hit")
+        return row[2], row[3], row[4], row[5]
+
+    def store(self, filename, st, data, mime, offset=None, length=None):
+        """
+        Registra la portada leída de un archivo (data=None si no tiene) y su
+        posición en el FLAC. La imagen no se copia: se sirve desde el propio archivo.
+        """
+        sha = hashlib.sha256(data).hexdigest() if data is not None else None
+        with self._lock:
+            old = self._db.execute("SELECT sha FROM covers WHERE filename = ?", (filename,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO covers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, st.st_mtime_ns, st.st_size, sha, mime, offset, length),
+            )
+            self._db.commit()
+        if old is not None and old[0] != sha:
+            self._prune([old[0]])
+        return sha
+
+    def forget(self, filenames):
+        """Olvida archivos que ya no existen y borra las miniaturas que nadie más usa."""
+        shas = []
+        with self._lock:
+            for filename in filenames:
+                row = self._db.execute("SELECT sha FROM covers WHERE filename = ?", (filename,)).fetchone()
+                if row is not None:
+                    shas.append(row[0])
+            self._db.executemany("DELETE FROM covers WHERE filename = ?", [(f,) for f in filenames])
+            self._db.commit()
+        self._prune(shas)
+
+    def _prune(self, shas):
+        for sha in set(shas):
+            if sha is None:
+                continue
+            with self._lock:
+                used = self._db.execute("SELECT 1 FROM covers WHERE sha = ? LIMIT 1", (sha,)).fetchone()
+            if used:
+                continue
+            for size in THUMB_SIZES:
+                try:
+                    os.unlink(self.path(sha, size))
+                except FileNotFoundError:
+                    pass
+
+    def path(self, sha, size):
+        return os.path.join(self.dir, sha[:2], f"{sha}-{size}")
+
+    def variant(self, sha, size, source):
+        """
+        Ruta de la miniatura en el tamaño pedido, generándola la primera vez a
+        partir de `source` = (ruta del FLAC, offset, longitud) de la imagen.
+        """
+        path = self.path(sha, size)
+        if os.path.exists(path):
+            _cache_requests.inc(cache="thumbnails", result="hit")
+            return path
+        _cache_requests.inc(cache="thumbnails", result="miss")
+        flac_path, offset, length = source
+        with metricas.etapas.medir(stage="thumbnail"):
+            with open(flac_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            img = Image.open(BytesIO(data))
+            img = img.convert("RGB")
+            img.thumbnail((size, size))
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=THUMB_QUALITY)
+        self._write(path, buf.getvalue())
+        return path
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+import time
+
+try:  # inotify/FSEvents/... si está instalado watchdog
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+# Sin watchdog: cada cuántos segundos se mira el mtime de la carpeta (un stat).
+# Solo cambia al añadir, borrar o renombrar archivos, así que el refresco
+# completo (scandir de todo + SELECT de todas las filas) se hace solo entonces
+POLL_SECONDS = float(os.environ.get("ECHOMINI_WATCH_INTERVAL", 5))
+# Las ediciones dentro de un archivo no cambian el mtime de la carpeta: para las
+# hechas fuera de la API se hace además un refresco completo cada tanto (y, con
+# watchdog, por si se pierde algún evento)
+FULL_SECONDS = float(os.environ.get("ECHOMINI_WATCH_FULL_INTERVAL", 300))
+# Con watchdog se agrupan las ráfagas de eventos (un guardado genera varios)
+DEBOUNCE_SECONDS = 0.5
+
+
+class LibraryWatcher:
+    """
+    Mantiene el índice al día con lo que pasa en la carpeta, también con los
+    cambios hechos fuera de la API (scripts por lotes, explorador de archivos...).
+
+    Con watchdog se refresca al llegar eventos del sistema de archivos; sin él,
+    cuando cambia el mtime de la carpeta. En ambos casos hay además un refresco
+    completo cada FULL_SECONDS, y los cambios acaban en el registro de cambios
+    del índice.
+    """
+
+    def __init__(self, index, flac_dir, poll_seconds=POLL_SECONDS, full_seconds=FULL_SECONDS):
+        self.index = index
+        self.flac_dir = flac_dir
+        self.poll_seconds = poll_seconds
+        self.full_seconds = full_seconds
+        self._dir_mtime = None
+        self._last_full = time.monotonic()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+
+    @property
+    def mode(self):
+        return "inotify" if self._observer is not None else "polling"
+
+    def start(self):
+        if Observer is not None and os.path.isdir(self.flac_dir):
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    watcher._dirty.set()
+
+            try:
+                self._observer = Observer()
+                self._observer.schedule(Handler(), self.flac_dir, recursive=False)
+                self._observer.start()
+            except OSError as e:
+                print(f"⚠️ No se puede vigilar {self.flac_dir} ({e}), se usa sondeo")
+                self._observer = None
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._dirty.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _dir_changed(self):
+        try:
+            mtime = os.stat(self.flac_dir).st_mtime_ns
+        except OSError:
+            return False
+        changed = self._dir_mtime is not None and mtime != self._dir_mtime
+        self._dir_mtime = mtime
+        return changed
+
+    def _run(self):
+        self._dir_changed()
+        while not self._stop.is_set():
+            if self._observer is not None:
+                # Con eventos: espera al primero y deja que acabe la ráfaga
+                if self._dirty.wait(timeout=self.full_seconds):
+                    self._stop.wait(DEBOUNCE_SECONDS)
+                due = True
+            else:
+                self._stop.wait(self.poll_seconds)
+                due = self._dir_changed() or time.monotonic() - self._last_full >= self.full_seconds
+            self._dirty.clear()
+            if self._stop.is_set():
+                break
+            if not due:
+                continue
+            try:
+                self.index.refresh()
+                self._last_full = time.monotonic()
+            except Exception as e:
+                print(f"⚠️ Error refrescando el índice: {e}")
+
+
+class ChangeNotifier:
+    """
+    Puente entre los hilos que escriben en el índice y los clientes en asyncio
+    (SSE): notify() se puede llamar desde cualquier hilo y despierta a todos los
+    que estén en wait().
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._event = None
+
+    def bind(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def notify(self, seq=None):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        # Cada aviso despierta a los que esperan ahora; los siguientes esperan al próximo
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def current(self):
+        """
+        Evento del próximo aviso. Se coge antes de leer los cambios, así un
+        cambio que llegue mientras se leen no se pierde.
+        """
+        return self._event
+
+    async def wait(self, event, timeout):
+        """Espera a que se active `event` (de current()). Devuelve False si pasa el timeout."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from comun import metricas
+from comun.escaneo import MODO, PROCESOS, Escaner
+
+
+# Hilos para la E/S de los endpoints (lecturas con mutagen/flacmeta y guardados)
+IO_WORKERS = int(os.environ.get("ECHOMINI_IO_WORKERS", min(32, (os.cpu_count() or 1) * 4)))
+# Máximo de lecturas y de escrituras en curso a la vez; las escrituras reescriben
+# archivos de varios MB, así que se limitan más para no acaparar el disco
+MAX_READS = int(os.environ.get("ECHOMINI_MAX_READS", IO_WORKERS))
+MAX_WRITES = int(os.environ.get("ECHOMINI_MAX_WRITES", 4))
+# Lectura en paralelo de los archivos nuevos/modificados al refrescar el índice:
+# con hilos (por defecto) o repartida entre procesos (ECHOMINI_SCAN_MODE=procesos),
+# que en escaneos en frío aprovecha todos los núcleos
+SCAN_MODE = os.environ.get("ECHOMINI_SCAN_MODE", MODO)
+_default_scan_workers = (os.cpu_count() or 1) if SCAN_MODE == PROCESOS else min(16, (os.cpu_count() or 1) * 2)
+SCAN_WORKERS = int(os.environ.get("ECHOMINI_SCAN_WORKERS", _default_scan_workers))
+
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="flac-io")
+# Consultas a MusicBrainz/Cover Art Archive: casi todo es esperar turno en el
+# planificador, así que van en su propio pool y no ocupan huecos de E/S
+LOOKUP_WORKERS = int(os.environ.get("ECHOMINI_LOOKUP_WORKERS", 32))
+lookup_pool = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix="lookup")
+# Pool aparte: el refresco corre dentro de io_pool y espera a estas tareas,
+# si compartieran pool podría quedarse sin hilos libres
+scan_pool = Escaner(SCAN_MODE, SCAN_WORKERS)
+
+_read_slots = asyncio.Semaphore(MAX_READS)
+_write_slots = asyncio.Semaphore(MAX_WRITES)
+
+# Cuántas operaciones esperan un hueco y cuánto esperan: si crecen, el límite
+# de lecturas/escrituras (o el disco) es el cuello de botella
+_waiting = {"read": 0, "write": 0}
+_queue_depth = metricas.medidor("echomini_io_queue_depth", "Operaciones de E/S esperando un hueco, por tipo")
+_queue_wait = metricas.histograma("echomini_io_wait_seconds", "Espera por un hueco de E/S, por tipo")
+for _kind in _waiting:
+    _queue_depth.funcion(functools.partial(_waiting.get, _kind), kind=_kind)
+
+
+async def _run(kind, slots, fn, args, kwargs):
+    _waiting[kind] += 1
+    start = time.perf_counter()
+    try:
+        await slots.acquire()
+    finally:
+        _waiting[kind] -= 1
+    _queue_wait.observar(time.perf_counter() - start, kind=kind)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(io_pool, functools.partial(fn, *args, **kwargs))
+    finally:
+        slots.release()
+
+
+async def run_read(fn, *args, **kwargs):
+    """Ejecuta una lectura bloqueante fuera del event loop."""
+    return await _run("read", _read_slots, fn, args, kwargs)
+
+
+async def run_write(fn, *args, **kwargs):
+    """Ejecuta una escritura bloqueante fuera del event loop."""
+    return await _run("write", _write_slots, fn, args, kwargs)
+
+
+async def run_lookup(fn, *args, **kwargs):
+    """Ejecuta una consulta a MusicBrainz/Cover Art Archive fuera del event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(lookup_pool, functools.partial(fn, *args, **kwargs))
+
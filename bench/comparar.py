@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compara dos resultados de bench/ejecutar.py y marca las regresiones.
+
+Se comparan los valores numéricos de "resultados": tiempos (*_ms, segundos)
+donde más es peor y rendimientos (por_segundo, pistas_por_segundo) donde más es
+mejor. Devuelve código 1 si alguna medida empeora más que --umbral.
+
+Uso: python bench/comparar.py antes.json despues.json [--umbral 0.10]
+"""
+import argparse
+import json
+import sys
+
+MAS_ES_MEJOR = ("por_segundo", "pistas_por_segundo")
+MAS_ES_PEOR = ("media_ms", "p50_ms", "p95_ms", "max_ms", "segundos")
+
+
+def aplanar(datos, prefijo=""):
+    for clave, valor in datos.items():
+        ruta = f"{prefijo}.{clave}" if prefijo else clave
+        if isinstance(valor, dict):
+            yield from aplanar(valor, ruta)
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield ruta, valor
+
+
+def comparar(antes, despues, umbral):
+    a = dict(aplanar(antes.get("resultados", {})))
+    d = dict(aplanar(despues.get("resultados", {})))
+    filas = []
+    for ruta in sorted(a.keys() & d.keys()):
+        campo = ruta.rsplit(".", 1)[-1]
+        if campo not in MAS_ES_MEJOR + MAS_ES_PEOR or not a[ruta]:
+            continue
+        cambio = (d[ruta] - a[ruta]) / a[ruta]
+        empeora = -cambio if campo in MAS_ES_MEJOR else cambio
+        filas.append((ruta, a[ruta], d[ruta], cambio, empeora > umbral, empeora < -umbral))
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos ejecuciones de los benchmarks")
+    parser.add_argument("antes")
+    parser.add_argument("despues")
+    parser.add_argument("--umbral", type=float, default=0.10, help="cambio relativo que se considera significativo")
+    args = parser.parse_args(argv)
+    with open(args.antes, encoding="utf-8") as f:
+        antes = json.load(f)
+    with open(args.despues, encoding="utf-8") as f:
+        despues = json.load(f)
+    if antes.get("config") != despues.get("config"):
+        print("⚠️ Las configuraciones no coinciden, la comparación puede no ser justa")
+
+    regresiones = 0
+    for ruta, a, d, cambio, peor, mejor in comparar(antes, despues, args.umbral):
+        marca = "🔴" if peor else "🟢" if mejor else "  "
+        print(f"{marca} {ruta:<45} {a:>12.3f} → {d:>12.3f}  {cambio:+.1%}")
+        regresiones += peor
+    print(f"{'❌' if regresiones else '✅'} {regresiones} regresiones por encima del {args.umbral:.0%}")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de extremo a extremo sobre una biblioteca sintética.
+
+Genera la biblioteca (bench/generar.py), levanta el servidor falso de
+MusicBrainz/CAA (bench/mock_servidor.py) y mide:
+
+  backend     el backend real (uvicorn en un subproceso): listado en frío y en
+              caliente, listado paginado, una pista, portada completa,
+              miniaturas en frío y en caliente, PUT de metadatos y lecturas
+              concurrentes.
+  echomini    Anteriores/echomini.py: primera pasada e incremental.
+  rezagados   Anteriores/rezagados.py: primera pasada e incremental.
+  selector    el pre-scan de coverReplacer y el tiempo hasta la primera
+              candidata de cada archivo en BuscadorPortadas.
+
+Cada script corre en un subproceso con su propia caché, apuntando al servidor
+falso. El resultado va a un JSON (--salida) que se compara con bench/comparar.py.
+
+Uso: python bench/ejecutar.py [--pistas 500] [--latencia 0.05] [--salida resultados.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun.flacmeta import leer_flac  # noqa: E402
+from generar import generar_biblioteca  # noqa: E402
+from mock_servidor import MockServidor  # noqa: E402
+
+BENCHMARKS = ("backend", "echomini", "rezagados", "selector")
+
+
+def estadisticas(tiempos):
+    """Resumen de una lista de duraciones en segundos (en ms)."""
+    if not tiempos:
+        return {"n": 0}
+    ordenados = sorted(tiempos)
+
+    def percentil(p):
+        return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+    total = sum(ordenados)
+    return {
+        "n": len(ordenados),
+        "media_ms": round(statistics.fmean(ordenados) * 1000, 3),
+        "p50_ms": round(percentil(50) * 1000, 3),
+        "p95_ms": round(percentil(95) * 1000, 3),
+        "max_ms": round(ordenados[-1] * 1000, 3),
+        "por_segundo": round(len(ordenados) / total, 1) if total else None,
+    }
+
+
+def medir(fn, veces):
+    tiempos = []
+    for i in range(veces):
+        t = time.perf_counter()
+        fn(i)
+        tiempos.append(time.perf_counter() - t)
+    return tiempos
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_puerto(puerto, proceso, timeout=60):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"el backend terminó al arrancar (código {proceso.returncode})")
+        try:
+            with socket.create_connection(("127.0.0.1", puerto), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("el backend no arranca")
+
+
+def entorno(base, extra):
+    env = dict(os.environ)
+    env.update(base)
+    env.update(extra)
+    env["PYTHONUNBUFFERED"] = "1"
+    return env
+
+
+# ---------------------------------------------------------------- backend
+
+def bench_backend(args, trabajo, env_base):
+    biblioteca = os.path.join(trabajo, "backend-flacs")
+    # El backend lista una carpeta plana
+    generar_biblioteca(biblioteca, args.pistas, args.tags, args.portada, args.con_portada, args.id3,
+                       args.padding, args.por_album, carpetas=False, semilla=args.semilla,
+                       sin_album=args.sin_album)
+    cache = os.path.join(trabajo, "backend-cache")
+    puerto = _puerto_libre()
+    log = open(os.path.join(trabajo, "backend.log"), "wb")
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.join(RAIZ, "backend"),
+         "--port", str(puerto), "--log-level", "warning"],
+        env=entorno(env_base, {"ECHOMINI_FLAC_DIR": biblioteca, "ECHOMINI_CACHE_DIR": cache}),
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    resultados = {}
+    try:
+        _esperar_puerto(puerto, proceso)
+        url = f"http://127.0.0.1:{puerto}"
+        with requests.Session() as cliente:
+            def get(ruta, **params):
+                r = cliente.get(url + ruta, params=params, timeout=120)
+                r.raise_for_status()
+                return r
+
+            t = time.perf_counter()
+            lista = get("/api/flacs").json()
+            resultados["lista_fria"] = estadisticas([time.perf_counter() - t])
+            resultados["lista"] = estadisticas(medir(lambda i: get("/api/flacs"), args.repeticiones))
+            paginas = max(1, len(lista) // 100)
+            resultados["lista_paginada"] = estadisticas(
+                medir(lambda i: get("/api/flacs", limit=100, page=i % paginas + 1), args.repeticiones)
+            )
+            resultados["lista_campos"] = estadisticas(
+                medir(lambda i: get("/api/flacs", fields="filename,title,artist"), args.repeticiones)
+            )
+
+            nombres = [r["filename"] for r in lista]
+            muestra = nombres[: args.repeticiones]
+            resultados["pista"] = estadisticas(medir(lambda i: get(f"/api/flacs/{muestra[i]}"), len(muestra)))
+
+            # El listado no dice qué pistas tienen portada: se mira en los archivos
+            con_portada = [n for n in nombres if leer_flac(os.path.join(biblioteca, n)).pictures]
+            con_portada = con_portada[: args.repeticiones]
+            resultados["portada"] = estadisticas(
+                medir(lambda i: get(f"/api/cover/{con_portada[i]}"), len(con_portada))
+            )
+            resultados["miniatura_fria"] = estadisticas(
+                medir(lambda i: get(f"/api/cover/{con_portada[i]}", size=100), len(con_portada))
+            )
+            resultados["miniatura_caliente"] = estadisticas(
+                medir(lambda i: get(f"/api/cover/{con_portada[i]}", size=100), len(con_portada))
+            )
+
+            def put(i):
+                r = cliente.put(f"{url}/api/flacs/{muestra[i]}", json={"title": f"Editado {i} {time.time()}"}, timeout=120)
+                r.raise_for_status()
+
+            resultados["put"] = estadisticas(medir(put, len(muestra)))
+
+        # Lecturas concurrentes: rendimiento con varios clientes a la vez
+        with requests.Session() as cliente:
+            cliente.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrencia))
+            def una(i):
+                t = time.perf_counter()
+                nombre = nombres[i % len(nombres)]
+                ruta = f"/api/cover/{nombre}" if i % 2 and nombre in con_portada else f"/api/flacs/{nombre}"
+                params = {"size": 100} if "cover" in ruta else None
+                cliente.get(url + ruta, params=params, timeout=120).raise_for_status()
+                return time.perf_counter() - t
+
+            peticiones = args.repeticiones * args.concurrencia
+            t = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrencia) as pool:
+                tiempos = list(pool.map(una, range(peticiones)))
+            total = time.perf_counter() - t
+            concurrente = estadisticas(tiempos)
+            concurrente["clientes"] = args.concurrencia
+            concurrente["por_segundo"] = round(peticiones / total, 1)
+            resultados["concurrente"] = concurrente
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        log.close()
+    return resultados
+
+
+# ---------------------------------------------------------------- scripts
+
+def _correr_script(script, ruta, env, log, extra=()):
+    t = time.perf_counter()
+    with open(log, "ab") as salida:
+        proceso = subprocess.run(
+            [sys.executable, os.path.join(RAIZ, "Anteriores", script), ruta, *extra],
+            env=env, stdout=salida, stderr=subprocess.STDOUT,
+        )
+    return time.perf_counter() - t, proceso.returncode
+
+
+def bench_script(nombre, script, args, trabajo, base, env_base, mock):
+    copia = os.path.join(trabajo, f"{nombre}-flacs")
+    shutil.copytree(base, copia)
+    env = entorno(env_base, {"ECHOMINI_CACHE_DIR": os.path.join(trabajo, f"{nombre}-cache")})
+    log = os.path.join(trabajo, f"{nombre}.log")
+    resultados = {}
+    for pasada in ("primera", "incremental"):
+        antes = dict(mock.contadores)
+        segundos, codigo = _correr_script(script, copia, env, log)
+        resultados[pasada] = {
+            "segundos": round(segundos, 3),
+            "pistas_por_segundo": round(args.pistas / segundos, 1),
+            "codigo": codigo,
+            "peticiones_mb": mock.contadores["mb"] - antes.get("mb", 0),
+            "peticiones_caa": mock.contadores["caa"] - antes.get("caa", 0),
+            "limitadas": mock.contadores["limitadas"] - antes.get("limitadas", 0),
+        }
+    return resultados
+
+
+# ---------------------------------------------------------------- selector
+
+def bench_selector(args, trabajo, base, env_base):
+    env = entorno(env_base, {"ECHOMINI_CACHE_DIR": os.path.join(trabajo, "selector-cache")})
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_selector", base, "--archivos", str(args.archivos_selector)],
+        env=env, capture_output=True,
+    )
+    with open(os.path.join(trabajo, "selector.log"), "wb") as log:
+        log.write(proceso.stdout + proceso.stderr)
+    if proceso.returncode != 0:
+        raise RuntimeError(f"el benchmark del selector falló (código {proceso.returncode})")
+    return json.loads(proceso.stdout.decode().strip().splitlines()[-1])
+
+
+def _selector_interno(ruta, archivos, timeout=10):
+    """Se ejecuta en el subproceso, con el entorno apuntando al servidor falso."""
+    import threading
+
+    sys.path.insert(0, os.path.join(RAIZ, "Anteriores"))
+    import coverReplacer
+
+    t = time.perf_counter()
+    sin_portada = coverReplacer.archivos_sin_portada(ruta, debug=False)
+    prescan = time.perf_counter() - t
+
+    llegadas = {}
+    llegada = threading.Condition()
+
+    def al_llegar(path, fila, imgdata):
+        with llegada:
+            llegadas.setdefault(path, time.perf_counter())
+            llegada.notify_all()
+
+    buscador = coverReplacer.BuscadorPortadas(al_llegar)
+    primeras = []
+    sin_candidatas = 0
+    try:
+        lista = sin_portada[:archivos]
+        for i, path in enumerate(lista):
+            with llegada:
+                llegadas.pop(path, None)
+            t = time.perf_counter()
+            buscador.seleccionar(path, lista[i + 1:])
+            with llegada:
+                llegada.wait_for(lambda: path in llegadas, timeout)
+                if path in llegadas:
+                    primeras.append(llegadas[path] - t)
+                else:
+                    sin_candidatas += 1
+    finally:
+        buscador.cerrar()
+    resultado = {
+        "prescan": {
+            "segundos": round(prescan, 3),
+            "sin_portada": len(sin_portada),
+        },
+        "primera_candidata": estadisticas(primeras),
+        "sin_candidatas": sin_candidatas,
+    }
+    print(json.dumps(resultado))
+
+
+# ---------------------------------------------------------------- main
+
+def _git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "_selector":
+        interno = argparse.ArgumentParser()
+        interno.add_argument("ruta")
+        interno.add_argument("--archivos", type=int, default=20)
+        a = interno.parse_args(argv[1:])
+        _selector_interno(a.ruta, a.archivos)
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmarks de echomini sobre una biblioteca sintética")
+    parser.add_argument("--salida", default="resultados.json", help="archivo JSON de resultados")
+    parser.add_argument("--etiqueta", default="", help="nombre libre para identificar la ejecución")
+    parser.add_argument("--solo", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--trabajo", help="carpeta de trabajo (por defecto una temporal que se borra)")
+    g = parser.add_argument_group("biblioteca")
+    g.add_argument("--pistas", type=int, default=500)
+    g.add_argument("--tags", type=int, default=6)
+    g.add_argument("--portada", type=int, default=500)
+    g.add_argument("--con-portada", type=float, default=0.7)
+    g.add_argument("--id3", type=float, default=0.1)
+    g.add_argument("--sin-album", type=float, default=0.2)
+    g.add_argument("--padding", type=int, default=8192)
+    g.add_argument("--por-album", type=int, default=10)
+    g.add_argument("--semilla", type=int, default=1)
+    g = parser.add_argument_group("servidor falso")
+    g.add_argument("--latencia", type=float, default=0.05)
+    g.add_argument("--jitter", type=float, default=0.02)
+    g.add_argument("--limite-mb", type=float, default=50, help="peticiones/s antes de dar 503 (0 = sin límite)")
+    g.add_argument("--limite-caa", type=float, default=100)
+    g.add_argument("--sin-portada", type=float, default=0.1)
+    g.add_argument("--rate-mb", type=float, default=40, help="ECHOMINI_MB_RATE de los clientes")
+    g.add_argument("--rate-caa", type=float, default=80, help="ECHOMINI_CAA_RATE de los clientes")
+    g = parser.add_argument_group("medidas")
+    g.add_argument("--repeticiones", type=int, default=50)
+    g.add_argument("--concurrencia", type=int, default=8)
+    g.add_argument("--archivos-selector", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    trabajo = args.trabajo or tempfile.mkdtemp(prefix="echomini-bench-")
+    os.makedirs(trabajo, exist_ok=True)
+    mock = MockServidor(0, args.latencia, args.jitter, args.limite_mb, args.limite_caa, args.sin_portada).arrancar()
+    env_base = dict(mock.entorno())
+    env_base["ECHOMINI_MB_RATE"] = str(args.rate_mb)
+    env_base["ECHOMINI_CAA_RATE"] = str(args.rate_caa)
+
+    salida = {
+        "formato": 1,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "etiqueta": args.etiqueta,
+        "git": _git(),
+        "maquina": {
+            "python": platform.python_version(),
+            "sistema": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida", "trabajo")},
+        "resultados": {},
+        "errores": {},
+    }
+    try:
+        base = os.path.join(trabajo, "base")
+        print(f"🎛️ Generando {args.pistas} pistas en {base}")
+        t = time.perf_counter()
+        salida["biblioteca"] = generar_biblioteca(
+            base, args.pistas, args.tags, args.portada, args.con_portada, args.id3,
+            args.padding, args.por_album, semilla=args.semilla, sin_album=args.sin_album,
+        )
+        salida["biblioteca"]["segundos"] = round(time.perf_counter() - t, 3)
+
+        for nombre in args.solo:
+            print(f"⏱️ {nombre}...")
+            try:
+                if nombre == "backend":
+                    r = bench_backend(args, trabajo, env_base)
+                elif nombre == "echomini":
+                    r = bench_script(nombre, "echomini.py", args, trabajo, base, env_base, mock)
+                elif nombre == "rezagados":
+                    r = bench_script(nombre, "rezagados.py", args, trabajo, base, env_base, mock)
+                else:
+                    r = bench_selector(args, trabajo, base, env_base)
+                salida["resultados"][nombre] = r
+            except Exception as e:
+                print(f"❌ {nombre}: {e}")
+                salida["errores"][nombre] = str(e)
+        salida["mock"] = dict(mock.contadores)
+    finally:
+        mock.parar()
+        if not args.trabajo:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultados en {args.salida}")
+    return 1 if salida["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
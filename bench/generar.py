@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Generador de bibliotecas FLAC sintéticas para los benchmarks.
+
+Los archivos son FLAC válidos y pequeños: STREAMINFO correcto y tramas reales
+con subtramas CONSTANT (silencio), con su CRC-8 y CRC-16, así que cualquier
+decodificador los acepta. Se puede elegir el número de pistas, cuántos tags
+llevan, el tamaño de las portadas, qué parte lleva ID3 delante o detrás, el
+padding y cuántas pistas van en cada carpeta de álbum. Con la misma semilla se
+genera siempre la misma biblioteca.
+
+Uso: python bench/generar.py destino [--pistas N] [--tags N] [--portada PX] ...
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+SAMPLE_RATE = 44100
+CANALES = 2
+BITS = 16
+BLOQUE = 4096
+
+GENEROS = ("Rock", "Pop", "Jazz", "Electronic", "Hip Hop", "Classical", "Metal", "Folk")
+
+
+def _crc8(data):
+    crc = 0
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _tabla_crc16():
+    tabla = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+        tabla.append(crc)
+    return tabla
+
+
+_CRC16 = _tabla_crc16()
+
+
+def _crc16(data):
+    crc = 0
+    for b in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16[(crc >> 8) ^ b]
+    return crc
+
+
+def _utf8_num(n):
+    """Número de trama con la codificación "UTF-8" extendida de FLAC."""
+    if n < 0x80:
+        return bytes([n])
+    bytes_extra = 1
+    while n >= 1 << (5 * bytes_extra + 6):
+        bytes_extra += 1
+    cabeza = (0xFF << (7 - bytes_extra)) & 0xFF
+    salida = [cabeza | (n >> (6 * bytes_extra))]
+    for i in range(bytes_extra - 1, -1, -1):
+        salida.append(0x80 | ((n >> (6 * i)) & 0x3F))
+    return bytes(salida)
+
+
+def _trama(numero, muestras, valor=0):
+    """Trama de `muestras` muestras por canal con subtramas CONSTANT."""
+    if muestras == BLOQUE:
+        codigo_bloque, extra = 0b1100, b""  # 256 * 2^4
+    else:
+        codigo_bloque, extra = 0b0111, struct.pack(">H", muestras - 1)  # tamaño al final de la cabecera
+    cabecera = bytes([0xFF, 0xF8, (codigo_bloque << 4) | 0b1001])  # 44.1 kHz
+    cabecera += bytes([((CANALES - 1) << 4) | (0b100 << 1)])  # canales independientes, 16 bits
+    cabecera += _utf8_num(numero) + extra
+    cabecera += bytes([_crc8(cabecera)])
+    subtrama = b"\x00" + struct.pack(">h", valor)  # tipo CONSTANT, sin bits desperdiciados
+    trama = cabecera + subtrama * CANALES
+    return trama + struct.pack(">H", _crc16(trama))
+
+
+def _streaminfo(total, min_trama, max_trama):
+    datos = struct.pack(">HH", BLOQUE, BLOQUE)
+    datos += min_trama.to_bytes(3, "big") + max_trama.to_bytes(3, "big")
+    v = (SAMPLE_RATE << 44) | ((CANALES - 1) << 41) | ((BITS - 1) << 36) | total
+    datos += v.to_bytes(8, "big") + b"\x00" * 16  # MD5 a cero: "desconocido"
+    return datos
+
+
+def _bloque(tipo, datos, ultimo=False):
+    return bytes([(0x80 if ultimo else 0) | tipo]) + len(datos).to_bytes(3, "big") + datos
+
+
+def _vorbis(tags):
+    vendor = b"echomini-bench"
+    datos = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(tags))
+    for clave, valor in tags:
+        entrada = f"{clave}={valor}".encode("utf-8")
+        datos += struct.pack("<I", len(entrada)) + entrada
+    return datos
+
+
+def _picture(imagen, mime, ancho, alto):
+    desc = b"Cover"
+    datos = struct.pack(">I", 3)
+    datos += struct.pack(">I", len(mime)) + mime.encode()
+    datos += struct.pack(">I", len(desc)) + desc
+    datos += struct.pack(">IIII", ancho, alto, 24, 0)
+    return datos + struct.pack(">I", len(imagen)) + imagen
+
+
+def _id3v2(tags):
+    """Etiqueta ID3v2.3 mínima con TIT2/TPE1/TALB."""
+    marcos = b""
+    for marco, clave in (("TIT2", "title"), ("TPE1", "artist"), ("TALB", "album")):
+        if clave in tags:
+            texto = b"\x03" + tags[clave].encode("utf-8")
+            marcos += marco.encode() + struct.pack(">I", len(texto)) + b"\x00\x00" + texto
+    tam = len(marcos)
+    sincro = bytes([(tam >> 21) & 0x7F, (tam >> 14) & 0x7F, (tam >> 7) & 0x7F, tam & 0x7F])
+    return b"ID3\x03\x00\x00" + sincro + marcos
+
+
+def _id3v1(tags):
+    def campo(valor, n):
+        return valor.encode("latin-1", "replace")[:n].ljust(n, b"\x00")
+
+    return (
+        b"TAG" + campo(tags.get("title", ""), 30) + campo(tags.get("artist", ""), 30)
+        + campo(tags.get("album", ""), 30) + b"2000" + b"\x00" * 30 + b"\xff"
+    )
+
+
+def imagen_portada(lado, semilla=0, progresiva=True):
+    """JPEG de lado x lado con algo de ruido (para que no comprima a nada)."""
+    rnd = random.Random(semilla)
+    img = Image.new("RGB", (lado, lado), (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    ruido = Image.effect_noise((lado, lado), 40).convert("RGB")
+    img = Image.blend(img, ruido, 0.3)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90, progressive=progresiva)
+    return buf.getvalue()
+
+
+def escribir_flac(path, tags, portada=None, segundos=1.0, padding=8192, id3=None):
+    """
+    Escribe un FLAC válido. tags: [(clave, valor)]; portada: (bytes, lado) o
+    None; id3: None, "v2" (delante) o "v1" (al final).
+    """
+    total = int(SAMPLE_RATE * segundos)
+    tramas = []
+    numero = 0
+    for inicio in range(0, total, BLOQUE):
+        tramas.append(_trama(numero, min(BLOQUE, total - inicio), valor=numero % 7))
+        numero += 1
+    tamanos = [len(t) for t in tramas]
+
+    bloques = [(0, _streaminfo(total, min(tamanos), max(tamanos))), (4, _vorbis(tags))]
+    if portada is not None:
+        imagen, lado = portada
+        bloques.append((6, _picture(imagen, "image/jpeg", lado, lado)))
+    if padding:
+        bloques.append((1, b"\x00" * padding))
+
+    dict_tags = {k: v for k, v in tags}
+    with open(path, "wb") as f:
+        if id3 == "v2":
+            f.write(_id3v2(dict_tags))
+        f.write(b"fLaC")
+        for i, (tipo, datos) in enumerate(bloques):
+            f.write(_bloque(tipo, datos, ultimo=i == len(bloques) - 1))
+        for t in tramas:
+            f.write(t)
+        if id3 == "v1":
+            f.write(_id3v1(dict_tags))
+
+
+def generar_biblioteca(destino, pistas=1000, tags=6, portada=500, con_portada=0.7, id3=0.1,
+                       padding=8192, por_album=10, carpetas=True, segundos=1.0, semilla=1, sin_album=0.2):
+    """
+    Genera la biblioteca y devuelve un resumen (dict) con lo generado.
+
+    tags: número de campos por pista (title/artist/album siempre que tags >= 3;
+    después tracknumber, genre, date y relleno tipo "comment"). con_portada, id3
+    y sin_album son fracciones de pistas; las "sin álbum" tampoco llevan género,
+    como las que completa rezagados.py. Con carpetas=True cada álbum va en su
+    carpeta Artista/Álbum; si no, todo va en la raíz.
+    """
+    rnd = random.Random(semilla)
+    os.makedirs(destino, exist_ok=True)
+    # Una imagen por álbum: así se ve el efecto de compartir portadas
+    portadas = {}
+    resumen = {"pistas": 0, "con_portada": 0, "con_id3": 0, "sin_album": 0, "bytes": 0}
+    for i in range(pistas):
+        album_n = i // por_album
+        artista = f"Artista {album_n % max(1, pistas // (por_album * 3) or 1)}"
+        album = f"Album {album_n}"
+        titulo = f"Cancion {i}"
+        campos = [("title", titulo), ("artist", artista), ("album", album)][:tags]
+        extra = [
+            ("tracknumber", str(i % por_album + 1)),
+            ("genre", rnd.choice(GENEROS)),
+            ("date", str(1970 + rnd.randrange(50))),
+        ]
+        campos += extra[: max(0, tags - 3)]
+        if rnd.random() < sin_album:
+            campos = [(k, v) for k, v in campos if k not in ("album", "genre")]
+        for j in range(max(0, tags - 6)):
+            campos.append((f"comment{j}", "x" * rnd.randrange(8, 64)))
+
+        portada_pista = None
+        if portada and rnd.random() < con_portada:
+            if album_n not in portadas:
+                portadas[album_n] = imagen_portada(portada, semilla=album_n)
+            portada_pista = (portadas[album_n], portada)
+        marca_id3 = None
+        if rnd.random() < id3:
+            marca_id3 = rnd.choice(("v1", "v2"))
+
+        carpeta = os.path.join(destino, artista, album) if carpetas else destino
+        os.makedirs(carpeta, exist_ok=True)
+        path = os.path.join(carpeta, f"{artista} - {titulo}.flac")
+        escribir_flac(path, campos, portada_pista, segundos, padding, marca_id3)
+        resumen["pistas"] += 1
+        resumen["con_portada"] += portada_pista is not None
+        resumen["con_id3"] += marca_id3 is not None
+        resumen["sin_album"] += not any(k == "album" for k, _ in campos)
+        resumen["bytes"] += os.path.getsize(path)
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una biblioteca FLAC sintética")
+    parser.add_argument("destino")
+    parser.add_argument("--pistas", type=int, default=1000)
+    parser.add_argument("--tags", type=int, default=6, help="campos de texto por pista")
+    parser.add_argument("--portada", type=int, default=500, help="lado de las portadas en px (0 = sin portadas)")
+    parser.add_argument("--con-portada", type=float, default=0.7, help="fracción de pistas con portada")
+    parser.add_argument("--id3", type=float, default=0.1, help="fracción de pistas con ID3")
+    parser.add_argument("--sin-album", type=float, default=0.2, help="fracción de pistas sin álbum ni género")
+    parser.add_argument("--padding", type=int, default=8192)
+    parser.add_argument("--por-album", type=int, default=10)
+    parser.add_argument("--plana", action="store_true", help="todo en la raíz, sin carpetas")
+    parser.add_argument("--segundos", type=float, default=1.0)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args(argv)
+    resumen = generar_biblioteca(
+        args.destino, args.pistas, args.tags, args.portada, args.con_portada, args.id3,
+        args.padding, args.por_album, not args.plana, args.segundos, args.semilla, args.sin_album,
+    )
+    print(f"✅ {resumen['pistas']} pistas ({resumen['bytes'] // 1024} KiB) en {args.destino}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita MusicBrainz (/ws/2, XML) y Cover Art Archive
+(/release/<id>/front[-250|-500|-1200]) para los benchmarks.
+
+Latencia y límite de peticiones configurables: por encima del límite responde
+503 como el MusicBrainz de verdad, así se mide también el coste de los
+reintentos. Las respuestas dependen de la consulta (ids estables por hash), de
+modo que las cachés se comportan igual que con el servicio real.
+
+Los scripts lo usan con:
+    ECHOMINI_MB_HOST=127.0.0.1:PUERTO ECHOMINI_MB_HTTPS=0
+    ECHOMINI_CAA_URL=http://127.0.0.1:PUERTO
+
+Uso: python bench/mock_servidor.py [--puerto 8766] [--latencia 0.05] [--limite 50]
+"""
+import argparse
+import hashlib
+import http.server
+import random
+import re
+import threading
+import time
+from collections import Counter
+from io import BytesIO
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+GENEROS = ("rock", "pop", "jazz", "electronic", "hip hop", "classical", "metal", "folk")
+LADOS = {"front": 1200, "front-250": 250, "front-500": 500, "front-1200": 1200}
+
+
+def _id(texto):
+    h = hashlib.sha1(texto.lower().encode("utf-8")).hexdigest()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+
+
+def _xml(interior):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" xmlns:ext="http://musicbrainz.org/ns/ext#-2.0">'
+        + interior + "</metadata>"
+    ).encode("utf-8")
+
+
+def _tags(semilla):
+    genero = GENEROS[int(hashlib.sha1(semilla.encode("utf-8")).hexdigest(), 16) % len(GENEROS)]
+    return f'<tag-list><tag count="3"><name>{genero}</name></tag></tag-list>'
+
+
+def _campo(query, nombre):
+    """Valor de `nombre:(...)` o `nombre:"..."` en una consulta Lucene de musicbrainzngs."""
+    m = (
+        re.search(r"\b" + nombre + r":\(((?:[^)\\]|\\.)*)\)", query)
+        or re.search(r"\b" + nombre + r':"((?:[^"\\]|\\.)*)"', query)
+    )
+    return re.sub(r"\\(.)", r"\1", m.group(1)) if m else ""
+
+
+class Limitador:
+    """Ventana deslizante de 1 s: más de `por_segundo` peticiones → 503."""
+
+    def __init__(self, por_segundo):
+        self.por_segundo = por_segundo
+        self._marcas = []
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        if not self.por_segundo:
+            return True
+        ahora = time.monotonic()
+        with self._lock:
+            self._marcas = [t for t in self._marcas if ahora - t < 1.0]
+            if len(self._marcas) >= self.por_segundo:
+                return False
+            self._marcas.append(ahora)
+            return True
+
+
+class MockServidor:
+    def __init__(self, puerto=0, latencia=0.0, jitter=0.0, limite_mb=0, limite_caa=0, sin_portada=0.1,
+                 vacias=0.0, releases=3):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.sin_portada = sin_portada
+        self.vacias = vacias
+        self.releases = releases
+        self.limite_mb = Limitador(limite_mb)
+        self.limite_caa = Limitador(limite_caa)
+        self.contadores = Counter()
+        self._lock = threading.Lock()
+        self._imagenes = {}
+        servidor = self
+
+        class Manejador(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                servidor._atender(self)
+
+        self._http = http.server.ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+        self._http.daemon_threads = True
+        self.puerto = self._http.server_address[1]
+        self._hilo = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.puerto}"
+
+    def entorno(self):
+        """Variables de entorno para apuntar los scripts a este servidor."""
+        return {
+            "ECHOMINI_MB_HOST": f"127.0.0.1:{self.puerto}",
+            "ECHOMINI_MB_HTTPS": "0",
+            "ECHOMINI_CAA_URL": self.url,
+        }
+
+    def arrancar(self):
+        self._hilo = threading.Thread(target=self._http.serve_forever, name="mock", daemon=True)
+        self._hilo.start()
+        return self
+
+    def parar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def _contar(self, clave):
+        with self._lock:
+            self.contadores[clave] += 1
+
+    def _responder(self, peticion, estado, cuerpo=b"", tipo="application/xml", cabeceras=None):
+        peticion.send_response(estado)
+        peticion.send_header("Content-Type", tipo)
+        peticion.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            peticion.send_header(clave, valor)
+        peticion.end_headers()
+        peticion.wfile.write(cuerpo)
+
+    def _atender(self, peticion):
+        partes = urlsplit(peticion.path)
+        ruta = partes.path
+        es_mb = ruta.startswith("/ws/2/")
+        self._contar("mb" if es_mb else "caa")
+        if not (self.limite_mb if es_mb else self.limite_caa).permitir():
+            self._contar("limitadas")
+            self._responder(peticion, 503, b"rate limited", "text/plain", {"Retry-After": "1"})
+            return
+        if self.latencia or self.jitter:
+            time.sleep(self.latencia + random.random() * self.jitter)
+        try:
+            if es_mb:
+                cuerpo = self._musicbrainz(ruta[len("/ws/2/"):].strip("/"), parse_qs(partes.query))
+                if cuerpo is None:
+                    self._responder(peticion, 404, _xml(""))
+                else:
+                    self._responder(peticion, 200, cuerpo)
+                return
+            m = re.match(r"^/release/([0-9a-f-]+)/(front(?:-\d+)?)$", ruta)
+            if not m or m.group(2) not in LADOS:
+                self._responder(peticion, 404, b"", "text/plain")
+                return
+            imagen = self._portada(m.group(1), LADOS[m.group(2)])
+            if imagen is None:
+                self._contar("sin_portada")
+                self._responder(peticion, 404, b"", "text/plain")
+            else:
+                self._responder(peticion, 200, imagen, "image/jpeg")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _vacia(self, query):
+        return int(hashlib.sha1(query.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF < self.vacias
+
+    def _musicbrainz(self, entidad, params):
+        query = unquote(params.get("query", [""])[0])
+        if entidad == "recording":
+            if self._vacia(query):
+                return _xml('<recording-list count="0"/>')
+            artista = _campo(query, "artist")
+            titulo = _campo(query, "recording")
+            releases = "".join(
+                f'<release id="{_id(artista + "|" + titulo + str(i))}"><title>{escape(titulo)} {i}</title></release>'
+                for i in range(self.releases)
+            )
+            return _xml(
+                f'<recording-list count="1"><recording id="{_id(artista + "|" + titulo)}" ext:score="100">'
+                f"<title>{escape(titulo)}</title>{_tags(artista + titulo)}"
+                f"<release-list>{releases}</release-list></recording></recording-list>"
+            )
+        if entidad == "release":
+            if self._vacia(query):
+                return _xml('<release-list count="0"/>')
+            artista = _campo(query, "artist")
+            album = _campo(query, "release") or query
+            releases = "".join(
+                f'<release id="{_id(artista + "|" + album + str(i))}" ext:score="{100 - i}"><title>{escape(album)}</title></release>'
+                for i in range(self.releases)
+            )
+            return _xml(f'<release-list count="{self.releases}">{releases}</release-list>')
+        if entidad == "artist":
+            if self._vacia(query):
+                return _xml('<artist-list count="0"/>')
+            nombre = _campo(query, "artist") or query
+            return _xml(
+                f'<artist-list count="1"><artist id="{_id(nombre)}" ext:score="100">'
+                f"<name>{escape(nombre)}</name></artist></artist-list>"
+            )
+        if entidad.startswith("recording/"):
+            mbid = entidad.split("/", 1)[1]
+            return _xml(f'<recording id="{mbid}"><title>Grabación</title>{_tags(mbid)}</recording>')
+        if entidad.startswith("artist/"):
+            mbid = entidad.split("/", 1)[1]
+            return _xml(f'<artist id="{mbid}"><name>Artista</name>{_tags(mbid)}</artist>')
+        return None
+
+    def _portada(self, release_id, lado):
+        if int(release_id[:8], 16) / 0xFFFFFFFF < self.sin_portada:
+            return None
+        with self._lock:
+            clave = (release_id[:2], lado)
+            if clave not in self._imagenes:
+                # Pocas imágenes distintas en memoria, pero con el tamaño real de cada variante
+                color = tuple(bytes.fromhex(release_id[:6]))
+                img = Image.blend(Image.new("RGB", (lado, lado), color),
+                                  Image.effect_noise((lado, lado), 40).convert("RGB"), 0.3)
+                buf = BytesIO()
+                img.save(buf, format="JPEG", quality=90)
+                self._imagenes[clave] = buf.getvalue()
+            return self._imagenes[clave]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor falso de MusicBrainz y Cover Art Archive")
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por petición")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latencia extra aleatoria (0..jitter)")
+    parser.add_argument("--limite-mb", type=float, default=0, help="peticiones/s a MB antes de dar 503 (0 = sin límite)")
+    parser.add_argument("--limite-caa", type=float, default=0, help="peticiones/s a CAA antes de dar 503")
+    parser.add_argument("--sin-portada", type=float, default=0.1, help="fracción de releases sin portada")
+    parser.add_argument("--vacias", type=float, default=0.0, help="fracción de búsquedas sin resultados")
+    args = parser.parse_args(argv)
+    servidor = MockServidor(args.puerto, args.latencia, args.jitter, args.limite_mb, args.limite_caa,
+                            args.sin_portada, args.vacias)
+    print(f"🎭 Mock MB/CAA en {servidor.url}")
+    for clave, valor in servidor.entorno().items():
+        print(f"   {clave}={valor}")
+    servidor.arrancar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Código compartido entre el backend y los scripts de Anteriores/
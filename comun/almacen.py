@@ -0,0 +1,121 @@
+"""
+Almacén de imágenes direccionado por contenido.
+
+Cada imagen se guarda una sola vez con su SHA-256 como nombre y un índice SQLite
+mapea claves (p.ej. release de Cover Art Archive + variante) a ese hash. Cuando
+el total pasa del máximo se borran las imágenes usadas hace más tiempo.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from comun.cache import ACCESO_PRECISION, CACHE_DIR
+
+MAX_BYTES = int(os.environ.get("ECHOMINI_PORTADAS_MAX", 1024 * 1024 * 1024))
+
+
+class AlmacenImagenes:
+    def __init__(self, directorio=None, max_bytes=MAX_BYTES):
+        self.dir = directorio or os.path.join(CACHE_DIR, "portadas")
+        self.max_bytes = max_bytes
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(self.dir, "indice.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objetos (
+                sha TEXT PRIMARY KEY,
+                tam INTEGER NOT NULL,
+                acceso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS objetos_acceso ON objetos (acceso);
+            CREATE TABLE IF NOT EXISTS claves (
+                clave TEXT PRIMARY KEY,
+                sha TEXT,
+                fecha REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    def _ruta(self, sha):
+        return os.path.join(self.dir, sha[:2], sha)
+
+    def buscar(self, clave):
+        """
+        Devuelve (conocida, bytes, fecha): (True, bytes, fecha) si la clave tiene
+        imagen, (True, None, fecha) si se sabe que no tiene y (False, None, None)
+        si no se conoce. Con la fecha el llamante decide si una entrada caduca.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT sha, fecha FROM claves WHERE clave = ?", (clave,)).fetchone()
+        if row is None:
+            return False, None, None
+        sha, fecha = row
+        if sha is None:
+            return True, None, fecha
+        data = self.leer(sha)
+        if data is None:
+            return False, None, None
+        return True, data, fecha
+
+    def leer(self, sha):
+        try:
+            with open(self._ruta(sha), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        ahora = time.time()
+        with self._lock:
+            # Como en CacheDisco: solo se apunta el uso si el anterior es de hace rato
+            row = self._db.execute("SELECT acceso FROM objetos WHERE sha = ?", (sha,)).fetchone()
+            if row and ahora - row[0] > ACCESO_PRECISION:
+                self._db.execute("UPDATE objetos SET acceso = ? WHERE sha = ?", (ahora, sha))
+                self._db.commit()
+        return data
+
+    def guardar(self, clave, data):
+        """Guarda la imagen (o None = no tiene) para la clave. Devuelve el hash."""
+        ahora = time.time()
+        sha = None
+        if data is not None:
+            sha = hashlib.sha256(data).hexdigest()
+            ruta = self._ruta(sha)
+            if not os.path.exists(ruta):
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, ruta)
+        with self._lock:
+            if sha is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO objetos VALUES (?, ?, ?)", (sha, len(data), ahora)
+                )
+            self._db.execute("INSERT OR REPLACE INTO claves VALUES (?, ?, ?)", (clave, sha, ahora))
+            self._db.commit()
+            if sha is not None:
+                self._evict()
+        return sha
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(tam), 0) FROM objetos").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        sobra = total - int(self.max_bytes * 0.9)
+        for sha, tam in self._db.execute("SELECT sha, tam FROM objetos ORDER BY acceso").fetchall():
+            try:
+                os.unlink(self._ruta(sha))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM objetos WHERE sha = ?", (sha,))
+            self._db.execute("DELETE FROM claves WHERE sha = ?", (sha,))
+            sobra -= tam
+            if sobra <= 0:
+                break
+        self._db.commit()
@@ -0,0 +1,91 @@
+"""
+Caché persistente clave -> valor JSON en SQLite, compartida entre ejecuciones y
+herramientas. Cada entrada caduca (TTL) y, si la caché pasa de su tamaño máximo,
+se borran las entradas usadas hace más tiempo.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get("ECHOMINI_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "echomini"
+)
+
+# Cada cuántas escrituras se comprueba el tamaño total
+_EVICT_CADA = 100
+# La fecha de último uso (para el LRU) solo se reescribe si tiene más de esto:
+# así una pasada en caliente no hace una escritura con fsync por cada acierto
+ACCESO_PRECISION = 3600
+
+
+class CacheDisco:
+    def __init__(self, nombre, ttl, max_bytes, directorio=None):
+        directorio = directorio or CACHE_DIR
+        os.makedirs(directorio, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directorio, f"{nombre}.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entradas (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL,
+                acceso REAL NOT NULL,
+                tam INTEGER NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entradas_acceso ON entradas (acceso)")
+        self._db.commit()
+
+    def get(self, clave):
+        """Devuelve (True, valor) si hay una entrada vigente, si no (False, None)."""
+        ahora = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT valor, expira, acceso FROM entradas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            if row[1] < ahora:
+                self._db.execute("DELETE FROM entradas WHERE clave = ?", (clave,))
+                self._db.commit()
+                return False, None
+            if ahora - row[2] > ACCESO_PRECISION:
+                self._db.execute("UPDATE entradas SET acceso = ? WHERE clave = ?", (ahora, clave))
+                self._db.commit()
+        return True, json.loads(row[0])
+
+    def set(self, clave, valor, ttl=None):
+        texto = json.dumps(valor, ensure_ascii=False)
+        ahora = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?)",
+                (clave, texto, ahora + (self.ttl if ttl is None else ttl), ahora, len(texto)),
+            )
+            self._db.commit()
+            self._escrituras += 1
+            if self._escrituras % _EVICT_CADA == 0:
+                self._evict()
+
+    def _evict(self):
+        self._db.execute("DELETE FROM entradas WHERE expira < ?", (time.time(),))
+        total = self._db.execute("SELECT COALESCE(SUM(tam), 0) FROM entradas").fetchone()[0]
+        if total > self.max_bytes:
+            # Borrar las menos usadas hasta bajar al 90% del máximo
+            sobra = total - int(self.max_bytes * 0.9)
+            borrar = []
+            for clave, tam in self._db.execute("SELECT clave, tam FROM entradas ORDER BY acceso"):
+                borrar.append((clave,))
+                sobra -= tam
+                if sobra <= 0:
+                    break
+            self._db.executemany("DELETE FROM entradas WHERE clave = ?", borrar)
+        self._db.commit()
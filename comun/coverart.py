@@ -0,0 +1,101 @@
+"""
+Descarga de portadas de Cover Art Archive.
+
+Las peticiones pasan por el planificador de red y usan una sesión HTTP con
+conexiones reutilizables y timeout. Las imágenes se guardan en el almacén
+local por contenido (comun.almacen), así que una release ya descargada, en esta
+ejecución o en otra, y desde cualquier herramienta, se sirve desde disco.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from comun import metricas
+from comun.almacen import AlmacenImagenes
+from comun.imagenes import variante_caa
+from comun.planificador import (
+    HOST_CAA,
+    PRIORIDAD_NORMAL,
+    URL_CAA,
+    CODIGOS_TRANSITORIOS,
+    Cancelado,
+    ErrorTransitorio,
+    planificador,
+)
+
+TIMEOUT = 15
+# Cuánto se recuerda que una release no tiene portada
+TTL_NEGATIVO = float(os.environ.get("ECHOMINI_CAA_TTL_NEGATIVO", 7 * 24 * 3600))
+
+_sesion = None
+_almacen = None
+_lock = threading.Lock()
+
+_cache_consultas = metricas.contador("echomini_cache_requests_total", "Consultas a las cachés locales")
+_descargas = metricas.contador("echomini_cover_downloads_total", "Descargas de portadas de Cover Art Archive")
+
+
+def sesion():
+    """Sesión HTTP compartida (pool de conexiones keep-alive)."""
+    global _sesion
+    with _lock:
+        if _sesion is None:
+            _sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            _sesion.mount("http://", adaptador)
+            _sesion.mount("https://", adaptador)
+            _sesion.headers["User-Agent"] = "EchoMiniNormalizer/1.0"
+        return _sesion
+
+
+def almacen():
+    global _almacen
+    with _lock:
+        if _almacen is None:
+            _almacen = AlmacenImagenes()
+        return _almacen
+
+
+def _get(url):
+    resp = sesion().get(url, timeout=TIMEOUT)
+    if resp.status_code == 200:
+        return resp.content
+    if resp.status_code in CODIGOS_TRANSITORIOS:
+        raise ErrorTransitorio(f"HTTP {resp.status_code} en {url}")
+    return None
+
+
+def descargar_portada(release_id, variante=None, prioridad=PRIORIDAD_NORMAL, cancelado=None):
+    """
+    Devuelve los bytes de la portada de una release, o None si no tiene. Por
+    defecto baja la variante más pequeña que llega al tamaño de incrustado.
+    Si tras los reintentos sigue fallando la red, avisa y devuelve None.
+    Con `cancelado` (threading.Event) la espera se puede cortar: lanza Cancelado.
+    """
+    variante = variante or variante_caa()
+    clave = f"caa:{release_id}/{variante}"
+    conocida, data, fecha = almacen().buscar(clave)
+    if conocida and (data is not None or time.time() - fecha < TTL_NEGATIVO):
+        _cache_consultas.inc(cache="coverart", result="hit")
+        return data
+    _cache_consultas.inc(cache="coverart", result="miss")
+
+    url = f"{URL_CAA}/release/{release_id}/{variante}"
+    try:
+        with metricas.etapas.medir(stage="cover_download"):
+            data = planificador.ejecutar(
+                HOST_CAA, _get, (url,), clave=url, prioridad=prioridad, cancelado=cancelado
+            )
+    except Cancelado:
+        _descargas.inc(result="cancelled")
+        raise
+    except Exception as e:
+        _descargas.inc(result="error")
+        print(f"⚠️ No se pudo descargar la portada {release_id}: {e}")
+        return None
+    _descargas.inc(result="ok" if data is not None else "not_found")
+    almacen().guardar(clave, data)
+    return data
@@ -0,0 +1,125 @@
+"""
+Diario de procesamiento de los normalizadores.
+
+Por cada archivo se apunta (ruta, mtime, tamaño, resultado, fecha) en cuanto
+termina, así que una ejecución cortada (Ctrl-C, cuelgue) se retoma donde se
+quedó y una pasada sobre una biblioteca ya procesada solo hace un stat() por
+archivo. Si el archivo cambia (mtime o tamaño) se vuelve a procesar.
+
+Modos:
+  - MODO_INCREMENTAL: salta los archivos sin cambios que ya tienen resultado.
+  - MODO_REINTENTAR: solo los que fallaron o quedaron incompletos.
+  - MODO_COMPLETO: todos, ignorando el diario (pero lo sigue actualizando).
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from comun import metricas
+from comun.cache import CACHE_DIR
+
+# Resultados
+OK = "ok"  # normalizado / completo
+INCOMPLETO = "incompleto"  # procesado, pero faltan datos (sin género, sin portada...)
+ERROR = "error"
+
+MODO_INCREMENTAL = "incremental"
+MODO_REINTENTAR = "reintentar"
+MODO_COMPLETO = "completo"
+
+
+_resultados = metricas.contador("echomini_files_total", "Archivos procesados por resultado (ok, incompleto, error)")
+
+
+class Diario:
+    def __init__(self, nombre, directorio=None):
+        self.nombre = nombre
+        directorio = directorio or CACHE_DIR
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directorio, f"diario-{nombre}.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS archivos (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                tam INTEGER NOT NULL,
+                resultado TEXT NOT NULL,
+                fecha REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def _entradas(self, archivos):
+        rutas = [os.path.abspath(p) for p in archivos]
+        entradas = {}
+        with self._lock:
+            # Por trozos: SQLite limita el número de parámetros por consulta
+            for i in range(0, len(rutas), 500):
+                trozo = rutas[i:i + 500]
+                marcas = ",".join("?" * len(trozo))
+                for path, mtime_ns, tam, resultado in self._db.execute(
+                    f"SELECT path, mtime_ns, tam, resultado FROM archivos WHERE path IN ({marcas})", trozo
+                ):
+                    entradas[path] = (mtime_ns, tam, resultado)
+        return entradas
+
+    def pendientes(self, archivos, modo=MODO_INCREMENTAL):
+        """
+        Filtra la lista de archivos según el modo. Devuelve (pendientes, saltados).
+        Se llama por lotes (p.ej. carpeta a carpeta): solo consulta esos archivos.
+        """
+        if modo == MODO_COMPLETO:
+            return list(archivos), 0
+        entradas = self._entradas(archivos)
+        pendientes = []
+        for path in archivos:
+            entrada = entradas.get(os.path.abspath(path))
+            if modo == MODO_REINTENTAR:
+                if entrada is not None and entrada[2] != OK:
+                    pendientes.append(path)
+                continue
+            if entrada is None:
+                pendientes.append(path)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_mtime_ns, st.st_size) != entrada[:2]:
+                pendientes.append(path)
+        return pendientes, len(archivos) - len(pendientes)
+
+    def apuntar(self, path, resultado):
+        """Apunta el resultado con el mtime/tamaño actuales (después de guardar)."""
+        _resultados.inc(tool=self.nombre, result=resultado)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(path), st.st_mtime_ns, st.st_size, resultado, time.time()),
+            )
+            self._db.commit()
+
+
+def agregar_argumentos(parser):
+    """Opciones comunes de línea de comandos para elegir el modo."""
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument(
+        "--retry-failed", action="store_true", help="solo reprocesar los fallos e incompletos anteriores"
+    )
+    grupo.add_argument("--full", action="store_true", help="procesar todo, ignorando el diario")
+
+
+def modo_de(args):
+    if args.retry_failed:
+        return MODO_REINTENTAR
+    if args.full:
+        return MODO_COMPLETO
+    return MODO_INCREMENTAL
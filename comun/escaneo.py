@@ -0,0 +1,78 @@
+"""
+Ejecutor para leer muchos archivos en paralelo, con hilos o con procesos.
+
+Parsear cabeceras y tags es Python puro y no suelta el GIL, así que con hilos
+solo trabaja un núcleo. En modo "procesos" la lista se parte en trozos que se
+reparten entre procesos; cada uno devuelve registros compactos (dicts, tuplas,
+nada de objetos de mutagen) y el padre los recibe en orden. La función tiene
+que ser de módulo (se pasa por pickle) y devolver datos simples.
+
+El modo se elige con ECHOMINI_ESCANEO=hilos|procesos.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+HILOS = "hilos"
+PROCESOS = "procesos"
+
+MODO = os.environ.get("ECHOMINI_ESCANEO", HILOS)
+# Archivos por trozo en modo procesos: menos viajes entre procesos
+TROZO = int(os.environ.get("ECHOMINI_ESCANEO_TROZO", 32))
+
+
+def _aplicar(fn, trozo):
+    return [fn(*args) for args in trozo]
+
+
+class Escaner:
+    def __init__(self, modo=None, workers=None, trozo=TROZO):
+        self.modo = modo or MODO
+        if self.modo not in (HILOS, PROCESOS):
+            raise ValueError(f"Modo de escaneo desconocido: {self.modo}")
+        cpus = os.cpu_count() or 1
+        if self.modo == PROCESOS:
+            self.workers = workers or cpus
+            self.trozo = trozo
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.workers = workers or min(32, cpus * 4)
+            self.trozo = 1
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="escaneo")
+
+    def map(self, fn, *iterables):
+        """
+        Como Executor.map: devuelve fn(*args) en el mismo orden que la entrada.
+        Consume la entrada poco a poco (como mucho 2 trozos por worker en
+        curso), así que sirve también para generadores largos.
+        """
+        pendientes = deque()
+        trozo = []
+        for args in zip(*iterables):
+            trozo.append(args)
+            if len(trozo) >= self.trozo:
+                pendientes.append(self._pool.submit(_aplicar, fn, trozo))
+                trozo = []
+                while len(pendientes) >= 2 * self.workers:
+                    yield from pendientes.popleft().result()
+        if trozo:
+            pendientes.append(self._pool.submit(_aplicar, fn, trozo))
+        while pendientes:
+            yield from pendientes.popleft().result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_escaner = None
+_lock = threading.Lock()
+
+
+def escaner():
+    """Escáner compartido del proceso, con el modo de ECHOMINI_ESCANEO."""
+    global _escaner
+    with _lock:
+        if _escaner is None:
+            _escaner = Escaner()
+        return _escaner
@@ -0,0 +1,213 @@
+"""
+Lector ligero de metadatos FLAC.
+
+Recorre las cabeceras de los bloques de metadatos y solo decodifica
+STREAMINFO y VORBIS_COMMENT. De los bloques PICTURE lee la cabecera (tipo,
+MIME, dimensiones) y apunta el offset y tamaño de la imagen, pero salta sus
+datos con seek; PADDING y el resto de bloques tampoco se leen. Para escanear
+una biblioteca es mucho más barato que construir un mutagen.flac.FLAC, que
+carga en memoria todas las imágenes incrustadas.
+"""
+import os
+import struct
+
+from comun import metricas
+
+STREAMINFO = 0
+PADDING = 1
+VORBIS_COMMENT = 4
+PICTURE = 6
+
+
+class ErrorFlac(Exception):
+    pass
+
+
+class Portada:
+    """Imagen incrustada; offset/length apuntan a los bytes de la imagen en el archivo."""
+
+    __slots__ = ("type", "mime", "desc", "width", "height", "depth", "offset", "length")
+
+    def __init__(self, type, mime, desc, width, height, depth, offset, length):
+        self.type = type
+        self.mime = mime
+        self.desc = desc
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.offset = offset
+        self.length = length
+
+
+class InfoFlac:
+    def __init__(self, path):
+        self.path = path
+        self.tags = {}  # clave en minúsculas -> lista de valores
+        self.vendor = ""
+        self.sample_rate = 0
+        self.channels = 0
+        self.bits_per_sample = 0
+        self.total_samples = 0
+        self.pictures = []
+        self.padding = 0
+        self.id3v2 = 0  # bytes de ID3v2 delante de "fLaC"
+        self.audio_offset = 0
+        self.file_size = 0
+
+    @property
+    def length(self):
+        return self.total_samples / float(self.sample_rate) if self.sample_rate else 0.0
+
+    @property
+    def bitrate(self):
+        # Igual que mutagen: bits de audio / duración
+        if not self.length:
+            return 0
+        return int((self.file_size - self.audio_offset) * 8 / self.length)
+
+    def get(self, key, default=None):
+        return self.tags.get(key.lower(), default)
+
+    def __contains__(self, key):
+        return key.lower() in self.tags
+
+    def first(self, key, default=""):
+        return self.tags.get(key.lower(), [default])[0]
+
+
+def _leer(f, n):
+    """Lee exactamente n bytes: si el archivo se acaba antes, está truncado."""
+    data = f.read(n)
+    if len(data) != n:
+        raise ErrorFlac("Archivo truncado")
+    return data
+
+
+def _leer_id3v2(f):
+    """Si el archivo empieza con ID3v2 devuelve su tamaño total, si no 0."""
+    head = f.read(10)
+    if len(head) == 10 and head[:3] == b"ID3":
+        size = 0
+        for b in head[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        footer = 10 if head[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _decodificar_streaminfo(info, data):
+    if len(data) < 18:
+        raise ErrorFlac("STREAMINFO demasiado corto")
+    packed = int.from_bytes(data[10:18], "big")
+    info.sample_rate = packed >> 44
+    info.channels = ((packed >> 41) & 0x7) + 1
+    info.bits_per_sample = ((packed >> 36) & 0x1F) + 1
+    info.total_samples = packed & 0xFFFFFFFFF
+
+
+def _decodificar_vorbis(info, data):
+    pos = 0
+    (vendor_len,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    info.vendor = data[pos:pos + vendor_len].decode("utf-8", "replace")
+    pos += vendor_len
+    (count,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    for _ in range(count):
+        (length,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        if pos + length > len(data):
+            raise ErrorFlac("VORBIS_COMMENT corrupto")
+        comment = data[pos:pos + length].decode("utf-8", "replace")
+        pos += length
+        key, sep, value = comment.partition("=")
+        if sep:
+            info.tags.setdefault(key.lower(), []).append(value)
+
+
+def _leer_cabecera_picture(f, block_offset, block_length):
+    """Lee la cabecera del bloque PICTURE sin cargar la imagen."""
+    fin = block_offset + block_length
+
+    def leer(n):
+        if f.tell() + n > fin:
+            raise ErrorFlac("Bloque PICTURE corrupto")
+        return _leer(f, n)
+
+    def u32():
+        return struct.unpack(">I", leer(4))[0]
+
+    pic_type = u32()
+    mime = leer(u32()).decode("ascii", "replace")
+    desc = leer(u32()).decode("utf-8", "replace")
+    width, height, depth, _colors, data_len = struct.unpack(">5I", leer(20))
+    data_offset = f.tell()
+    if data_offset + data_len > block_offset + block_length:
+        raise ErrorFlac("Bloque PICTURE corrupto")
+    return Portada(pic_type, mime, desc, width, height, depth, data_offset, data_len)
+
+
+def leer_flac(path):
+    """Lee STREAMINFO, tags y cabeceras de imágenes de un FLAC."""
+    with metricas.etapas.medir(stage="parse"):
+        try:
+            return _leer_flac(path)
+        except struct.error as e:
+            # Cualquier cabecera corta que se haya escapado: para el llamante es un FLAC corrupto
+            raise ErrorFlac(f"Cabecera corrupta: {e}")
+
+
+def _leer_flac(path):
+    info = InfoFlac(path)
+    with open(path, "rb") as f:
+        info.file_size = os.fstat(f.fileno()).st_size
+        info.id3v2 = _leer_id3v2(f)
+        f.seek(info.id3v2)
+        if f.read(4) != b"fLaC":
+            raise ErrorFlac(f"No es un FLAC: {path}")
+
+        seen_streaminfo = False
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                raise ErrorFlac("Metadatos truncados")
+            last = bool(header[0] & 0x80)
+            block_type = header[0] & 0x7F
+            length = int.from_bytes(header[1:4], "big")
+            start = f.tell()
+
+            if block_type == STREAMINFO:
+                _decodificar_streaminfo(info, _leer(f, length))
+                seen_streaminfo = True
+            elif block_type == VORBIS_COMMENT:
+                try:
+                    _decodificar_vorbis(info, _leer(f, length))
+                except struct.error:
+                    raise ErrorFlac("VORBIS_COMMENT corrupto")
+            elif block_type == PICTURE:
+                info.pictures.append(_leer_cabecera_picture(f, start, length))
+            elif block_type == PADDING:
+                info.padding += length
+            f.seek(start + length)
+
+        if not seen_streaminfo or not info.sample_rate:
+            raise ErrorFlac("Falta el bloque STREAMINFO")
+        info.audio_offset = f.tell()
+    return info
+
+
+def leer_portada(path, portada):
+    """Lee los bytes de una imagen a partir de su offset."""
+    with open(path, "rb") as f:
+        f.seek(portada.offset)
+        return f.read(portada.length)
+
+
+def tiene_portada_valida(path):
+    """True si el FLAC tiene al menos una imagen con mime image/…"""
+    try:
+        info = leer_flac(path)
+    except (OSError, ErrorFlac):
+        return False
+    return any(p.mime.startswith("image/") for p in info.pictures)
@@ -0,0 +1,101 @@
+"""
+Guardado de FLAC aprovechando el PADDING.
+
+Si los bloques nuevos caben en el espacio de metadatos actual (bloques + padding)
+solo se reescribe la cabecera en su sitio. Si no caben, el archivo entero hay que
+reescribirlo: se hace sobre una copia temporal que luego se renombra encima del
+original, dejando PADDING_MINIMO bytes de margen para que las siguientes
+ediciones ya quepan.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from mutagen.flac import FLAC
+
+from comun import metricas
+from comun.flacmeta import leer_flac
+
+# Padding que se deja cuando hay que reescribir el archivo (bytes)
+PADDING_MINIMO = int(os.environ.get("ECHOMINI_PADDING", 64 * 1024))
+
+_lock = threading.Lock()
+_contadores = {"en_sitio": 0, "reescrituras": 0}
+_guardados = metricas.contador("echomini_saves_total", "Guardados de FLAC, en el sitio o reescribiendo el archivo")
+
+
+class _NoCabe(Exception):
+    pass
+
+
+def _contar(clave):
+    with _lock:
+        _contadores[clave] += 1
+    _guardados.inc(mode="in_place" if clave == "en_sitio" else "rewrite")
+
+
+def contadores():
+    """Cuántos guardados se hicieron en el sitio y cuántos reescribieron el archivo."""
+    with _lock:
+        return dict(_contadores)
+
+
+def _solo_en_sitio(info):
+    # mutagen llama a esto antes de escribir nada: si no cabe, abortamos
+    if info.padding < 0:
+        raise _NoCabe()
+    return info.padding
+
+
+def politica_padding(info, minimo=None):
+    """Nunca encoge el padding existente; si falta, deja al menos `minimo`."""
+    minimo = PADDING_MINIMO if minimo is None else minimo
+    if info.padding >= 0:
+        return info.padding
+    return minimo
+
+
+def _reescribir(audio, path, padding, deleteid3=False):
+    fd, tmp = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp)
+        shutil.copymode(path, tmp)
+        audio.save(tmp, padding=padding, deleteid3=deleteid3)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def guardar(audio, path=None, deleteid3=False):
+    """
+    Guarda un mutagen.flac.FLAC. Devuelve True si se pudo hacer en el sitio.
+    """
+    path = path or audio.filename
+    with metricas.etapas.medir(stage="save"):
+        try:
+            audio.save(path, padding=_solo_en_sitio, deleteid3=deleteid3)
+        except _NoCabe:
+            _reescribir(audio, path, politica_padding, deleteid3)
+            _contar("reescrituras")
+            return False
+    _contar("en_sitio")
+    return True
+
+
+def repad(path, padding=None):
+    """
+    Deja al menos `padding` bytes de PADDING en el archivo, sin tocar los tags.
+    Devuelve False si ya tenía suficiente.
+    """
+    padding = PADDING_MINIMO if padding is None else padding
+    # Comprobación barata: solo cabeceras, sin cargar las imágenes
+    if leer_flac(path).padding >= padding:
+        return False
+    audio = FLAC(path)
+    _reescribir(audio, path, lambda info: max(info.padding, padding))
+    _contar("reescrituras")
+    return True
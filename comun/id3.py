@@ -0,0 +1,57 @@
+"""
+Detección y limpieza de tags ID3 en FLAC sin procesos externos.
+
+Algunos programas dejan un ID3v2 delante de "fLaC" o un ID3v1 en los últimos
+128 bytes. Aquí se detectan leyendo solo esos bytes y sus campos se pasan a
+Vorbis comments; al guardar con deleteid3=True (ver comun.sesion) el archivo
+queda sin ID3 en la misma escritura.
+"""
+import os
+
+from mutagen.id3 import ID3, ID3NoHeaderError
+
+# Frame ID3 -> campo Vorbis
+MAPEO_ID3 = {
+    "TIT2": "title",
+    "TPE1": "artist",
+    "TPE2": "albumartist",
+    "TALB": "album",
+    "TRCK": "tracknumber",
+    "TPOS": "discnumber",
+    "TCON": "genre",
+    "TDRC": "date",
+}
+
+
+def detectar_id3(path):
+    """Devuelve (tiene_id3v2, tiene_id3v1)."""
+    with open(path, "rb") as f:
+        v2 = f.read(3) == b"ID3"
+        size = os.fstat(f.fileno()).st_size
+        v1 = False
+        if size >= 128:
+            f.seek(-128, 2)
+            v1 = f.read(3) == b"TAG"
+    return v2, v1
+
+
+def leer_id3(path):
+    """Campos Vorbis equivalentes a los frames ID3 (v2 o, si no hay, v1)."""
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        return {}
+    campos = {}
+    for frame, clave in MAPEO_ID3.items():
+        if frame in tags and tags[frame].text:
+            campos[clave] = str(tags[frame].text[0])
+    return campos
+
+
+def aplicar_id3(audio, path):
+    """Copia los campos ID3 al FLAC cargado (sin guardar). Devuelve los campos."""
+    campos = leer_id3(path)
+    for clave, valor in campos.items():
+        audio[clave] = valor
+    return campos
+
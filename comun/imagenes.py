@@ -0,0 +1,96 @@
+"""
+Optimización de portadas para el Echo Mini.
+
+Cada imagen se decodifica una vez, se reduce a un lado máximo configurable y se
+recodifica como JPEG baseline (el reproductor carga mal los progresivos y las
+imágenes grandes). El bloque PICTURE lleva las dimensiones reales. Como
+decodificar y recodificar es CPU pura, se puede mandar a un pool de procesos
+para usar todos los núcleos.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from mutagen.flac import Picture
+from PIL import Image
+
+from comun import metricas
+
+MAX_LADO = int(os.environ.get("ECHOMINI_PORTADA_MAX", 500))
+CALIDAD = int(os.environ.get("ECHOMINI_PORTADA_CALIDAD", 85))
+PROCESOS = int(os.environ.get("ECHOMINI_PORTADA_PROCESOS", 0)) or os.cpu_count() or 1
+
+# Tamaños que sirve Cover Art Archive además del original
+_VARIANTES_CAA = (250, 500, 1200)
+
+_pool = None
+_lock = threading.Lock()
+
+
+def variante_caa(max_lado=MAX_LADO):
+    """La variante de CAA más pequeña que llega al lado máximo (no se descarga de más)."""
+    for lado in _VARIANTES_CAA:
+        if lado >= max_lado:
+            return f"front-{lado}"
+    return "front"
+
+
+def necesita_optimizar(img, max_lado=MAX_LADO):
+    return (
+        img.format != "JPEG"
+        or img.info.get("progressive")
+        or img.info.get("progression")
+        or max(img.size) > max_lado
+        or img.mode not in ("RGB", "L")
+    )
+
+
+def optimizar(data, max_lado=MAX_LADO, calidad=CALIDAD):
+    """
+    Devuelve (jpeg, ancho, alto). Si la imagen ya es un JPEG baseline dentro
+    del tamaño se devuelve tal cual, para no perder calidad recodificando.
+    """
+    img = Image.open(BytesIO(data))
+    if not necesita_optimizar(img, max_lado):
+        return data, img.width, img.height
+    img.draft("RGB", (max_lado, max_lado))  # los JPEG grandes se decodifican ya reducidos
+    img = img.convert("RGB")
+    img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=calidad, optimize=True, progressive=False)
+    return buf.getvalue(), img.width, img.height
+
+
+def crear_picture(data, max_lado=MAX_LADO, calidad=CALIDAD, optimizada=None):
+    """Picture de portada frontal ya optimizada y con sus dimensiones reales."""
+    jpeg, ancho, alto = optimizada or optimizar(data, max_lado, calidad)
+    pic = Picture()
+    pic.data = jpeg
+    pic.type = 3
+    pic.mime = "image/jpeg"
+    pic.desc = "Cover"
+    pic.width = ancho
+    pic.height = alto
+    pic.depth = 24
+    return pic
+
+
+def pool():
+    """Pool de procesos compartido para optimizar (se crea al primer uso)."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESOS)
+        return _pool
+
+
+def optimizar_en_pool(data, max_lado=MAX_LADO, calidad=CALIDAD):
+    """Como optimizar(), pero en el pool de procesos. Bloquea hasta tenerla."""
+    # Se mide desde aquí (incluye la espera en el pool): en el proceso hijo no se vería
+    with metricas.etapas.medir(stage="image"):
+        return pool().submit(optimizar, data, max_lado, calidad).result()
+
+
+def picture_en_pool(data, max_lado=MAX_LADO, calidad=CALIDAD):
+    return crear_picture(data, optimizada=optimizar_en_pool(data, max_lado, calidad))
@@ -0,0 +1,339 @@
+"""
+Índice local de MusicBrainz construido a partir de un volcado JSON.
+
+MusicBrainz publica volcados JSON de cada entidad: una entidad por línea,
+normalmente dentro de un .tar.xz con el archivo mbdump/<entidad>. Este módulo
+importa artistas, grabaciones y releases (enteros o un subconjunto, en uno o
+varios archivos) a un SQLite compacto que asocia nombres normalizados con su
+MBID, su etiqueta principal y las releases en que aparecen.
+
+comun.musicbrainz consulta el índice antes de ir a la red, así que una
+biblioteca cuyos artistas están en el índice se procesa a velocidad de disco.
+En el campo del género, NULL significa que el volcado no traía etiquetas (no
+se sabe) y '' que las traía vacías (se sabe que no tiene): en ese caso tampoco
+se pregunta a la red.
+
+Uso: python Anteriores/importar_mb.py artist.tar.xz recording.tar.xz release.tar.xz
+"""
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sqlite3
+import tarfile
+import threading
+import unicodedata
+from collections import Counter
+
+from comun import metricas
+from comun.cache import CACHE_DIR
+
+RUTA = os.environ.get("ECHOMINI_MB_INDICE") or os.path.join(CACHE_DIR, "indice_mb.sqlite3")
+TIPOS = ("artist", "recording", "release")
+
+# Filas por transacción al importar
+_LOTE = 5000
+
+_indice = None
+_indice_lock = threading.Lock()
+_cache_consultas = metricas.contador("echomini_cache_requests_total", "Consultas a las cachés locales")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS artistas (
+    nombre TEXT PRIMARY KEY,
+    mbid TEXT NOT NULL,
+    genero TEXT,
+    peso INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS grabaciones (
+    artista TEXT NOT NULL,
+    titulo TEXT NOT NULL,
+    mbid TEXT NOT NULL,
+    genero TEXT,
+    peso INTEGER NOT NULL,
+    release_id TEXT,
+    album TEXT,
+    artista_txt TEXT,
+    titulo_txt TEXT,
+    PRIMARY KEY (artista, titulo)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS releases (
+    artista TEXT NOT NULL,
+    titulo TEXT NOT NULL,
+    mbid TEXT NOT NULL,
+    PRIMARY KEY (artista, titulo, mbid)
+) WITHOUT ROWID;
+"""
+
+# Varios artistas o grabaciones con el mismo nombre: se queda el de más votos en
+# sus etiquetas (como el primero de una búsqueda), y los alias y las pistas sin
+# etiquetas (peso -1) nunca pisan a un nombre principal
+_SQL_ARTISTA = """
+INSERT INTO artistas VALUES (?, ?, ?, ?)
+ON CONFLICT (nombre) DO UPDATE SET mbid = excluded.mbid, genero = excluded.genero, peso = excluded.peso
+WHERE excluded.peso > artistas.peso
+"""
+_SQL_GRABACION = """
+INSERT INTO grabaciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (artista, titulo) DO UPDATE SET
+    mbid = CASE WHEN excluded.peso > grabaciones.peso THEN excluded.mbid ELSE grabaciones.mbid END,
+    genero = CASE WHEN excluded.peso > grabaciones.peso THEN excluded.genero
+                  ELSE COALESCE(grabaciones.genero, excluded.genero) END,
+    peso = MAX(grabaciones.peso, excluded.peso),
+    release_id = COALESCE(grabaciones.release_id, excluded.release_id),
+    album = CASE WHEN grabaciones.release_id IS NULL THEN excluded.album ELSE grabaciones.album END,
+    artista_txt = COALESCE(grabaciones.artista_txt, excluded.artista_txt),
+    titulo_txt = COALESCE(grabaciones.titulo_txt, excluded.titulo_txt)
+"""
+_SQL_RELEASE = "INSERT OR IGNORE INTO releases VALUES (?, ?, ?)"
+
+
+def normalizar(texto):
+    """Clave de búsqueda: sin diferencias de mayúsculas, espacios ni formas Unicode."""
+    return " ".join(unicodedata.normalize("NFKC", texto).casefold().split())
+
+
+def _genero(entidad):
+    """(etiqueta principal, votos totales); (None, -1) si la entidad no trae etiquetas."""
+    if "tags" not in entidad:
+        return None, -1
+    tags = [t for t in entidad["tags"] or [] if t.get("name")]
+    if not tags:
+        return "", 0
+    principal = max(tags, key=lambda t: int(t.get("count", 0)))
+    return principal["name"].capitalize(), sum(int(t.get("count", 0)) for t in tags)
+
+
+def _credito(entidad):
+    """(frase completa del crédito, nombres de cada artista acreditado)."""
+    creditos = entidad.get("artist-credit") or []
+    frase = "".join(c.get("name", "") + (c.get("joinphrase") or "") for c in creditos)
+    return frase, [c.get("name") or c.get("artist", {}).get("name", "") for c in creditos]
+
+
+def _nombres(frase, nombres):
+    # Se indexa por el crédito completo ("A feat. B") y por cada artista suelto
+    claves = {normalizar(frase)} if frase else set()
+    claves.update(normalizar(n) for n in nombres if n)
+    return claves
+
+
+def _tipo_de(nombre):
+    base = os.path.basename(nombre).split(".")[0]
+    return base if base in TIPOS else None
+
+
+def _tipo_por_campos(entidad):
+    if "media" in entidad:
+        return "release"
+    if "video" in entidad or "length" in entidad:
+        return "recording"
+    if "sort-name" in entidad and "title" not in entidad:
+        return "artist"
+    return None
+
+
+def _abrir(ruta):
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, "rb")
+    if ruta.endswith(".bz2"):
+        return bz2.open(ruta, "rb")
+    if ruta.endswith(".xz"):
+        return lzma.open(ruta, "rb")
+    return open(ruta, "rb")
+
+
+def _lineas(ruta):
+    """Genera (tipo por nombre o None, línea) de un volcado: .tar[.xz|.gz|.bz2] o JSON por líneas."""
+    if ".tar" in os.path.basename(ruta) or ruta.endswith(".tgz"):
+        # En streaming: los volcados completos no caben en memoria ni en /tmp
+        with tarfile.open(ruta, "r|*") as tar:
+            for miembro in tar:
+                tipo = _tipo_de(miembro.name)
+                if not miembro.isfile() or not tipo:
+                    continue  # README, TIMESTAMP, JSON_DUMPS_SCHEMA_NUMBER...
+                for linea in tar.extractfile(miembro):
+                    yield tipo, linea
+        return
+    with _abrir(ruta) as f:
+        tipo = _tipo_de(ruta)
+        for linea in f:
+            yield tipo, linea
+
+
+class IndiceMB:
+    def __init__(self, ruta=RUTA, escritura=False):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        if escritura:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+            self._db = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+            self._db.executescript(_ESQUEMA)
+            self._db.commit()
+        else:
+            self._db = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+    # ---- consultas ----
+
+    def _fila(self, sql, args):
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()
+
+    def artista(self, nombre):
+        """{"mbid", "genero"} del artista, o None si no está en el índice."""
+        fila = self._fila("SELECT mbid, genero FROM artistas WHERE nombre = ?", (normalizar(nombre),))
+        return {"mbid": fila[0], "genero": fila[1]} if fila else None
+
+    def grabacion(self, artista, titulo):
+        """Datos de la grabación (MBID, género, release, nombres tal cual), o None."""
+        fila = self._fila(
+            "SELECT mbid, genero, release_id, album, artista_txt, titulo_txt FROM grabaciones"
+            " WHERE artista = ? AND titulo = ?",
+            (normalizar(artista), normalizar(titulo)),
+        )
+        if not fila:
+            return None
+        claves = ("mbid", "genero", "release_id", "album", "artist", "title")
+        return dict(zip(claves, fila))
+
+    def releases(self, artista, titulo, limit=2):
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT mbid FROM releases WHERE artista = ? AND titulo = ? LIMIT ?",
+                (normalizar(artista), normalizar(titulo), limit),
+            ).fetchall()
+        return [f[0] for f in filas]
+
+    # ---- importación ----
+
+    def _filas(self, tipo, e):
+        """Filas (tabla, valores) que aporta una entidad del volcado."""
+        genero, peso = _genero(e)
+        if tipo == "artist":
+            yield "artistas", (normalizar(e["name"]), e["id"], genero, max(peso, 0))
+            for alias in e.get("aliases") or []:
+                if alias.get("name"):
+                    yield "artistas", (normalizar(alias["name"]), e["id"], genero, -1)
+        elif tipo == "recording":
+            frase, nombres = _credito(e)
+            release = (e.get("releases") or [{}])[0]
+            for artista in _nombres(frase, nombres):
+                yield "grabaciones", (
+                    artista, normalizar(e["title"]), e["id"], genero, max(peso, 0),
+                    release.get("id"), release.get("title"), nombres[0] if nombres else frase, e["title"],
+                )
+        elif tipo == "release":
+            frase, nombres = _credito(e)
+            for artista in _nombres(frase, nombres):
+                yield "releases", (artista, normalizar(e["title"]), e["id"])
+            # Las pistas dan la release (y el álbum) de cada grabación
+            for medio in e.get("media") or []:
+                for pista in medio.get("tracks") or []:
+                    rec = pista.get("recording") or {}
+                    if not rec.get("id") or not rec.get("title"):
+                        continue
+                    frase_p, nombres_p = _credito(rec) if rec.get("artist-credit") else (frase, nombres)
+                    genero_p, peso_p = _genero(rec)
+                    for artista in _nombres(frase_p, nombres_p):
+                        yield "grabaciones", (
+                            artista, normalizar(rec["title"]), rec["id"], genero_p, peso_p,
+                            e["id"], e["title"], nombres_p[0] if nombres_p else frase_p, rec["title"],
+                        )
+
+    def importar(self, rutas, tipo=None, progreso=None):
+        """
+        Añade al índice las entidades de los volcados. Se puede llamar varias
+        veces con subconjuntos: las filas se combinan con lo que ya haya.
+        Devuelve un Counter con las entidades importadas por tipo y las erróneas.
+        """
+        sql = {"artistas": _SQL_ARTISTA, "grabaciones": _SQL_GRABACION, "releases": _SQL_RELEASE}
+        pendientes = {tabla: [] for tabla in sql}
+        cuenta = Counter()
+
+        def volcar():
+            with self._lock:
+                for tabla, filas in pendientes.items():
+                    if filas:
+                        self._db.executemany(sql[tabla], filas)
+                        filas.clear()
+                self._db.commit()
+
+        with self._lock:
+            # Si la importación se corta basta con repetirla: no hace falta diario
+            self._db.execute("PRAGMA synchronous = OFF")
+        for ruta in rutas:
+            for tipo_archivo, linea in _lineas(ruta):
+                if not linea.strip():
+                    continue
+                try:
+                    entidad = json.loads(linea)
+                    tipo_e = tipo or tipo_archivo or _tipo_por_campos(entidad)
+                    if tipo_e not in TIPOS:
+                        cuenta["desconocidas"] += 1
+                        continue
+                    for tabla, fila in self._filas(tipo_e, entidad):
+                        pendientes[tabla].append(fila)
+                except (ValueError, KeyError, TypeError):
+                    cuenta["erroneas"] += 1
+                    continue
+                cuenta[tipo_e] += 1
+                if sum(len(f) for f in pendientes.values()) >= _LOTE:
+                    volcar()
+                    if progreso:
+                        progreso(cuenta)
+        volcar()
+        with self._lock:
+            self._db.execute("PRAGMA synchronous = FULL")
+            self._db.execute("PRAGMA optimize")
+        return cuenta
+
+    def totales(self):
+        with self._lock:
+            return {
+                tabla: self._db.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+                for tabla in ("artistas", "grabaciones", "releases")
+            }
+
+
+def indice():
+    """El índice compartido (solo lectura), o None si no se ha importado ninguno."""
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None and os.path.exists(RUTA):
+                try:
+                    _indice = IndiceMB(RUTA)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Índice de MusicBrainz no disponible ({RUTA}): {e}")
+                    _indice = False
+    return _indice or None
+
+
+def _consultar(metodo, *args):
+    idx = indice()
+    if idx is None:
+        return None
+    try:
+        valor = getattr(idx, metodo)(*args)
+    except sqlite3.Error as e:
+        print(f"⚠️ Índice de MusicBrainz: {e}")
+        return None
+    _cache_consultas.inc(cache="mb_index", result="hit" if valor else "miss")
+    return valor
+
+
+def buscar_artista(nombre):
+    return _consultar("artista", nombre) if nombre else None
+
+
+def buscar_grabacion(artista, titulo):
+    return _consultar("grabacion", artista, titulo) if artista and titulo else None
+
+
+def buscar_releases(artista, titulo, limit=2):
+    return (_consultar("releases", artista, titulo, limit) or []) if artista and titulo else []
@@ -0,0 +1,151 @@
+"""
+Género y portada deducidos de la propia biblioteca, antes de ir a la red.
+
+Una pasada previa lee las cabeceras de todos los FLAC y guarda, por álbum
+(artista del álbum + álbum), por carpeta y por artista, cuántas pistas tienen
+cada género y cada portada. No se guarda nada por pista, solo esos recuentos y,
+por portada, un archivo que ya la tiene, así que la memoria crece con el
+número de álbumes, no de pistas.
+
+A una pista sin género o sin portada se le copia la de sus vecinas solo si
+hay acuerdo suficiente (REGLAS_GENERO, REGLAS_PORTADA), de lo más fiable a lo
+menos: su álbum, su carpeta si no mezcla álbumes y, para el género, su artista.
+Si no, la pista sigue su camino hacia MusicBrainz.
+"""
+import os
+import threading
+from collections import Counter
+
+from comun import metricas
+from comun.flacmeta import leer_flac, leer_portada
+
+# (nivel, pistas con el dato como mínimo, proporción mínima del más común)
+REGLAS_GENERO = (("album", 1, 0.6), ("carpeta", 2, 0.67), ("artista", 3, 0.75))
+REGLAS_PORTADA = (("album", 1, 0.8), ("carpeta", 2, 0.8))
+
+_deducidos = metricas.contador("echomini_inferred_total", "Géneros y portadas copiados de otras pistas de la biblioteca")
+
+
+def _norm(texto):
+    return " ".join(texto.casefold().split())
+
+
+def portada_principal(info):
+    """La portada frontal (tipo 3) de un InfoFlac, o la primera imagen."""
+    imagenes = [p for p in info.pictures if p.mime.startswith("image/")]
+    return next((p for p in imagenes if p.type == 3), imagenes[0] if imagenes else None)
+
+
+def huella(portada):
+    """Identifica una imagen sin leerla: la misma imagen tiene mismo tamaño, tipo y dimensiones."""
+    return (portada.length, portada.mime, portada.width, portada.height)
+
+
+class _Recuento:
+    __slots__ = ("generos", "portadas", "donantes", "albumes")
+
+    def __init__(self):
+        self.generos = Counter()
+        self.portadas = Counter()
+        self.donantes = {}  # huella -> path de una pista que la tiene
+        self.albumes = set()
+
+
+class IndiceBiblioteca:
+    """
+    Recuentos por álbum, carpeta y artista. Las pistas son los dicts de la
+    lectura de cabeceras: path, artist, albumartist, album, genre y portada =
+    huella() de su imagen principal o None.
+    """
+
+    def __init__(self):
+        self._grupos = {}
+        self._nombres = {}  # género normalizado -> como aparece escrito
+        self._lock = threading.Lock()
+        self.pistas = 0
+
+    def _claves(self, pista):
+        claves = []
+        artista = pista.get("albumartist") or pista.get("artist")
+        if artista and pista.get("album"):
+            claves.append(("album", _norm(artista), _norm(pista["album"])))
+        claves.append(("carpeta", os.path.dirname(os.path.abspath(pista["path"]))))
+        if pista.get("artist"):
+            claves.append(("artista", _norm(pista["artist"])))
+        return claves
+
+    def agregar(self, pista):
+        claves = self._claves(pista)
+        album = claves[0] if claves[0][0] == "album" else None
+        genero = (pista.get("genre") or "").strip()
+        portada = pista.get("portada")
+        with self._lock:
+            self.pistas += 1
+            for clave in claves:
+                r = self._grupos.get(clave)
+                if r is None:
+                    r = self._grupos[clave] = _Recuento()
+                if genero:
+                    r.generos[_norm(genero)] += 1
+                    self._nombres.setdefault(_norm(genero), genero)
+                if portada and clave[0] != "artista":
+                    r.portadas[portada] += 1
+                    r.donantes.setdefault(portada, pista["path"])
+                if clave[0] == "carpeta" and album:
+                    r.albumes.add(album)
+
+    def _decidir(self, pista, reglas, campo):
+        """(valor más común, nivel) según la primera regla que se cumple, o (None, None)."""
+        for clave in self._claves(pista):
+            regla = next((r for r in reglas if r[0] == clave[0]), None)
+            if regla is None:
+                continue
+            with self._lock:
+                r = self._grupos.get(clave)
+                if r is None or (clave[0] == "carpeta" and len(r.albumes) > 1):
+                    continue
+                cuenta = getattr(r, campo)
+                total = sum(cuenta.values())
+                if not total:
+                    continue
+                valor, n = cuenta.most_common(1)[0]
+            if total >= regla[1] and n / total >= regla[2]:
+                return valor, clave[0]
+        return None, None
+
+    def genero(self, pista):
+        """(género, nivel del que sale) o (None, None) si no hay acuerdo suficiente."""
+        genero, nivel = self._decidir(pista, REGLAS_GENERO, "generos")
+        if genero is None:
+            return None, None
+        _deducidos.inc(field="genre", source=nivel)
+        return self._nombres[genero], nivel
+
+    def portada(self, pista):
+        """((path de una pista que la tiene, huella), nivel) o (None, None)."""
+        valor, nivel = self._decidir(pista, REGLAS_PORTADA, "portadas")
+        if valor is None:
+            return None, None
+        clave = next(c for c in self._claves(pista) if c[0] == nivel)
+        with self._lock:
+            path = self._grupos[clave].donantes[valor]
+        _deducidos.inc(field="cover", source=nivel)
+        return (path, valor), nivel
+
+    def resumen(self):
+        with self._lock:
+            niveles = Counter(clave[0] for clave in self._grupos)
+        return f"{self.pistas} pistas, {niveles['album']} álbumes, {niveles['carpeta']} carpetas, {niveles['artista']} artistas"
+
+
+def leer_donante(donante):
+    """
+    Bytes de la imagen de una pista donante, o None si ya no la tiene. Se
+    vuelve a leer la cabecera porque la pista puede haberse guardado durante
+    la pasada y la imagen haber cambiado de sitio.
+    """
+    path, buscada = donante
+    for portada in leer_flac(path).pictures:
+        if huella(portada) == buscada:
+            return leer_portada(path, portada)
+    return None
@@ -0,0 +1,274 @@
+"""
+Métricas del proceso: contadores, histogramas de latencia y medidores.
+
+Cada módulo declara sus métricas al importarse (registrar la misma dos veces
+devuelve la existente) y las actualiza con etiquetas:
+
+    _descargas = metricas.contador("echomini_cover_downloads_total", "Descargas de portadas")
+    _descargas.inc(result="ok")
+    with metricas.etapas.medir(stage="parse"):
+        ...
+
+El backend las publica en /metrics (formato de texto de Prometheus) y los
+scripts por lotes pueden volcar un resumen al terminar (--metricas). Todo es
+seguro entre hilos. En el modo de escaneo por procesos, lo que se mide dentro
+de los procesos hijos no llega al registro del padre.
+"""
+import bisect
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites superiores de los buckets (segundos): de 0.5 ms a 1 min
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _formato_etiquetas(clave, extra=()):
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in pares
+    )
+    return "{" + texto + "}"
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Familia:
+    tipo = None
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _cabecera(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Familia):
+    tipo = "counter"
+
+    def inc(self, n=1, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + n
+
+    def valor(self, **etiquetas):
+        with self._lock:
+            return self._series.get(_etiquetas(etiquetas), 0)
+
+    def _exponer(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nombre}{_formato_etiquetas(c)} {_numero(v)}" for c, v in series]
+
+    def _resumen(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [(self.nombre + _formato_etiquetas(c), _numero(v)) for c, v in series]
+
+
+class Medidor(_Familia):
+    """Valor que sube y baja (p.ej. profundidad de una cola), fijo o leído de una función."""
+
+    tipo = "gauge"
+
+    def set(self, valor, **etiquetas):
+        with self._lock:
+            self._series[_etiquetas(etiquetas)] = valor
+
+    def funcion(self, fn, **etiquetas):
+        """El valor se lee llamando a fn() cada vez que se consulta."""
+        self.set(fn, **etiquetas)
+
+    def quitar(self, **etiquetas):
+        with self._lock:
+            self._series.pop(_etiquetas(etiquetas), None)
+
+    def _valores(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        salida = []
+        for clave, valor in series:
+            try:
+                salida.append((clave, valor() if callable(valor) else valor))
+            except Exception:
+                continue
+        return salida
+
+    def _exponer(self):
+        return [f"{self.nombre}{_formato_etiquetas(c)} {_numero(v)}" for c, v in self._valores()]
+
+    def _resumen(self):
+        return [(self.nombre + _formato_etiquetas(c), _numero(v)) for c, v in self._valores()]
+
+
+class Histograma(_Familia):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS):
+        super().__init__(nombre, ayuda)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [cuentas por bucket (+Inf al final), suma, total]
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa lo que tarda el bloque (también si lanza una excepción)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def _copia(self):
+        with self._lock:
+            return sorted((c, (list(s[0]), s[1], s[2])) for c, s in self._series.items())
+
+    def _exponer(self):
+        lineas = []
+        for clave, (cuentas, suma, total) in self._copia():
+            acumulado = 0
+            for limite, n in zip(self.buckets + (math.inf,), cuentas):
+                acumulado += n
+                le = _formato_etiquetas(clave, [("le", _numero(limite))])
+                lineas.append(f"{self.nombre}_bucket{le} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_formato_etiquetas(clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_formato_etiquetas(clave)} {total}")
+        return lineas
+
+    def _cuantil(self, cuentas, total, q):
+        """Estimación por interpolación dentro del bucket, como histogram_quantile."""
+        objetivo = q * total
+        acumulado = 0
+        for i, n in enumerate(cuentas):
+            if acumulado + n >= objetivo and n:
+                inferior = self.buckets[i - 1] if i > 0 else 0.0
+                if i >= len(self.buckets):
+                    return self.buckets[-1]
+                return inferior + (self.buckets[i] - inferior) * (objetivo - acumulado) / n
+            acumulado += n
+        return self.buckets[-1]
+
+    def _resumen(self):
+        salida = []
+        for clave, (cuentas, suma, total) in self._copia():
+            if not total:
+                continue
+            p50 = self._cuantil(cuentas, total, 0.5) * 1000
+            p95 = self._cuantil(cuentas, total, 0.95) * 1000
+            salida.append((
+                self.nombre + _formato_etiquetas(clave),
+                f"n={total} total={suma:.2f}s media={suma / total * 1000:.1f}ms p50≈{p50:.1f}ms p95≈{p95:.1f}ms",
+            ))
+        return salida
+
+
+class Registro:
+    def __init__(self):
+        self._familias = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, ayuda, *args):
+        with self._lock:
+            familia = self._familias.get(nombre)
+            if familia is None:
+                familia = self._familias[nombre] = clase(nombre, ayuda, *args)
+            elif not isinstance(familia, clase):
+                raise ValueError(f"La métrica {nombre} ya existe con otro tipo")
+            return familia
+
+    def contador(self, nombre, ayuda=""):
+        return self._registrar(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda=""):
+        return self._registrar(Medidor, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda="", buckets=BUCKETS):
+        return self._registrar(Histograma, nombre, ayuda, buckets)
+
+    def _ordenadas(self):
+        with self._lock:
+            return [self._familias[n] for n in sorted(self._familias)]
+
+    def exponer(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        lineas = []
+        for familia in self._ordenadas():
+            lineas += familia._cabecera() + familia._exponer()
+        return "\n".join(lineas) + "\n"
+
+    def resumen(self):
+        """Resumen legible: [(serie, valor)], solo series con datos."""
+        salida = []
+        for familia in self._ordenadas():
+            salida += familia._resumen()
+        return salida
+
+
+registro = Registro()
+contador = registro.contador
+medidor = registro.medidor
+histograma = registro.histograma
+exponer = registro.exponer
+resumen = registro.resumen
+
+# Duración de las etapas comunes a todas las herramientas (stage=parse, id3,
+# image, save...), para ver dónde se va el tiempo
+etapas = histograma("echomini_stage_seconds", "Duración de cada etapa del procesado de un archivo")
+
+
+def agregar_argumentos(parser):
+    parser.add_argument(
+        "--metricas",
+        nargs="?",
+        const="-",
+        metavar="ARCHIVO",
+        help="al terminar, muestra un resumen de tiempos por etapa (o lo guarda en ARCHIVO, en formato Prometheus)",
+    )
+
+
+@contextmanager
+def informe(args):
+    """Envuelve la ejecución de un script: al acabar (aunque sea con error) vuelca las métricas."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        destino = getattr(args, "metricas", None)
+        if destino == "-":
+            print(f"📊 Métricas ({time.perf_counter() - inicio:.1f}s en total):")
+            series = resumen()
+            ancho = max((len(s) for s, _ in series), default=0)
+            for serie, valor in series:
+                print(f"   {serie:<{ancho}}  {valor}")
+            sys.stdout.flush()
+        elif destino:
+            with open(destino, "w", encoding="utf-8") as f:
+                f.write(exponer())
+            print(f"📊 Métricas guardadas en {destino}")
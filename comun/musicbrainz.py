@@ -0,0 +1,181 @@
+"""
+Consultas a MusicBrainz compartidas por los scripts, con caché en disco.
+
+Las respuestas se guardan por consulta normalizada (mayúsculas, espacios), así
+que volver a pasar por una biblioteca ya procesada no repite peticiones. Las
+búsquedas sin resultados también se guardan (caché negativa), con un TTL más
+corto por si MusicBrainz las añade más adelante. Los errores de red no se
+guardan. Las peticiones reales pasan por el planificador (comun.planificador).
+
+Las funciones de alto nivel (género, info de una grabación, releases de un
+álbum) miran antes el índice local importado de un volcado (comun.indice_mb) y
+solo van a la red si el índice no tiene la respuesta.
+"""
+import json
+import os
+
+import musicbrainzngs
+
+from comun import indice_mb, metricas
+from comun.cache import CacheDisco
+from comun.planificador import HOST_MB, PRIORIDAD_NORMAL, planificador
+
+DIA = 24 * 3600
+TTL = float(os.environ.get("ECHOMINI_MB_TTL", 30 * DIA))
+TTL_NEGATIVO = float(os.environ.get("ECHOMINI_MB_TTL_NEGATIVO", 7 * DIA))
+MAX_BYTES = int(os.environ.get("ECHOMINI_MB_CACHE_MAX", 256 * 1024 * 1024))
+
+_cache = None
+_cache_consultas = metricas.contador("echomini_cache_requests_total", "Consultas a las cachés locales")
+_consultas = metricas.histograma(
+    "echomini_musicbrainz_seconds", "Consultas a MusicBrainz que van a la red (cola, límite y reintentos incluidos)"
+)
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = CacheDisco("musicbrainz", TTL, MAX_BYTES)
+    return _cache
+
+
+def _normalizar(valor):
+    if isinstance(valor, str):
+        return " ".join(valor.casefold().split())
+    if isinstance(valor, (list, tuple)):
+        return sorted(_normalizar(v) for v in valor)
+    return valor
+
+
+def _clave(nombre, args, kwargs):
+    datos = {"args": [_normalizar(a) for a in args]}
+    datos.update({k: _normalizar(v) for k, v in kwargs.items()})
+    return nombre + ":" + json.dumps(datos, sort_keys=True, ensure_ascii=False)
+
+
+def _es_vacio(resultado):
+    # Las búsquedas devuelven {"xxx-list": [...], "xxx-count": n}
+    listas = [v for k, v in resultado.items() if k.endswith("-list")]
+    return bool(listas) and not any(listas)
+
+
+def _consultar(nombre, fn, *args, prioridad=PRIORIDAD_NORMAL, cancelado=None, **kwargs):
+    cache = _get_cache()
+    clave = _clave(nombre, args, kwargs)
+    hit, valor = cache.get(clave)
+    _cache_consultas.inc(cache="musicbrainz", result="hit" if hit else "miss")
+    if hit:
+        return valor
+    # Pasa por la cola de MusicBrainz: límite de velocidad, reintentos y
+    # una sola petición si varios hilos piden lo mismo a la vez
+    with _consultas.medir(query=nombre):
+        valor = planificador.ejecutar(
+            HOST_MB, fn, args, kwargs, clave=clave, prioridad=prioridad, cancelado=cancelado
+        )
+    cache.set(clave, valor, TTL_NEGATIVO if _es_vacio(valor) else None)
+    return valor
+
+
+def search_recordings(*args, **kwargs):
+    return _consultar("search_recordings", musicbrainzngs.search_recordings, *args, **kwargs)
+
+
+def search_artists(*args, **kwargs):
+    return _consultar("search_artists", musicbrainzngs.search_artists, *args, **kwargs)
+
+
+def search_releases(*args, **kwargs):
+    return _consultar("search_releases", musicbrainzngs.search_releases, *args, **kwargs)
+
+
+def get_artist_by_id(*args, **kwargs):
+    return _consultar("get_artist_by_id", musicbrainzngs.get_artist_by_id, *args, **kwargs)
+
+
+def get_recording_by_id(*args, **kwargs):
+    return _consultar("get_recording_by_id", musicbrainzngs.get_recording_by_id, *args, **kwargs)
+
+
+def _tag_principal(tags):
+    if not tags:
+        return None
+    sorted_tags = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
+    return sorted_tags[0]["name"].capitalize()
+
+
+def obtener_genero_por_recording(artist, title):
+    local = indice_mb.buscar_grabacion(artist, title)
+    if local and local["genero"] is not None:
+        return local["genero"] or None
+    try:
+        if local:
+            # Conocida pero el volcado no traía etiquetas: una consulta por MBID, sin búsqueda
+            return obtener_genero_por_id(local["mbid"])
+        result = search_recordings(artist=artist, recording=title, limit=5)
+        for recording in result["recording-list"]:
+            genero = _tag_principal(recording.get("tag-list", []))
+            if genero:
+                return genero
+    except Exception as e:
+        print(f"⚠️ MusicBrainz (recording {artist} - {title}): {e}")
+    return None
+
+
+def obtener_genero_por_id(recording_id, **kwargs):
+    """Género principal de una grabación por su MBID, o None. Los errores se propagan."""
+    data = get_recording_by_id(recording_id, includes=["tags"], **kwargs)
+    return _tag_principal(data["recording"].get("tag-list", []))
+
+
+def obtener_genero_por_artista(artist):
+    local = indice_mb.buscar_artista(artist)
+    if local and local["genero"] is not None:
+        return local["genero"] or None
+    try:
+        if local:
+            artist_id = local["mbid"]
+        else:
+            result = search_artists(artist=artist, limit=1)
+            if not result["artist-list"]:
+                return None
+            artist_id = result["artist-list"][0]["id"]
+        data = get_artist_by_id(artist_id, includes=["tags"])
+        return _tag_principal(data["artist"].get("tag-list", []))
+    except Exception as e:
+        print(f"⚠️ MusicBrainz (artista {artist}): {e}")
+    return None
+
+
+def buscar_info_por_recording(artist, title):
+    local = indice_mb.buscar_grabacion(artist, title)
+    if local and local["release_id"]:
+        return {
+            "artist": local["artist"],
+            "title": local["title"],
+            "album": local["album"],
+            "release_id": local["release_id"],
+        }
+    try:
+        result = search_recordings(artist=artist, recording=title, limit=5)
+        for rec in result["recording-list"]:
+            release_list = rec.get("release-list", [])
+            if release_list:
+                release = release_list[0]
+                return {
+                    "artist": rec.get("artist-credit", [{}])[0].get("name"),
+                    "title": rec.get("title"),
+                    "album": release.get("title"),
+                    "release_id": release.get("id"),
+                }
+    except Exception as e:
+        print(f"⚠️ MusicBrainz (recording {artist} - {title}): {e}")
+    return None
+
+
+def buscar_releases(artist, album, limit=2):
+    """IDs de las releases de un álbum, del índice local o de una búsqueda."""
+    ids = indice_mb.buscar_releases(artist, album, limit)
+    if ids:
+        return ids
+    result = search_releases(artist=artist, release=album, limit=limit)
+    return [release["id"] for release in result["release-list"]]
@@ -0,0 +1,122 @@
+"""
+Artista y título a partir del nombre de archivo (y de las carpetas).
+
+Reconoce los formatos habituales de bibliotecas descargadas o ripeadas:
+
+    Artista - Título.flac
+    01 - Artista - Título.flac       01. Título.flac       1-03 Título.flac
+    Artista - 05 - Título.flac       Artista - Álbum - Título.flac
+    Artista_-_Título.flac            Artista - Título (Official Video) [dQw4w9WgXcQ].flac
+
+Si el nombre solo trae el título, el artista sale de la carpeta ("Artista -
+Álbum/") o de la estructura Artista/Álbum/pista bajo la raíz. Con una carpeta
+entera a la vez (analizar_carpeta) se corrigen los nombres al revés ("Título -
+Artista"): si todos comparten la segunda parte y no la primera, es el artista.
+"""
+import os
+import re
+
+# Separadores entre campos: guion, en dash y em dash, con espacios
+_SEPARADOR = re.compile(r"\s+(?:-{1,2}|–|—)\s+")
+# Número de pista al principio: "01 ", "001 ", "01. ", "1-03 ", "(01) ", "5 - ", "07_", "101. ".
+# Tres cifras sin cero delante solo con punto, paréntesis o guion bajo: "311 -
+# Amber" o "808 State - Pacific" son artistas, no pistas
+_PISTA = re.compile(
+    r"^(?:\(?(?:\d{1,2}-)?(0\d{1,2})\)?[\s._)-]+"
+    r"|(?:\d{1,2}-)?(\d{1,2}|\d{3}(?=\s*[.)_]))(?:\s*[.)_]\s*|\s+-\s+))(?=\S)"
+)
+_NUMERO = re.compile(r"^\d{1,3}$")
+# Ruido de vídeos y descargas al final: (Official Video), [HD], [id de YouTube]...
+_RUIDO = re.compile(
+    r"\s*[\(\[](?:official\s*)?(?:music\s*)?(?:video|audio|lyrics?(?:\s*video)?|visuali[sz]er|hd|hq|4k|\d{3,4}p|"
+    r"videoclip|clip oficial|v[ií]deo oficial|audio oficial|letra)[\)\]]\s*$"
+    r"|\s*\[[A-Za-z0-9_-]{11}\]\s*$",
+    re.IGNORECASE,
+)
+
+
+def _sin_ruido(base):
+    anterior = None
+    while anterior != base:
+        anterior = base
+        base = _RUIDO.sub("", base)
+    return base
+
+
+def _limpiar(base):
+    # El ruido se quita antes de mirar si hay espacios: en "Artista_-_Título
+    # (Official Video)" los únicos espacios son los del ruido
+    base = _sin_ruido(base).rstrip("_").replace("_-_", " - ")
+    if " " not in base and "_" in base:
+        base = base.replace("_", " ")
+    return _sin_ruido(" ".join(base.split())).strip(" -")
+
+
+def _artista_de_carpetas(path, raiz):
+    """Artista según las carpetas: "Artista - Álbum/" o Artista/Álbum/ bajo la raíz."""
+    carpeta = os.path.dirname(os.path.abspath(path))
+    partes = _SEPARADOR.split(os.path.basename(carpeta))
+    if len(partes) >= 2 and not _NUMERO.match(partes[0]):
+        return partes[0].strip(), partes[-1].strip()
+    if raiz:
+        raiz = os.path.abspath(raiz)
+        abuela = os.path.dirname(carpeta)
+        # Solo si ambas carpetas están por debajo de la raíz (no es la propia raíz)
+        if abuela != raiz and abuela.startswith(raiz + os.sep):
+            return os.path.basename(abuela), os.path.basename(carpeta)
+    return None, None
+
+
+def extraer(path, raiz=None):
+    """
+    Devuelve {"artist", "title", "album", "tracknumber"} deducidos del nombre
+    (los que no se pueden deducir, None), o None si no sale ni el título.
+    """
+    base = _limpiar(os.path.splitext(os.path.basename(path))[0])
+    datos = {"artist": None, "title": None, "album": None, "tracknumber": None}
+
+    m = _PISTA.match(base)
+    if m:
+        datos["tracknumber"] = str(int(m.group(1) or m.group(2)))
+        base = base[m.end():]
+
+    partes = [p.strip() for p in _SEPARADOR.split(base) if p.strip()]
+    if not partes:
+        return None
+    # "Artista - 05 - Título": el número del medio es la pista
+    for i, parte in enumerate(partes[1:-1], 1):
+        if _NUMERO.match(parte):
+            datos["tracknumber"] = datos["tracknumber"] or str(int(parte))
+            del partes[i]
+            break
+
+    if len(partes) == 1:
+        datos["title"] = partes[0]
+        datos["artist"], datos["album"] = _artista_de_carpetas(path, raiz)
+    else:
+        datos["artist"] = partes[0]
+        carpeta = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        if len(partes) == 3 and partes[1].casefold() in carpeta.casefold():
+            # "Artista - Álbum - Título", confirmado por el nombre de la carpeta
+            datos["album"], datos["title"] = partes[1], partes[2]
+        else:
+            datos["title"] = " - ".join(partes[1:])
+    return datos
+
+
+def analizar_carpeta(paths, raiz=None):
+    """
+    extraer() para todos los archivos de una carpeta, corrigiendo con el
+    conjunto: si con al menos tres archivos "A - B" la parte B es siempre la
+    misma y la A no, el orden está al revés (Título - Artista).
+    Devuelve {path: datos}.
+    """
+    resultado = {path: extraer(path, raiz) for path in paths}
+    dobles = [d for d in resultado.values() if d and d["artist"] and d["title"] and " - " not in d["title"]]
+    if len(dobles) >= 3:
+        primeras = {d["artist"].casefold() for d in dobles}
+        segundas = {d["title"].casefold() for d in dobles}
+        if len(segundas) == 1 and len(primeras) > 1:
+            for d in dobles:
+                d["artist"], d["title"] = d["title"], d["artist"]
+    return resultado
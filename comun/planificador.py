@@ -0,0 +1,272 @@
+"""
+Planificador de peticiones de red por host.
+
+Cada host tiene su cola con prioridad, sus hilos y un cubo de tokens que limita
+las peticiones por segundo (MusicBrainz admite ~1/s). Los errores transitorios
+(red, 429, 503...) se reintentan con espera exponencial con jitter, y dos
+peticiones idénticas en curso a la vez comparten resultado (si la segunda
+tiene más prioridad, la que espera en cola sube a la suya). Los hilos que leen
+y escriben archivos no pasan por aquí, así que siguen a toda velocidad mientras
+la red espera su turno.
+"""
+import heapq
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import musicbrainzngs
+import requests
+
+from comun import metricas
+
+PRIORIDAD_ALTA = 0  # peticiones interactivas (GUI, web)
+PRIORIDAD_NORMAL = 10
+PRIORIDAD_BAJA = 20  # precargas
+
+REINTENTOS = int(os.environ.get("ECHOMINI_REINTENTOS", 5))
+ESPERA_BASE = 1.0
+ESPERA_MAX = 60.0
+
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+_espera_limite = metricas.histograma("echomini_ratelimit_wait_seconds", "Espera por el límite de peticiones del host")
+_peticiones = metricas.histograma("echomini_network_request_seconds", "Duración de cada intento de petición de red")
+_reintentos = metricas.contador("echomini_network_retries_total", "Reintentos por errores transitorios")
+_fallos = metricas.contador("echomini_network_failures_total", "Peticiones que fallan tras los reintentos")
+_compartidas = metricas.contador("echomini_network_dedup_total", "Peticiones que se unen a una idéntica en curso")
+_cola = metricas.medidor("echomini_network_queue_depth", "Peticiones esperando en la cola del host")
+
+
+class ErrorTransitorio(Exception):
+    """Lanzar desde una petición para que se reintente (p.ej. HTTP 503)."""
+
+
+class Cancelado(Exception):
+    """La espera se canceló (p.ej. el usuario ya no mira ese archivo)."""
+
+
+def es_transitorio(exc):
+    if isinstance(exc, (ErrorTransitorio, musicbrainzngs.NetworkError)):
+        return True
+    if isinstance(exc, musicbrainzngs.ResponseError):
+        return getattr(exc.cause, "code", None) in CODIGOS_TRANSITORIOS
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in CODIGOS_TRANSITORIOS
+    return False
+
+
+class CuboTokens:
+    def __init__(self, tasa, rafaga=1):
+        self.tasa = tasa  # tokens por segundo
+        self.rafaga = rafaga
+        self._tokens = rafaga
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        """Bloquea hasta tener un token. Devuelve los segundos esperados."""
+        esperado = 0.0
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return esperado
+                falta = (1 - self._tokens) / self.tasa
+            time.sleep(falta)
+            esperado += falta
+
+
+class _Host:
+    def __init__(self, nombre, tasa, rafaga, hilos):
+        self.nombre = nombre
+        self.cubo = CuboTokens(tasa, rafaga)
+        self.cola = queue.PriorityQueue()
+        self.hilos = [
+            threading.Thread(target=self._trabajar, name=f"red-{nombre}-{i}", daemon=True)
+            for i in range(hilos)
+        ]
+        for h in self.hilos:
+            h.start()
+        # Reintentos esperando su hora: no ocupan un hilo de trabajo mientras tanto
+        self._diferidas = []
+        self._hay_diferidas = threading.Condition()
+        threading.Thread(target=self._despertar, name=f"red-{nombre}-reintentos", daemon=True).start()
+        _cola.funcion(self.cola.qsize, host=nombre)
+
+    def _trabajar(self):
+        while True:
+            _prioridad, _seq, tarea = self.cola.get()
+            tarea()
+
+    def diferir(self, espera, prioridad, seq, tarea):
+        """Vuelve a encolar la tarea dentro de `espera` segundos."""
+        with self._hay_diferidas:
+            heapq.heappush(self._diferidas, (time.monotonic() + espera, prioridad, seq, tarea))
+            self._hay_diferidas.notify()
+
+    def _despertar(self):
+        with self._hay_diferidas:
+            while True:
+                if not self._diferidas:
+                    self._hay_diferidas.wait()
+                    continue
+                falta = self._diferidas[0][0] - time.monotonic()
+                if falta > 0:
+                    self._hay_diferidas.wait(falta)
+                    continue
+                _hora, prioridad, seq, tarea = heapq.heappop(self._diferidas)
+                self.cola.put((prioridad, seq, tarea))
+
+
+class Planificador:
+    def __init__(self):
+        self._hosts = {}
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def configurar_host(self, host, tasa, rafaga=1, hilos=1):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(host, tasa, rafaga, hilos)
+            else:
+                self._hosts[host].cubo.tasa = tasa
+                self._hosts[host].cubo.rafaga = rafaga
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(host, 1.0, 1, 1)
+            return self._hosts[host]
+
+    def enviar(self, host, fn, args=(), kwargs=None, clave=None, prioridad=PRIORIDAD_NORMAL, reintentos=None):
+        """
+        Encola fn(*args, **kwargs) para `host` y devuelve un Future. Si ya hay
+        una petición en curso con la misma `clave`, devuelve su Future.
+        """
+        kwargs = kwargs or {}
+        reintentos = REINTENTOS if reintentos is None else reintentos
+        h = self._host(host)
+        with self._lock:
+            if clave is not None and clave in self._en_curso:
+                futuro = self._en_curso[clave]
+                futuro.interesados += 1
+                _compartidas.inc(host=host)
+                if prioridad < futuro.prioridad and not futuro.arrancada and futuro.tarea is not None:
+                    # Sigue en la cola con menos prioridad (p.ej. una precarga que
+                    # ahora se mira): se encola otra vez delante; la primera de las
+                    # dos entradas que salga la ejecuta y la otra no hace nada
+                    futuro.prioridad = prioridad
+                    h.cola.put((prioridad, next(self._seq), futuro.tarea))
+                return futuro
+            futuro = Future()
+            futuro.interesados = 1
+            futuro.prioridad = prioridad
+            futuro.arrancada = False
+            futuro.tarea = None
+            if clave is not None:
+                self._en_curso[clave] = futuro
+
+        def tarea(intento=0):
+            if intento == 0:
+                with self._lock:
+                    if futuro.arrancada:
+                        return  # ya salió por la otra entrada de la cola
+                    futuro.arrancada = True
+                # Una vez en marcha ya no se puede cancelar
+                if not futuro.set_running_or_notify_cancel():
+                    return
+            if intento > 0:
+                # Si todos la abandonaron mientras esperaba para reintentar, no se repite
+                with self._lock:
+                    abandonada = futuro.interesados <= 0
+                    if abandonada and clave is not None and self._en_curso.get(clave) is futuro:
+                        del self._en_curso[clave]
+                if abandonada:
+                    futuro.set_exception(Cancelado())
+                    return
+            _espera_limite.observar(h.cubo.esperar(), host=host)
+            try:
+                with _peticiones.medir(host=host):
+                    resultado = fn(*args, **kwargs)
+            except Exception as e:
+                if intento < reintentos and es_transitorio(e):
+                    _reintentos.inc(host=host)
+                    # Espera exponencial con jitter completo y vuelta a la cola; el
+                    # hilo queda libre para atender otras peticiones mientras tanto
+                    espera = random.uniform(0, min(ESPERA_MAX, ESPERA_BASE * 2 ** intento))
+                    h.diferir(espera, futuro.prioridad, next(self._seq), lambda: tarea(intento + 1))
+                    return
+                self._terminar(clave)
+                _fallos.inc(host=host)
+                futuro.set_exception(e)
+                return
+            self._terminar(clave)
+            futuro.set_result(resultado)
+
+        with self._lock:
+            futuro.tarea = tarea
+        h.cola.put((prioridad, next(self._seq), tarea))
+        return futuro
+
+    def abandonar(self, futuro):
+        """
+        El llamante ya no quiere el resultado. Si nadie más lo espera y aún no
+        ha empezado, la petición se cancela y no llega a hacerse; si está
+        esperando para reintentar, ya no se reintenta.
+        """
+        with self._lock:
+            futuro.interesados -= 1
+            if futuro.interesados > 0 or not futuro.cancel():
+                return
+            for clave, f in list(self._en_curso.items()):
+                if f is futuro:
+                    del self._en_curso[clave]
+
+    def ejecutar(self, host, fn, args=(), kwargs=None, clave=None, prioridad=PRIORIDAD_NORMAL, cancelado=None):
+        """
+        Como enviar(), pero espera y devuelve el resultado (o lanza el error).
+        Si se pasa un threading.Event `cancelado` y se activa durante la espera,
+        se abandona la petición y se lanza Cancelado.
+        """
+        futuro = self.enviar(host, fn, args, kwargs, clave, prioridad)
+        if cancelado is None:
+            return futuro.result()
+        while True:
+            if cancelado.is_set():
+                self.abandonar(futuro)
+                raise Cancelado()
+            try:
+                return futuro.result(timeout=0.1)
+            except FuturesTimeout:
+                continue
+
+    def _terminar(self, clave):
+        if clave is not None:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+
+# Hosts configurables (p.ej. para apuntar a un servidor de pruebas local)
+HOST_MB = os.environ.get("ECHOMINI_MB_HOST", "musicbrainz.org")
+MB_HTTPS = os.environ.get("ECHOMINI_MB_HTTPS", "1") != "0"
+URL_CAA = os.environ.get("ECHOMINI_CAA_URL", "https://coverartarchive.org").rstrip("/")
+HOST_CAA = URL_CAA.split("://", 1)[-1]
+
+planificador = Planificador()
+planificador.configurar_host(HOST_MB, float(os.environ.get("ECHOMINI_MB_RATE", 1.0)))
+planificador.configurar_host(HOST_CAA, float(os.environ.get("ECHOMINI_CAA_RATE", 5.0)), rafaga=5, hilos=5)
+
+musicbrainzngs.set_hostname(HOST_MB, use_https=MB_HTTPS)
+# El límite de velocidad lo pone el planificador, no musicbrainzngs
+musicbrainzngs.set_rate_limit(False)
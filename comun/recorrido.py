@@ -0,0 +1,65 @@
+"""
+Recorrido de bibliotecas de FLAC con os.scandir.
+
+Es un generador: va devolviendo rutas según las encuentra, sin construir la lista
+completa, así que la memoria no crece con el tamaño de la biblioteca. Entra en
+subcarpetas (artista/álbum/...) y, si se pide, sigue enlaces simbólicos sin
+entrar dos veces en la misma carpeta (evita bucles).
+"""
+import os
+
+
+def _es_flac(nombre):
+    return nombre.lower().endswith(".flac") and not nombre.startswith(".")
+
+
+def recorrer_flacs(raiz, recursivo=True, seguir_enlaces=False):
+    """Devuelve las rutas de los .flac bajo `raiz`, carpeta a carpeta."""
+    pendientes = [raiz]
+    vistas = set()
+    while pendientes:
+        carpeta = pendientes.pop()
+        try:
+            st = os.stat(carpeta)
+        except OSError as e:
+            print(f"⚠️ No se puede leer {carpeta}: {e}")
+            continue
+        if (st.st_dev, st.st_ino) in vistas:
+            continue
+        vistas.add((st.st_dev, st.st_ino))
+
+        subcarpetas = []
+        try:
+            with os.scandir(carpeta) as it:
+                for entrada in it:
+                    try:
+                        if entrada.is_dir(follow_symlinks=seguir_enlaces):
+                            if recursivo and not entrada.name.startswith("."):
+                                subcarpetas.append(entrada.path)
+                        elif _es_flac(entrada.name) and entrada.is_file(follow_symlinks=seguir_enlaces):
+                            yield entrada.path
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"⚠️ No se puede leer {carpeta}: {e}")
+            continue
+        # En orden alfabético al sacarlas de la pila
+        pendientes.extend(sorted(subcarpetas, reverse=True))
+
+
+def recorrer_carpetas(raiz, recursivo=True, seguir_enlaces=False, max_lote=256):
+    """
+    Como recorrer_flacs(), pero agrupado: devuelve (carpeta, [flacs]) por cada
+    carpeta con algún FLAC. Las carpetas con más de `max_lote` archivos salen en
+    varios lotes, así que en memoria nunca hay más de un lote.
+    """
+    actual, lote = None, []
+    for path in recorrer_flacs(raiz, recursivo, seguir_enlaces):
+        carpeta = os.path.dirname(path)
+        if lote and (carpeta != actual or len(lote) >= max_lote):
+            yield actual, lote
+            lote = []
+        actual = carpeta
+        lote.append(path)
+    if lote:
+        yield actual, lote
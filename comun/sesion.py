@@ -0,0 +1,95 @@
+"""
+Sesión de edición de tags de un FLAC.
+
+Se cargan los tags una vez, se acumulan todos los cambios (tags, portadas,
+conversión de ID3) y commit() escribe el archivo una sola vez, y solo si el
+estado final es distinto del que había al abrirlo. El guardado va por
+comun.guardado: en el sitio si cabe en el padding, si no sobre una copia
+temporal que se renombra encima del original.
+"""
+from mutagen.flac import FLAC
+
+from comun import metricas
+from comun.guardado import guardar
+from comun.id3 import aplicar_id3, detectar_id3
+
+
+def _estado_tags(audio):
+    # El orden y las mayúsculas de las claves no cuentan como cambio
+    return sorted((k.lower(), v) for k, v in audio.tags.items()) if audio.tags is not None else []
+
+
+def _estado_portadas(audio):
+    return [(p.type, p.mime, p.desc, p.width, p.height, p.depth, p.data) for p in audio.pictures]
+
+
+class SesionTags:
+    def __init__(self, path):
+        self.path = path
+        self.audio = FLAC(path)
+        if self.audio.tags is None:
+            self.audio.add_tags()
+        self.tiene_id3 = any(detectar_id3(path))
+        self._quitar_id3 = False
+        self._tags_iniciales = _estado_tags(self.audio)
+        self._portadas_iniciales = _estado_portadas(self.audio)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.commit()
+        return False
+
+    def __contains__(self, clave):
+        return clave in self.audio
+
+    def get(self, clave, default=None):
+        return self.audio.get(clave, [default])[0]
+
+    def set(self, clave, valor):
+        self.audio[clave] = valor
+
+    def set_si_falta(self, clave, valor):
+        """Pone el campo solo si no existe. Devuelve True si lo ha puesto."""
+        if clave in self.audio or not valor:
+            return False
+        self.audio[clave] = valor
+        return True
+
+    @property
+    def tiene_portada(self):
+        return bool(self.audio.pictures)
+
+    def poner_portada(self, picture, reemplazar=False):
+        if reemplazar:
+            self.audio.clear_pictures()
+        self.audio.add_picture(picture)
+
+    def convertir_id3(self):
+        """Copia los ID3 a Vorbis y marca el ID3 para borrarlo al guardar."""
+        if not self.tiene_id3:
+            return {}
+        self._quitar_id3 = True
+        with metricas.etapas.medir(stage="id3"):
+            return aplicar_id3(self.audio, self.path)
+
+    @property
+    def cambiado(self):
+        return (
+            self._quitar_id3
+            or _estado_tags(self.audio) != self._tags_iniciales
+            or _estado_portadas(self.audio) != self._portadas_iniciales
+        )
+
+    def commit(self):
+        """Escribe los cambios pendientes. Devuelve False si no había ninguno."""
+        if not self.cambiado:
+            return False
+        guardar(self.audio, self.path, deleteid3=self._quitar_id3)
+        self._quitar_id3 = False
+        self.tiene_id3 = False
+        self._tags_iniciales = _estado_tags(self.audio)
+        self._portadas_iniciales = _estado_portadas(self.audio)
+        return True
@@ -0,0 +1,135 @@
+"""
+Tubería productor/consumidor por etapas.
+
+Cada etapa tiene sus propios hilos y lee de una cola acotada; si una etapa va
+más lenta que la anterior, la cola se llena y la anterior se para a esperar
+(contrapresión). Así, por ejemplo, la lectura de archivos no se adelanta miles
+de pistas a la red, y la memoria queda acotada por el tamaño de las colas y no
+por el de la biblioteca.
+
+La función de cada etapa recibe un elemento y devuelve un iterable (lista,
+generador...) con lo que pasa a la siguiente; una lista vacía o None lo descarta.
+Lo que sale de la última etapa se devuelve como generador.
+
+Mientras corre, la profundidad de la cola de entrada de cada etapa y lo que
+tarda cada elemento quedan en comun.metricas, así se ve cuál es el cuello de
+botella.
+"""
+import queue
+import threading
+import time
+
+from comun import metricas
+
+TAM_COLA = 64
+
+_duracion = metricas.histograma("echomini_pipeline_item_seconds", "Tiempo de cada elemento en cada etapa de la tubería")
+_errores = metricas.contador("echomini_pipeline_errors_total", "Elementos descartados por un error en una etapa")
+_profundidad = metricas.medidor("echomini_pipeline_queue_depth", "Elementos esperando en la cola de entrada de cada etapa")
+
+_FIN = object()
+
+
+class Etapa:
+    def __init__(self, nombre, fn, hilos=1):
+        self.nombre = nombre
+        self.fn = fn
+        self.hilos = hilos
+
+
+class _Parada(Exception):
+    pass
+
+
+def tuberia(fuente, etapas, tam_cola=TAM_COLA):
+    colas = [queue.Queue(maxsize=tam_cola) for _ in range(len(etapas) + 1)]
+    parar = threading.Event()
+
+    def poner(cola, elemento):
+        while not parar.is_set():
+            try:
+                cola.put(elemento, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Parada()
+
+    def sacar(cola):
+        while not parar.is_set():
+            try:
+                return cola.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise _Parada()
+
+    def alimentar():
+        try:
+            for elemento in fuente:
+                poner(colas[0], elemento)
+            for _ in range(etapas[0].hilos):
+                poner(colas[0], _FIN)
+        except _Parada:
+            pass
+        except Exception as e:
+            print(f"❌ Error leyendo la entrada: {e}")
+            parar.set()
+
+    def trabajar(i, etapa, vivos):
+        entrada, salida = colas[i], colas[i + 1]
+        try:
+            while True:
+                elemento = sacar(entrada)
+                if elemento is _FIN:
+                    break
+                # Tiempo de trabajo de la etapa: lo que se espera a que haya
+                # sitio en la cola siguiente no cuenta
+                ocupado = 0.0
+                inicio = time.perf_counter()
+                try:
+                    for r in etapa.fn(elemento) or ():
+                        ocupado += time.perf_counter() - inicio
+                        poner(salida, r)
+                        inicio = time.perf_counter()
+                except _Parada:
+                    raise
+                except Exception as e:
+                    _errores.inc(stage=etapa.nombre)
+                    print(f"❌ Error en la etapa {etapa.nombre}: {e}")
+                _duracion.observar(ocupado + time.perf_counter() - inicio, stage=etapa.nombre)
+            # El último hilo de la etapa avisa a la siguiente
+            with vivos["lock"]:
+                vivos["n"] -= 1
+                ultimo = vivos["n"] == 0
+            if ultimo:
+                siguientes = etapas[i + 1].hilos if i + 1 < len(etapas) else 1
+                for _ in range(siguientes):
+                    poner(salida, _FIN)
+        except _Parada:
+            pass
+
+    hilos = [threading.Thread(target=alimentar, name="tuberia-fuente", daemon=True)]
+    for i, etapa in enumerate(etapas):
+        vivos = {"n": etapa.hilos, "lock": threading.Lock()}
+        hilos += [
+            threading.Thread(target=trabajar, args=(i, etapa, vivos), name=f"tuberia-{etapa.nombre}-{j}", daemon=True)
+            for j in range(etapa.hilos)
+        ]
+    for h in hilos:
+        h.start()
+    for i, etapa in enumerate(etapas):
+        _profundidad.funcion(colas[i].qsize, stage=etapa.nombre)
+
+    try:
+        while True:
+            try:
+                elemento = sacar(colas[-1])
+            except _Parada:
+                return
+            if elemento is _FIN:
+                return
+            yield elemento
+    finally:
+        # Si el consumidor corta (break, Ctrl-C...) se paran todas las etapas
+        parar.set()
+        for etapa in etapas:
+            _profundidad.quitar(stage=etapa.nombre)
@@ -1,9 +1,19 @@
 import React, { useEffect, useState, useRef } from 'react';
-import { RefreshCw, Search, Edit, Check, XCircle, ChevronLeft, RotateCcw, Upload, Image } from 'lucide-react';
+import { RefreshCw, Search, Edit, Check, XCircle, ChevronLeft, RotateCcw, Upload, Image, Layers } from 'lucide-react';
+
+// Pistas por página y columnas que necesitan el grid y la lista
+const PAGE_SIZE = 200;
+const LIST_FIELDS = 'title,artist,album,tracknumber,genre,date';
 
 function App() {
   const [flacs, setFlacs] = useState([]);
+  const [totalFlacs, setTotalFlacs] = useState(0);
+  const [page, setPage] = useState(1);
   const [selected, setSelected] = useState(null);
+  // Número de cambio del primer listado: desde ahí se siguen los cambios en vivo
+  const [liveSince, setLiveSince] = useState(null);
+  const searchTermRef = useRef('');
+  const fetchFlacsRef = useRef(null);
   const [viewType, setViewType] = useState('grid');
   const [searchTerm, setSearchTerm] = useState('');
   const [sortBy, setSortBy] = useState('default');
@@ -42,57 +52,28 @@ function App() {
     searchCoversWeb(selected.artist, selected.album);
   };
 
-  // Función para buscar portadas en MusicBrainz
+  // Función para buscar portadas en MusicBrainz (a través del backend, que
+  // cachea las búsquedas y las portadas para todas las pestañas)
   const searchCoversMusicBrainz = async (artist, album) => {
-    const userAgent = "EchoMiniNormalizer/1.0 ( your-email@example.com )";
-    
     try {
-      // Primero buscar el álbum en MusicBrainz
-      const searchUrl = `https://musicbrainz.org/ws/2/release?query=${encodeURIComponent(`artist:${artist} AND release:${album}`)}&fmt=json&limit=5`;
-      const response = await fetch(searchUrl, {
-        headers: {
-          'User-Agent': userAgent,
-          'Accept': 'application/json'
-        }
-      });
-      
+      const params = new URLSearchParams({ limit: '5' });
+      if (artist) params.set('artist', artist);
+      if (album) params.set('album', album);
+      const response = await fetch(`http://localhost:8000/api/lookup/covers?${params}`);
+
       if (!response.ok) {
         throw new Error(`MusicBrainz API error: ${response.status}`);
       }
-      
+
+      // Solo vienen las releases que tienen portada, con URLs del backend
       const data = await response.json();
-      
-      // Extraer los IDs de release para buscar portadas
-      const releaseIds = data.releases.map(release => release.id);
-      
-      // Para cada release, buscar su portada en CoverArtArchive
-      const coverPromises = releaseIds.map(async (id) => {
-        try {
-          const coverUrl = `https://coverartarchive.org/release/${id}`;
-          const coverResponse = await fetch(coverUrl, {
-            headers: { 'User-Agent': userAgent }
-          });
-          
-          if (!coverResponse.ok) return null;
-          
-          const coverData = await coverResponse.json();
-          
-          // Retornar solo la URL de la imagen frontal
-          const frontImage = coverData.images.find(img => img.front) || coverData.images[0];
-          return frontImage ? {
-            url: frontImage.image,
-            thumbnailUrl: frontImage.thumbnails.small,
-            source: 'MusicBrainz',
-            id: id
-          } : null;
-        } catch (error) {
-          return null;
-        }
-      });
-      
-      // Esperar a que todas las búsquedas de imágenes se completen y filtrar los nulos
-      const covers = (await Promise.all(coverPromises)).filter(cover => cover !== null);
-      
+      const covers = data.map(cover => ({
+        url: `http://localhost:8000${cover.url}`,
+        thumbnailUrl: `http://localhost:8000${cover.thumbnailUrl}`,
+        source: cover.source,
+        id: cover.id
+      }));
+
       setCoverSearchResults(prev => ({
         ...prev,
         musicbrainz: covers
@@ -229,6 +210,12 @@ const selectTrack = (track) => {
   
   // Set the selected track
   setSelected(track);
+
+  // El listado solo trae las columnas del grid: pedir el registro completo
+  fetch(`http://localhost:8000/api/flacs/${encodeURIComponent(track.filename)}`)
+    .then(r => r.json())
+    .then(data => setSelected(prev => (prev?.filename === data.filename ? data : prev)))
+    .catch(console.error);
 };
 
   // Fondo Vanta.js fijo
@@ -248,13 +235,68 @@ const selectTrack = (track) => {
     }
   }, []);
 
-  // Carga FLACs
-  useEffect(() => {
-    fetch('http://localhost:8000/api/flacs')
-      .then(r => r.json())
-      .then(setFlacs)
+  // Carga FLACs: búsqueda, orden y paginación se resuelven en el servidor
+  const fetchFlacs = (pageToLoad) => {
+    const params = new URLSearchParams({
+      sort: sortBy,
+      page: pageToLoad,
+      limit: PAGE_SIZE,
+      fields: LIST_FIELDS
+    });
+    if (searchTerm) params.set('q', searchTerm);
+    return fetch(`http://localhost:8000/api/flacs?${params}`)
+      .then(r => {
+        setTotalFlacs(Number(r.headers.get('X-Total-Count')) || 0);
+        const seq = r.headers.get('X-Change-Seq');
+        if (seq !== null) setLiveSince(prev => prev ?? Number(seq));
+        return r.json();
+      })
+      .then(data => {
+        setFlacs(prev => (pageToLoad === 1 ? data : [...prev, ...data]));
+        setPage(pageToLoad);
+      })
       .catch(console.error);
-  }, []);
+  };
+  fetchFlacsRef.current = fetchFlacs;
+
+  useEffect(() => {
+    searchTermRef.current = searchTerm;
+    const timer = setTimeout(() => fetchFlacs(1), 300);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [searchTerm, sortBy]);
+
+  // Cambios en vivo (también los hechos fuera de la web, p.ej. por los scripts):
+  // se aplican sobre lo ya cargado en vez de volver a pedir la biblioteca
+  useEffect(() => {
+    if (liveSince === null) return;
+    const params = new URLSearchParams({ since: liveSince, fields: LIST_FIELDS });
+    const source = new EventSource(`http://localhost:8000/api/flacs/events?${params}`);
+    source.addEventListener('change', e => {
+      const { type, filename, record } = JSON.parse(e.data);
+      if (type === 'removed') {
+        setFlacs(prev => {
+          const next = prev.filter(f => f.filename !== filename);
+          if (next.length !== prev.length) setTotalFlacs(t => Math.max(0, t - 1));
+          return next;
+        });
+      } else {
+        setFlacs(prev => {
+          if (prev.some(f => f.filename === filename)) {
+            return prev.map(f => (f.filename === filename ? { ...f, ...record } : f));
+          }
+          // Pista nueva: cuenta en el total (sin filtro); se verá al cargar más o al reordenar
+          if (type === 'added' && !searchTermRef.current) setTotalFlacs(t => t + 1);
+          return prev;
+        });
+        setSelected(prev => (prev?.filename === filename ? { ...prev, ...record } : prev));
+      }
+    });
+    // El servidor ya no tiene cambios tan antiguos: recargar el listado
+    source.addEventListener('reset', () => fetchFlacsRef.current(1));
+    return () => source.close();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [liveSince]);
 
   // Toggle edit mode for a field
   const toggleEdit = (field) => {
@@ -291,33 +333,16 @@ const selectTrack = (track) => {
 
   // Function to get genre information for a selected result
 const fetchGenreInfo = async (mbid) => {
-  const userAgent = "EchoMiniNormalizer/1.0 ( your-email@example.com )";
-  
   try {
-    // Get recording details with genre tags
-    const url = `https://musicbrainz.org/ws/2/recording/${mbid}?inc=genres&fmt=json`;
-    const response = await fetch(url, {
-      headers: {
-        'User-Agent': userAgent,
-        'Accept': 'application/json'
-      }
-    });
-    
+    // Through the backend: shared cache and a single rate limit for MusicBrainz
+    const response = await fetch(`http://localhost:8000/api/lookup/recordings/${mbid}/genre`);
+
     if (!response.ok) {
       throw new Error(`MusicBrainz API error: ${response.status}`);
     }
-    
+
     const data = await response.json();
-    
-    // Extract genre from tags
-    let genre = '';
-    if (data.genres && data.genres.length > 0) {
-      // Sort genres by count and take the highest
-      const sortedGenres = [...data.genres].sort((a, b) => b.count - a.count);
-      genre = sortedGenres[0].name;
-    }
-    
-    return genre;
+    return data.genre || '';
   } catch (error) {
     console.error("Error fetching genre info:", error);
     return '';
@@ -328,47 +353,16 @@ const fetchGenreInfo = async (mbid) => {
 
 // Function to search MusicBrainz API
 const searchMusicBrainz = async (query) => {
-  // MusicBrainz requires a user-agent
-  const userAgent = "EchoMiniNormalizer/1.0 ( your-email@example.com )";
-  
   try {
-    // First search for recordings matching the query
-    const searchUrl = `https://musicbrainz.org/ws/2/recording?query=${encodeURIComponent(query)}&fmt=json&limit=10`;
-    const response = await fetch(searchUrl, {
-      headers: {
-        'User-Agent': userAgent,
-        'Accept': 'application/json'
-      }
-    });
-    
+    // The backend returns the results already in our application's format
+    const params = new URLSearchParams({ q: query, limit: '10' });
+    const response = await fetch(`http://localhost:8000/api/lookup/recordings?${params}`);
+
     if (!response.ok) {
       throw new Error(`MusicBrainz API error: ${response.status}`);
     }
-    
-    const data = await response.json();
-    
-    // Transform the results to match our application's format
-    const results = data.recordings.map(recording => {
-      // Extract artist from artist-credit
-      const artist = recording['artist-credit']?.map(credit => credit.name || credit.artist?.name).join('') || '';
-      
-      // Extract album from the first release
-      const album = recording.releases?.[0]?.title || '';
-      const date = recording.releases?.[0]?.year?.split('-')[0] || '';
-      const tracknumber = recording.releases?.[0]?.['track-count'] || '';
-      
-      return {
-        id: recording.id,
-        title: recording.title || '',
-        artist: artist,
-        album: album,
-        date: date,
-        tracknumber: tracknumber,
-        genre: '' // MusicBrainz doesn't return genre in basic recording search
-      };
-    });
-    
-    return results;
+
+    return await response.json();
   } catch (error) {
     console.error("Error searching MusicBrainz:", error);
     return [];
@@ -415,6 +409,47 @@ const saveField = (field) => {
   }
 };
 
+// Save edited field in every track of the selected album with one batch request
+const saveFieldForAlbum = async (field) => {
+  if (!selected || editedValues[field] === undefined || !selected.album) return;
+
+  try {
+    const params = new URLSearchParams({ q: selected.album, fields: 'album,artist' });
+    const candidates = await fetch(`http://localhost:8000/api/flacs?${params}`).then(r => r.json());
+    const albumTracks = candidates.filter(
+      t => t.album === selected.album && (!selected.artist || t.artist === selected.artist)
+    );
+
+    const response = await fetch('http://localhost:8000/api/flacs/batch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(albumTracks.map(t => ({
+        filename: t.filename,
+        metadata: { [field]: editedValues[field] }
+      }))),
+    });
+    if (!response.ok) {
+      throw new Error('Error al guardar los cambios del álbum');
+    }
+    const { records } = await response.json();
+
+    // Actualizar el estado local con los registros devueltos, sin recargar la biblioteca
+    const byName = Object.fromEntries(records.map(r => [r.filename, r]));
+    setFlacs(prev => prev.map(f => (byName[f.filename] ? { ...f, ...byName[f.filename] } : f)));
+    if (byName[selected.filename]) setSelected(byName[selected.filename]);
+    setEditedValues(prev => {
+      const newValues = {...prev};
+      delete newValues[field];
+      return newValues;
+    });
+    toggleEdit(field);
+  } catch (error) {
+    console.error('Error:', error);
+  }
+};
+
   // Cancel editing
   const cancelEdit = (field) => {
     toggleEdit(field);
@@ -506,28 +541,8 @@ const handleManualSearch = () => {
     { key: 'lyrics', label: 'Letra' }
   ];
 
-  // Filtrado
-  const filtered = flacs.filter(f => {
-    const term = searchTerm.toLowerCase();
-    return (
-      f.filename?.toLowerCase().includes(term) ||
-      f.title?.toLowerCase().includes(term) ||
-      f.artist?.toLowerCase().includes(term) ||
-      f.album?.toLowerCase().includes(term)
-    );
-  });
-
-  // Ordenado
-  const sorted = [...filtered].sort((a, b) => {
-    switch (sortBy) {
-      case 'album':    return (a.album || '').localeCompare(b.album || '');
-      case 'artist':   return (a.artist || '').localeCompare(b.artist || '');
-      case 'title':    return (a.title || '').localeCompare(b.title || '');
-      case 'date':     return (a.date || '').localeCompare(b.date || '');
-      case 'genre':    return (a.genre || '').localeCompare(b.genre || '');
-      default:         return 0;
-    }
-  });
+  // Filtrado y ordenado ya vienen del servidor
+  const sorted = flacs;
 
   // Renderizar un campo de metadatos editable
   const renderMetadataField = (field, label) => {
@@ -558,6 +573,13 @@ const handleManualSearch = () => {
               >
                 <Check size={16} />
               </button>
+              <button 
+                onClick={() => saveFieldForAlbum(field)}
+                className="p-1 text-green-600 hover:text-green-800"
+                title="Guardar en todo el álbum"
+              >
+                <Layers size={16} />
+              </button>
               <button 
                 onClick={() => cancelEdit(field)}
                 className="p-1 text-red-600 hover:text-red-800"
@@ -688,7 +710,7 @@ const handleManualSearch = () => {
                   >
                     <div className="w-full" style={{ paddingBottom: '100%', position: 'relative' }}>
                       <img
-                        src={`http://localhost:8000/api/cover/${encodeURIComponent(f.filename)}`}
+                        src={`http://localhost:8000/api/cover/${encodeURIComponent(f.filename)}?size=300`}
                         alt="Portada"
                         className="absolute inset-0 w-full h-full object-cover"
                       />
@@ -711,7 +733,7 @@ const handleManualSearch = () => {
                     className={`cursor-pointer p-3 bg-white rounded-lg shadow hover:bg-gray-100 transition flex items-center ${selected?.filename === f.filename ? 'bg-blue-100' : ''}`}
                   >
                     <img
-                      src={`http://localhost:8000/api/cover/${encodeURIComponent(f.filename)}`}
+                      src={`http://localhost:8000/api/cover/${encodeURIComponent(f.filename)}?size=100`}
                       alt="Portada"
                       className="w-12 h-12 object-cover rounded mr-4 flex-shrink-0"
                     />
@@ -728,6 +750,16 @@ const handleManualSearch = () => {
                 ))}
               </ul>
             )}
+            {flacs.length < totalFlacs && (
+              <div className="flex justify-center mt-6">
+                <button
+                  onClick={() => fetchFlacs(page + 1)}
+                  className="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600"
+                >
+                  Cargar más ({flacs.length} de {totalFlacs})
+                </button>
+              </div>
+            )}
           </main>
 
           {/* Sidebar metadatos scrollable */}